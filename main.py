@@ -1,14 +1,61 @@
 from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from src.webhook.routes import router as webhook_router
-from src.notifications.admin import router as notification_router
+from src.webhook.routes import (
+    router as webhook_router,
+    drain_deferred_analyses,
+    analysis_jobs,
+    batch_rate_limit
+)
+from src.notifications.admin import (
+    router as notification_router,
+    notification_store,
+    notification_queue,
+    alert_dispatcher,
+    verify_admin_auth
+)
 from src.common.config import Settings
+from src.common.constants import RATE_LIMITS, RATE_LIMIT_PERIODS
+from src.common.metrics import registry as metrics_registry
+from src.common.ratelimit import RateLimit, RateLimitMiddleware
+from src.common.shared_state import shared_state
+from src.common.stats import register_stats_provider
+from typing import Optional
+from src.llm.client import start_llm_client, close_llm_client
+from contextlib import asynccontextmanager
+import time
 import uvicorn
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared LLM connection pool on startup and close it on shutdown
+    await start_llm_client()
+    # Open the notification repository (loads the JSON store into memory once)
+    await notification_store.start()
+    # Persist notifications in the background; shutdown drains the queue first
+    if settings.NOTIFICATION_WRITE_BEHIND:
+        await notification_queue.start()
+    # Deliver alerts to the configured channels in the background
+    await alert_dispatcher.start()
+    # Workers for webhooks submitted with mode=async
+    await analysis_jobs.start()
+    yield
+    await analysis_jobs.close()
+    # Let analyses answered with a provisional score record their final verdict
+    await drain_deferred_analyses(timeout=settings.LLM_TOTAL_TIMEOUT)
+    # Send pending digests and queued alerts
+    await alert_dispatcher.close()
+    await notification_queue.close()
+    await notification_store.close()
+    await close_llm_client()
+    if shared_state is not None:
+        shared_state.close()
+
 app = FastAPI(
     title="Transaction Risk Analysis API",
     description="API for analyzing transaction risks using LLM and notifying administrators",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Load settings
@@ -16,6 +63,46 @@ settings = Settings()
 
 # Add security
 security = HTTPBasic()
+optional_security = HTTPBasic(auto_error=False)
+
+# Token buckets per credential and client IP, checked before routing; shared by
+# all workers when there are several
+rate_limits = [
+    RateLimit(
+        "webhook",
+        ["/api/webhook"],
+        RATE_LIMITS["WEBHOOK"],
+        RATE_LIMIT_PERIODS["WEBHOOK"],
+        ip_multiplier=settings.RATE_LIMIT_IP_MULTIPLIER,
+        max_keys=settings.RATE_LIMIT_MAX_KEYS,
+        shared=shared_state,
+        # Batches are charged per transaction by webhook_batch alone
+        exclude=["/api/webhook/batch"]
+    ),
+    batch_rate_limit,
+    RateLimit(
+        "admin_api",
+        ["/api/notifications", "/api/stats"],
+        RATE_LIMITS["ADMIN_API"],
+        RATE_LIMIT_PERIODS["ADMIN_API"],
+        ip_multiplier=settings.RATE_LIMIT_IP_MULTIPLIER,
+        max_keys=settings.RATE_LIMIT_MAX_KEYS,
+        shared=shared_state
+    )
+]
+register_stats_provider(
+    "rate_limits",
+    lambda: {key: value for limit in rate_limits for key, value in limit.stats().items()}
+)
+if shared_state is not None:
+    register_stats_provider("shared_state", shared_state.stats)
+if settings.RATE_LIMIT_ENABLED:
+    # Shared buckets are compared across processes, so they need epoch time
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits=rate_limits,
+        clock=time.monotonic if shared_state is None else time.time
+    )
 
 # Include routers
 app.include_router(webhook_router, prefix="/api", tags=["webhook"])
@@ -25,10 +112,25 @@ app.include_router(notification_router, prefix="/api", tags=["notifications"])
 async def root():
     return {"message": "Transaction Risk Analysis API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(credentials: Optional[HTTPBasicCredentials] = Depends(optional_security)) -> PlainTextResponse:
+    """Prometheus metrics: webhook stage latencies, LLM outcomes, risk scores and runtime stats."""
+    if settings.METRICS_REQUIRE_AUTH and (credentials is None or not verify_admin_auth(credentials)):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
+    # With SERVER_WORKERS > 1 each worker imports main:app with this environment,
+    # so every process reads the same settings and turns on shared state
+    workers = max(1, settings.SERVER_WORKERS)
     uvicorn.run(
         "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
\ No newline at end of file
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        reload=settings.SERVER_RELOAD and workers == 1
+    )
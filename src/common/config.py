@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # API Configuration
@@ -18,11 +18,157 @@ class Settings(BaseSettings):
     LLM_TEMPERATURE: float = 0.0
     LLM_MAX_TOKENS: int = 500
     
-    # Risk Analysis
-    HIGH_RISK_COUNTRIES: List[str] = ["RU", "IR", "KP", "VE", "MM"]
+    # LLM HTTP Client (timeouts in seconds)
+    LLM_CONNECT_TIMEOUT: float = 2.0
+    LLM_READ_TIMEOUT: float = 10.0
+    LLM_TOTAL_TIMEOUT: float = 15.0
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    
+    # LLM Resilience: circuit breaker, budgeted retries and hedged requests
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_BREAKER_SLOW_CALL_MS: float = 8000.0  # Completed calls slower than this count as failures
+    LLM_RETRY_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_DELAY_MS: float = 100.0
+    LLM_RETRY_MAX_DELAY_MS: float = 2000.0
+    LLM_RETRY_BUDGET_RATIO: float = 0.2  # Retries allowed per call once the minimum is spent
+    LLM_RETRY_BUDGET_MIN: int = 10
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_MIN_DELAY_MS: float = 50.0
+    
+    # LLM Admission Control: at most LLM_MAX_IN_FLIGHT calls run at once and up to
+    # LLM_ADMISSION_QUEUE_SIZE more wait LLM_ADMISSION_WAIT_MS for a slot. Calls beyond
+    # that are shed: degrade answers with the base score, reject returns 503
+    LLM_ADMISSION_ENABLED: bool = True
+    LLM_MAX_IN_FLIGHT: int = 64
+    LLM_ADMISSION_QUEUE_SIZE: int = 128
+    LLM_ADMISSION_WAIT_MS: float = 250.0
+    LLM_SHED_MODE: str = "degrade"
+    
+    # LLM Prompt Encoding: full (transaction JSON) or compact (short keys, derived features)
+    LLM_PROMPT_ENCODING: str = "full"
+    
+    # LLM Streaming: stream single-transaction completions and decide as soon as
+    # the risk score and action arrive, before the reasoning has finished
+    LLM_STREAMING_ENABLED: bool = False
+    
+    # LLM Transport: live, record (save responses to the cassette) or replay (serve them offline)
+    LLM_TRANSPORT_MODE: str = "live"
+    LLM_CASSETTE_PATH: str = "llm_cassette.json"
+    LLM_REPLAY_LATENCY_MS: float = 0.0
+    LLM_REPLAY_JITTER_MS: float = 0.0
+    LLM_REPLAY_ERROR_RATE: float = 0.0  # Fraction of replayed calls answered with a 503
+    LLM_REPLAY_RATE_LIMIT_RATE: float = 0.0  # Fraction of replayed calls answered with a 429
+    LLM_REPLAY_RETRY_AFTER_SECONDS: float = 1.0
+    LLM_REPLAY_SEED: Optional[int] = None
+    
+    # LLM Micro-batching
+    LLM_BATCHING_ENABLED: bool = False
+    LLM_BATCH_MAX_SIZE: int = 20
+    LLM_BATCH_MAX_WAIT_MS: float = 50.0
+    LLM_BATCH_MAX_TOKENS: int = 8000
+    
+    # Verdict Cache (TTL and size come from CACHE_SETTINGS)
+    VERDICT_CACHE_ENABLED: bool = True
+    
+    # Batch Ingestion
+    WEBHOOK_BATCH_MAX_SIZE: int = 5000
+    BATCH_ANALYSIS_CONCURRENCY: int = 20
+    
+    # Webhook Deadline: answer with a provisional rule score if the LLM is not done in time
+    WEBHOOK_DEADLINE_ENABLED: bool = False
+    WEBHOOK_DEADLINE_MS: float = 300.0
+    ANALYSIS_RESULTS_MAX_SIZE: int = 10000
+    ANALYSIS_RESULTS_TTL_SECONDS: float = 3600.0
+    
+    # Async Analysis Jobs: POST /webhook?mode=async answers 202 and workers analyze in the background
+    WEBHOOK_DEFAULT_MODE: str = "sync"
+    ANALYSIS_QUEUE_MAX_SIZE: int = 10000
+    ANALYSIS_WORKERS: int = 8
+    ANALYSIS_CALLBACK_TIMEOUT: float = 5.0
+    ANALYSIS_CALLBACK_ALLOWED_HOSTS: List[str] = []  # Empty allows hosts resolving only to public addresses
+    
+    # Webhook Idempotency: repeated deliveries of a transaction_id get the original response
+    WEBHOOK_IDEMPOTENCY_ENABLED: bool = True
+    WEBHOOK_IDEMPOTENCY_MAX_SIZE: int = 100000
+    WEBHOOK_IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    
+    # Notification Storage: "json" (notifications.json) or "sqlite"
+    NOTIFICATION_BACKEND: str = "json"
+    NOTIFICATION_DB_PATH: str = "notifications.db"
+    NOTIFICATION_MIGRATE_JSON: bool = True  # Import notifications.json into a new SQLite database
+    
+    # Notification Write-behind Queue
+    NOTIFICATION_WRITE_BEHIND: bool = True
+    NOTIFICATION_QUEUE_MAX_SIZE: int = 10000
+    NOTIFICATION_FLUSH_BATCH_SIZE: int = 500
+    NOTIFICATION_FLUSH_INTERVAL_MS: float = 20.0
+    
+    # Alert Delivery: each configured channel (SMTP, HTTP webhook, file) gets every
+    # notification from background tasks. ALERT_DIGEST_SECONDS > 0 folds the alerts
+    # of each interval into one message per channel
+    ALERT_DIGEST_SECONDS: float = 0.0
+    ALERT_QUEUE_MAX_SIZE: int = 1000  # Per channel; alerts beyond it are dropped
+    ALERT_MAX_ATTEMPTS: int = 3
+    ALERT_RETRY_BASE_DELAY_MS: float = 500.0
+    ALERT_TIMEOUT: float = 10.0
+    ALERT_SMTP_HOST: Optional[str] = None
+    ALERT_SMTP_PORT: int = 25
+    ALERT_SMTP_STARTTLS: bool = False
+    ALERT_SMTP_USERNAME: Optional[str] = None
+    ALERT_SMTP_PASSWORD: Optional[str] = None
+    ALERT_SMTP_CONCURRENCY: int = 2
+    ALERT_EMAIL_FROM: str = "risk-alerts@localhost"
+    ALERT_EMAIL_TO: List[str] = []
+    ALERT_WEBHOOK_URL: Optional[str] = None
+    ALERT_WEBHOOK_FORMAT: str = "slack"  # slack (Block Kit message) or json (notification fields)
+    ALERT_WEBHOOK_CONCURRENCY: int = 4
+    ALERT_FILE_PATH: Optional[str] = None  # One JSON line per message
+    
+    # Risk Analysis (countries, amount tiers and weights live in the risk rules file)
+    RISK_RULES_PATH: str = "risk_rules.json"
+    RISK_RULES_RELOAD_SECONDS: float = 2.0
+    HIGH_RISK_COUNTRIES: Optional[List[str]] = None  # Deprecated: overrides high_risk_countries in the rule file
     HIGH_RISK_THRESHOLD: float = 0.7
     REVIEW_THRESHOLD: float = 0.3
     
+    # Tiered Scoring: rule scores below REVIEW_THRESHOLD - TIER_LOW_MARGIN or at or
+    # above HIGH_RISK_THRESHOLD + TIER_HIGH_MARGIN are decided without the LLM
+    TIERED_SCORING_ENABLED: bool = True
+    TIER_LOW_MARGIN: float = 0.1
+    TIER_HIGH_MARGIN: float = 0.1
+    
+    # Velocity Tracking (window and limit come from TIME_RISK_FACTORS)
+    VELOCITY_TRACKING_ENABLED: bool = True
+    VELOCITY_BUCKET_SECONDS: int = 60
+    VELOCITY_MAX_KEYS: int = 100000
+    
+    # Rate Limiting (limits come from RATE_LIMITS); each client IP may send
+    # RATE_LIMIT_IP_MULTIPLIER times the per-credential limit
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_IP_MULTIPLIER: float = 5.0
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    
+    # Server (python main.py): SERVER_WORKERS > 1 starts that many worker processes and
+    # turns on shared state; SERVER_RELOAD only applies to a single worker
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    SERVER_RELOAD: bool = True
+    
+    # Shared State: verdict cache, velocity, rate limits, webhook idempotency and analysis
+    # results in a local SQLite database used by every worker process
+    SHARED_STATE_ENABLED: bool = False  # Always on when SERVER_WORKERS > 1
+    SHARED_STATE_PATH: str = "shared_state.db"
+    SHARED_STATE_BUSY_TIMEOUT_MS: float = 50.0  # Longest a request waits for the database lock; writes then fail open
+    
+    # Prometheus Metrics (GET /metrics)
+    METRICS_REQUIRE_AUTH: bool = True  # Admin Basic Auth, as supported by Prometheus scrape configs
+    
     model_config = {
         "env_file": ".env",
         "case_sensitive": True,
@@ -20,6 +20,9 @@ AMOUNT_THRESHOLDS = {
     "VERY_HIGH": 10000.00
 }
 
+# Amount bucket boundaries used to group transactions with similar risk (in USD)
+AMOUNT_BUCKETS = [100.00, 250.00, 500.00, 1000.00, 2500.00, 5000.00, 10000.00]
+
 # Time-based risk factors
 TIME_RISK_FACTORS = {
     "UNUSUAL_HOURS": (22, 5),  # 10 PM to 5 AM considered unusual
@@ -47,6 +50,14 @@ MERCHANT_CATEGORY_RISK = {
     "groceries": 0.1
 }
 
+# Weights applied to the payment method and merchant category risk tables
+# when computing the deterministic rule score
+RULE_TABLE_WEIGHTS = {
+    "PAYMENT_METHOD": 0.2,
+    "MERCHANT_CATEGORY": 0.2,
+    "UNKNOWN_RISK": 0.5  # Risk assumed for payment methods/categories not listed above
+}
+
 # HTTP Response Messages
 HTTP_MESSAGES = {
     "SUCCESS": "Transaction processed successfully",
@@ -73,8 +84,14 @@ NOTIFICATION_STATUS = {
 # API Rate Limits
 RATE_LIMITS = {
     "WEBHOOK": 100,  # requests per minute
+    "WEBHOOK_BATCH": 10000,  # batched transactions per minute
     "ADMIN_API": 1000  # requests per hour
 }
+RATE_LIMIT_PERIODS = {
+    "WEBHOOK": 60,  # seconds
+    "WEBHOOK_BATCH": 60,  # seconds
+    "ADMIN_API": 3600  # seconds
+}
 
 # Cache Settings
 CACHE_SETTINGS = {
@@ -0,0 +1,245 @@
+from src.common.stats import collect_stats
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Tuple
+import bisect
+import math
+import re
+import time
+
+NAMESPACE = "risk"
+
+# Seconds; from 100us decode/scoring steps to multi-second LLM calls
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Timer:
+    __slots__ = ("child", "started")
+    
+    def __init__(self, child: "_HistogramChild"):
+        self.child = child
+    
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.child.observe(time.perf_counter() - self.started)
+
+class _CounterChild:
+    __slots__ = ("value",)
+    
+    def __init__(self):
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float) -> None:
+        # Buckets are inclusive upper bounds; the last slot is +Inf
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def time(self) -> _Timer:
+        """Context manager observing the elapsed seconds of its block."""
+        return _Timer(self)
+
+class _Metric(ABC):
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+    
+    @abstractmethod
+    def _new_child(self):
+        """Return the value holder for one set of label values."""
+    
+    def labels(self, *values: str):
+        """Return the child for a set of label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+    
+    def clear(self) -> None:
+        """Drop all recorded values."""
+        self._children.clear()
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+    
+    @abstractmethod
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        """Return the exposition lines of one child."""
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by labels."""
+    
+    kind = "counter"
+    
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+    
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+    
+    def _render_child(self, values: Tuple[str, ...], child: _CounterChild) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram, optionally split by labels."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+    
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+    
+    def observe(self, value: float) -> None:
+        """Observe a value on the unlabelled histogram."""
+        self.labels().observe(value)
+    
+    def _render_child(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text exposition format."""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def clear(self) -> None:
+        """Drop all recorded values."""
+        for metric in self._metrics.values():
+            metric.clear()
+    
+    def render(self) -> str:
+        """Render every metric, then the numeric runtime stats as gauges."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        lines.extend(render_stats_gauges())
+        return "\n".join(lines) + "\n"
+
+def _metric_name(*parts: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join((NAMESPACE, "stats") + parts))
+
+def render_stats_gauges() -> List[str]:
+    """Render the numeric counters of the stats registry (/api/stats) as gauges."""
+    lines = []
+    for provider, values in collect_stats().items():
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)) or (isinstance(value, float) and math.isnan(value)):
+                continue
+            name = _metric_name(provider, key)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+registry = MetricsRegistry()
+
+# Webhook pipeline metrics
+stage_seconds = registry.histogram(
+    "webhook_stage_duration_seconds",
+    "Time spent in each stage of the webhook pipeline.",
+    labelnames=("stage",)
+)
+llm_responses = registry.counter(
+    "llm_responses_total",
+    "LLM HTTP attempts by outcome: the status code, timeout or error.",
+    labelnames=("status",)
+)
+llm_parse_failures = registry.counter(
+    "llm_parse_failures_total",
+    "LLM responses that could not be parsed into a verdict."
+)
+analysis_fallbacks = registry.counter(
+    "analysis_fallbacks_total",
+    "Analyses answered with the base score because the LLM failed."
+)
+rate_limited = registry.counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429 by each rate limit.",
+    labelnames=("limit",)
+)
+risk_scores = registry.histogram(
+    "analysis_risk_score",
+    "Distribution of risk scores by the tier that decided them.",
+    labelnames=("source",),
+    buckets=SCORE_BUCKETS
+)
+
+def stage_timer(stage: str) -> _Timer:
+    """Time a webhook pipeline stage: with stage_timer("auth"): ..."""
+    return stage_seconds.labels(stage).time()
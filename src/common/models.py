@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Optional, Any
 from datetime import datetime
 
 class BaseModelWithConfig(BaseModel):
@@ -33,11 +33,33 @@ class Transaction(BaseModelWithConfig):
     payment_method: PaymentMethod
     merchant: Merchant
 
+class VelocitySnapshot(BaseModelWithConfig):
+    window_minutes: int
+    customer_count: int
+    customer_amount: float
+    card_count: int
+    card_amount: float
+    ip_count: int
+    ip_amount: float
+
 class RiskAnalysis(BaseModelWithConfig):
     risk_score: float = Field(..., ge=0.0, le=1.0)
     risk_factors: List[str]
     reasoning: str
     recommended_action: str = Field(default="review", pattern=r'^(allow|review|block)$')
+    degraded: bool = False  # Base score used because the LLM was overloaded or unavailable
+
+class AnalysisResult(BaseModelWithConfig):
+    transaction_id: str
+    job_id: Optional[str] = None
+    status: str = Field(..., pattern=r'^(queued|processing|provisional|final|failed)$')
+    risk_score: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    risk_factors: List[str] = []
+    reasoning: Optional[str] = None
+    recommended_action: Optional[str] = None
+    degraded: bool = False
+    error: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class AdminNotification(BaseModelWithConfig):
     alert_type: str = "high_risk_transaction"
@@ -53,4 +75,33 @@ class AdminNotification(BaseModelWithConfig):
     class Config:
         json_encoders = {
             datetime: lambda dt: dt.isoformat()
-        }
\ No newline at end of file
+        }
+
+class BatchItemResult(BaseModelWithConfig):
+    index: int
+    transaction_id: str
+    risk_score: float
+    recommended_action: str
+    degraded: bool = False
+
+class BatchItemError(BaseModelWithConfig):
+    index: int
+    transaction_id: Optional[str] = None
+    detail: Any
+
+class BatchWebhookResponse(BaseModelWithConfig):
+    status: str  # success, partial, failed
+    processed: int
+    failed: int
+    results: List[BatchItemResult]
+    errors: List[BatchItemError]
+
+
+class NotificationQuery(BaseModelWithConfig):
+    status: Optional[str] = None
+    since: Optional[datetime] = None  # inclusive
+    until: Optional[datetime] = None  # exclusive
+    min_risk_score: Optional[float] = None
+    max_risk_score: Optional[float] = None
+    customer_id: Optional[str] = None
+    merchant_id: Optional[str] = None
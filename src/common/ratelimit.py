@@ -0,0 +1,321 @@
+from src.common.metrics import rate_limited
+from src.common.shared_state import SharedState
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from collections import OrderedDict
+import hashlib
+import math
+import time
+
+class TokenBucketTable:
+    """
+    Token buckets of `limit` tokens refilled over `period` seconds, one per key.
+    
+    Each bucket is stored as a single float, the time at which it will be
+    full again (the virtual scheduling form of a token bucket), and refills
+    lazily when the key is next seen. Keys are kept in least-recently-used
+    order; buckets that have refilled completely are dropped, since a new
+    bucket is identical, and the oldest keys are evicted once max_keys is
+    reached.
+    
+    A request may cost several tokens; costs above limit take the whole
+    bucket, since more could never be available at once.
+    """
+    
+    def __init__(self, limit: int, period: float, max_keys: int = 100000):
+        self.limit = max(1, limit)
+        self.period = period
+        self.interval = period / self.limit
+        self.max_keys = max(1, max_keys)
+        self._full_at: "OrderedDict[Any, float]" = OrderedDict()
+        self.evictions = 0
+    
+    def cost(self, tokens: int) -> float:
+        """Return the seconds of refill that tokens stand for."""
+        return min(max(1, tokens), self.limit) * self.interval
+    
+    def acquire(self, key: Any, now: float, tokens: int = 1) -> float:
+        """
+        Take tokens from a key's bucket.
+        
+        Args:
+            key: Bucket key
+            now: Current monotonic time in seconds
+            tokens: Number of tokens to take
+        
+        Returns:
+            float: 0.0 if the tokens were taken, otherwise the seconds until they are available
+        """
+        cost = self.cost(tokens)
+        buckets = self._full_at
+        full_at = buckets.get(key)
+        if full_at is None:
+            # New (or refilled and dropped) bucket: always full
+            buckets[key] = now + cost
+            self._evict(now)
+            return 0.0
+        buckets.move_to_end(key)
+        if full_at < now:
+            full_at = now
+        # The bucket holds (period - (full_at - now)) / interval tokens
+        wait = full_at + cost - now - self.period
+        if wait > 0:
+            return wait
+        buckets[key] = full_at + cost
+        return 0.0
+    
+    def release(self, key: Any, tokens: int = 1) -> None:
+        """Give back tokens taken by acquire() for a request that was refused."""
+        full_at = self._full_at.get(key)
+        if full_at is not None:
+            self._full_at[key] = full_at - self.cost(tokens)
+    
+    def _evict(self, now: float) -> None:
+        # Runs when the table grows: drop buckets that have refilled, least
+        # recently used first
+        while self._full_at:
+            key, full_at = next(iter(self._full_at.items()))
+            if full_at > now and len(self._full_at) <= self.max_keys:
+                break
+            del self._full_at[key]
+            self.evictions += 1
+    
+    def __len__(self) -> int:
+        return len(self._full_at)
+    
+    def clear(self) -> None:
+        """Forget all buckets."""
+        self._full_at.clear()
+        self.evictions = 0
+
+BUCKET_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS token_buckets (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        full_at REAL NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_token_buckets_full_at ON token_buckets (full_at)"
+]
+
+# Takes a token unless the bucket is empty, in which case no row is returned
+TAKE_TOKEN_SQL = (
+    "INSERT INTO token_buckets (name, key, full_at) VALUES (?1, ?2, ?3 + ?4) "
+    "ON CONFLICT (name, key) DO UPDATE SET full_at = max(full_at, ?3) + ?4 "
+    "WHERE max(full_at, ?3) + ?4 - ?3 <= ?5 RETURNING full_at"
+)
+FULL_AT_SQL = "SELECT full_at FROM token_buckets WHERE name = ? AND key = ?"
+RELEASE_SQL = "UPDATE token_buckets SET full_at = full_at - ? WHERE name = ? AND key = ?"
+
+class SharedTokenBucketTable:
+    """
+    TokenBucketTable stored in SharedState, so every worker process draws
+    from the same buckets.
+    
+    Taking a token is a single upsert. Buckets that have refilled
+    completely are deleted in bulk every purge_every calls per process;
+    `now` must be epoch seconds. Requests are let through while the
+    database is locked past its busy timeout.
+    """
+    
+    def __init__(self, shared: SharedState, name: str, limit: int, period: float, purge_every: int = 1000):
+        shared.ensure_schema(BUCKET_SCHEMA)
+        self.shared = shared
+        self.name = name
+        self.limit = max(1, limit)
+        self.period = period
+        self.interval = period / self.limit
+        self.purge_every = max(1, purge_every)
+        self._calls = 0
+        self.evictions = 0
+    
+    def cost(self, tokens: int) -> float:
+        """Return the seconds of refill that tokens stand for."""
+        return min(max(1, tokens), self.limit) * self.interval
+    
+    def acquire(self, key: Any, now: float, tokens: int = 1) -> float:
+        """Take tokens from a key's bucket; see TokenBucketTable.acquire."""
+        key = str(key)
+        self._calls += 1
+        cost = self.cost(tokens)
+        with self.shared.fail_open():
+            conn = self.shared.connection()
+            if self._calls >= self.purge_every:
+                self._calls = 0
+                self.evictions += conn.execute(
+                    "DELETE FROM token_buckets WHERE name = ? AND full_at <= ?", (self.name, now)
+                ).rowcount
+            if conn.execute(TAKE_TOKEN_SQL, (self.name, key, now, cost, self.period)).fetchone():
+                return 0.0
+            # Refused, so the wait is positive even if the bucket changed since
+            row = conn.execute(FULL_AT_SQL, (self.name, key)).fetchone()
+            return max(row[0] + cost - now - self.period if row else 0.0, 0.001)
+        # Locked database: let the request through
+        return 0.0
+    
+    def release(self, key: Any, tokens: int = 1) -> None:
+        """Give back tokens taken by acquire(); see TokenBucketTable.release."""
+        with self.shared.fail_open():
+            self.shared.connection().execute(RELEASE_SQL, (self.cost(tokens), self.name, str(key)))
+    
+    def __len__(self) -> int:
+        with self.shared.fail_open():
+            return self.shared.connection().execute(
+                "SELECT COUNT(*) FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()[0]
+        return 0
+    
+    def clear(self) -> None:
+        """Forget all buckets."""
+        with self.shared.fail_open():
+            self.shared.connection().execute("DELETE FROM token_buckets WHERE name = ?", (self.name,))
+        self.evictions = 0
+
+def stable_credential_key(authorization: bytes) -> str:
+    """Digest of an Authorization header that is the same in every process."""
+    return hashlib.blake2b(authorization, digest_size=16).hexdigest()
+
+class RateLimit:
+    """
+    Rate limit for a group of API paths.
+    
+    Every request to a path under one of the prefixes takes a token from
+    its client IP's bucket and, if it carries an Authorization header, from
+    that credential's bucket. A request refused by either bucket spends
+    nothing, so a throttled credential does not use up the allowance of
+    other senders behind the same IP. Credentials are keyed by a hash of the whole
+    header, so a sender guessing a username cannot drain its owner's
+    bucket. The IP limit is a multiple of the credential limit so several
+    senders can share an egress address.
+    
+    Args:
+        name: Limit name, used in stats and metrics
+        prefixes: Path prefixes the limit applies to
+        exclude: Path prefixes under prefixes that the limit skips
+        limit: Requests per period and credential
+        period: Period in seconds
+        ip_multiplier: IP limit as a multiple of limit
+        max_keys: Maximum buckets kept per table
+        shared: Keep the buckets in SharedState instead of in process
+            (requests must then be checked with epoch time)
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        prefixes: Sequence[str],
+        limit: int,
+        period: float,
+        ip_multiplier: float = 1.0,
+        max_keys: int = 100000,
+        shared: Optional[SharedState] = None,
+        exclude: Sequence[str] = ()
+    ):
+        self.name = name
+        self.prefixes = tuple(prefix.rstrip("/") for prefix in prefixes)
+        self.exclude = tuple(prefix.rstrip("/") for prefix in exclude)
+        ip_limit = max(1, int(limit * ip_multiplier))
+        if shared is None:
+            self.credentials = TokenBucketTable(limit, period, max_keys)
+            self.ips = TokenBucketTable(ip_limit, period, max_keys)
+            self.credential_key: Callable[[bytes], Any] = hash
+        else:
+            self.credentials = SharedTokenBucketTable(shared, f"{name}:credential", limit, period)
+            self.ips = SharedTokenBucketTable(shared, f"{name}:ip", ip_limit, period)
+            # hash() of bytes differs between processes
+            self.credential_key = stable_credential_key
+        self.allowed = 0
+        self.limited = 0
+    
+    @staticmethod
+    def _under(path: str, prefixes: Sequence[str]) -> bool:
+        for prefix in prefixes:
+            if path.startswith(prefix) and (len(path) == len(prefix) or path[len(prefix)] == "/"):
+                return True
+        return False
+    
+    def matches(self, path: str) -> bool:
+        """Return True if the path is under one of the limit's prefixes and none of its exclusions."""
+        return self._under(path, self.prefixes) and not self._under(path, self.exclude)
+    
+    def check(self, client_ip: str, authorization: Optional[bytes], now: float, tokens: int = 1) -> float:
+        """
+        Take tokens for a request from its IP and credential buckets, or from neither.
+        
+        Returns:
+            float: 0.0 if the request may proceed, otherwise the seconds to wait
+        """
+        wait = self.ips.acquire(client_ip, now, tokens)
+        if not wait and authorization is not None:
+            wait = self.credentials.acquire(self.credential_key(authorization), now, tokens)
+            if wait:
+                # Taking then giving back keeps the shared buckets to one
+                # atomic statement each, where a check before taking would race
+                self.ips.release(client_ip, tokens)
+        if wait:
+            self.limited += 1
+            rate_limited.labels(self.name).inc()
+        else:
+            self.allowed += 1
+        return wait
+    
+    def clear(self) -> None:
+        """Reset all buckets and counters."""
+        self.credentials.clear()
+        self.ips.clear()
+        self.allowed = self.limited = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return request and bucket counters."""
+        return {
+            f"{self.name}_allowed": self.allowed,
+            f"{self.name}_limited": self.limited,
+            f"{self.name}_credential_buckets": len(self.credentials),
+            f"{self.name}_ip_buckets": len(self.ips),
+            f"{self.name}_evictions": self.credentials.evictions + self.ips.evictions
+        }
+
+def request_identity(scope: Scope) -> Tuple[str, Optional[bytes]]:
+    """Return the client IP and raw Authorization header of a request."""
+    client = scope.get("client")
+    authorization = None
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            authorization = value
+            break
+    return (client[0] if client else "unknown"), authorization
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing RateLimits before routing.
+    
+    Running ahead of FastAPI means limited requests never reach body
+    decoding, authentication or the LLM, and the webhook fast path is
+    covered too. Requests over a limit get 429 with Retry-After.
+    """
+    
+    def __init__(self, app: ASGIApp, limits: Sequence[RateLimit], clock: Callable[[], float] = time.monotonic):
+        self.app = app
+        self.limits = tuple(limits)
+        self.clock = clock
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            path = scope["path"]
+            for limit in self.limits:
+                if limit.matches(path):
+                    client_ip, authorization = request_identity(scope)
+                    wait = limit.check(client_ip, authorization, self.clock())
+                    if wait:
+                        response = JSONResponse(
+                            {"detail": "Rate limit exceeded"},
+                            status_code=429,
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
@@ -0,0 +1,222 @@
+from src.common.config import Settings
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+
+settings = Settings()
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_entries_expiry ON entries (namespace, expires_at)"
+]
+
+GET_SQL = "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?"
+SET_SQL = "INSERT OR REPLACE INTO entries (namespace, key, expires_at, value) VALUES (?, ?, ?, ?)"
+# Inserts, or takes over an expired entry; no row is returned if a live entry exists
+ADD_SQL = (
+    "INSERT INTO entries (namespace, key, expires_at, value) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (namespace, key) DO UPDATE SET expires_at = excluded.expires_at, value = excluded.value "
+    "WHERE entries.expires_at <= ? RETURNING 1"
+)
+RENEW_SQL = "UPDATE entries SET expires_at = ? WHERE namespace = ? AND key = ? AND value = ? AND expires_at > ?"
+DELETE_SQL = "DELETE FROM entries WHERE namespace = ? AND key = ?"
+PURGE_SQL = "DELETE FROM entries WHERE namespace = ? AND expires_at <= ?"
+TRIM_SQL = (
+    "DELETE FROM entries WHERE namespace = ? AND key IN "
+    "(SELECT key FROM entries WHERE namespace = ? ORDER BY expires_at LIMIT ?)"
+)
+COUNT_SQL = "SELECT COUNT(*) FROM entries WHERE namespace = ?"
+
+class SharedState:
+    """
+    State shared by the worker processes of one deployment, in a local
+    SQLite database.
+    
+    Each process opens its own connection on first use. The database runs
+    in WAL mode so reads never wait for writers, and every write is a single
+    short statement or transaction, so calls are made directly from the
+    event loop. A write waits at most busy_timeout_ms for another process
+    to release the database; past that it fails open (see fail_open): the
+    entry methods return a miss, skip the write or report the entry as
+    added, so a stuck writer delays requests by milliseconds, not seconds.
+    Durability is relaxed (synchronous=OFF): the contents are caches,
+    counters and recent responses that can be lost on a crash.
+    
+    Besides the expiring key-value entries provided here, components keep
+    their own tables in the same database (see ensure_schema).
+    
+    Times are epoch seconds from clock, which must agree across processes.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        clock: Callable[[], float] = time.time,
+        purge_every: int = 1000,
+        busy_timeout_ms: float = 50.0
+    ):
+        self.path = path
+        self.clock = clock
+        self.purge_every = max(1, purge_every)
+        self.busy_timeout_ms = max(0, int(busy_timeout_ms))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._schemas: List[Sequence[str]] = [SCHEMA]
+        self._writes: Dict[str, int] = {}
+        self._max_sizes: Dict[str, int] = {}
+        self.purged = 0
+        self.busy_errors = 0
+    
+    def ensure_schema(self, statements: Sequence[str]) -> None:
+        """Register CREATE statements to run when a process connects."""
+        self._schemas.append(statements)
+        if self._conn is not None and self._pid == os.getpid():
+            for statement in statements:
+                self._conn.execute(statement)
+    
+    def connection(self) -> sqlite3.Connection:
+        """Return this process's connection, opening it on first use."""
+        if self._conn is None or self._pid != os.getpid():
+            # A connection inherited across fork must not be used by the child
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA busy_timeout=5000")
+            for statements in self._schemas:
+                for statement in statements:
+                    conn.execute(statement)
+            # Setup may wait for other workers starting up; requests may not
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+    
+    @contextmanager
+    def fail_open(self) -> Iterator[None]:
+        """
+        Skip the rest of a block if the database stays locked past the busy
+        timeout, counting it in busy_errors. Code after the block supplies
+        the fallback.
+        """
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            self.busy_errors += 1
+    
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Run several statements as one write transaction: with shared.write() as conn: ..."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    
+    def close(self) -> None:
+        """Close this process's connection."""
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = self._pid = None
+    
+    def get(self, namespace: str, key: str) -> Optional[Tuple[str, float]]:
+        """Return a live entry's value and expiry time, or None."""
+        with self.fail_open():
+            return self.connection().execute(GET_SQL, (namespace, key, self.clock())).fetchone()
+        return None
+    
+    def set(self, namespace: str, key: str, value: str, ttl: float) -> None:
+        """Store an entry for ttl seconds, replacing any existing one."""
+        with self.fail_open():
+            self.connection().execute(SET_SQL, (namespace, key, self.clock() + ttl, value))
+            self._wrote(namespace)
+    
+    def add(self, namespace: str, key: str, value: str, ttl: float) -> bool:
+        """
+        Store an entry unless a live one exists; return True if it was stored.
+        
+        A locked database also returns True, so the caller goes ahead as if
+        it held the entry.
+        """
+        now = self.clock()
+        with self.fail_open():
+            added = self.connection().execute(ADD_SQL, (namespace, key, now + ttl, value, now)).fetchone() is not None
+            if added:
+                self._wrote(namespace)
+            return added
+        return True
+    
+    def renew(self, namespace: str, key: str, value: str, ttl: float) -> bool:
+        """Push back a live entry's expiry if it still holds value; return True if it did or the database is locked."""
+        now = self.clock()
+        with self.fail_open():
+            return self.connection().execute(RENEW_SQL, (now + ttl, namespace, key, value, now)).rowcount > 0
+        return True
+    
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove an entry."""
+        with self.fail_open():
+            self.connection().execute(DELETE_SQL, (namespace, key))
+    
+    def count(self, namespace: str) -> int:
+        """Return the number of stored entries, including expired ones not yet purged."""
+        return self.connection().execute(COUNT_SQL, (namespace,)).fetchone()[0]
+    
+    def set_max_size(self, namespace: str, max_size: int) -> None:
+        """Keep at most max_size entries in a namespace, dropping those expiring first."""
+        self._max_sizes[namespace] = max(1, max_size)
+    
+    def _wrote(self, namespace: str) -> None:
+        # Expired entries are deleted in bulk every purge_every writes per process
+        writes = self._writes.get(namespace, 0) + 1
+        if writes < self.purge_every:
+            self._writes[namespace] = writes
+            return
+        self._writes[namespace] = 0
+        self.purge(namespace)
+    
+    def purge(self, namespace: str) -> int:
+        """Delete expired entries and any beyond the namespace's size limit."""
+        conn = self.connection()
+        deleted = conn.execute(PURGE_SQL, (namespace, self.clock())).rowcount
+        max_size = self._max_sizes.get(namespace)
+        if max_size is not None:
+            excess = self.count(namespace) - max_size
+            if excess > 0:
+                deleted += conn.execute(TRIM_SQL, (namespace, namespace, excess)).rowcount
+        self.purged += deleted
+        return deleted
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return purge and lock counters."""
+        return {"purged": self.purged, "busy_errors": self.busy_errors}
+    
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Delete every entry, or every entry of one namespace."""
+        if namespace is None:
+            self.connection().execute("DELETE FROM entries")
+        else:
+            self.connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+def shared_state_enabled() -> bool:
+    """Return True if state must be shared, i.e. SHARED_STATE_ENABLED or several workers."""
+    return settings.SHARED_STATE_ENABLED or settings.SERVER_WORKERS > 1
+
+# State shared by every worker process, or None for a single process
+shared_state: Optional[SharedState] = (
+    SharedState(settings.SHARED_STATE_PATH, busy_timeout_ms=settings.SHARED_STATE_BUSY_TIMEOUT_MS)
+    if shared_state_enabled() else None
+)
@@ -0,0 +1,18 @@
+from typing import Any, Callable, Dict
+
+# Registered providers of runtime counters, keyed by component name
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_stats_provider(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Register a callable that reports runtime counters for a component.
+    
+    Args:
+        name: Component name used as the key in collected stats
+        provider: Callable returning a dict of counters
+    """
+    _providers[name] = provider
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    """Collect the current counters from every registered provider."""
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,116 @@
+from typing import Any, Deque, Dict
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+
+class OverloadedError(Exception):
+    """Raised instead of calling the LLM when admission control sheds the call."""
+
+class AdmissionController:
+    """
+    Cap on concurrent LLM calls with a short, bounded FIFO wait queue.
+    
+    Up to max_in_flight calls run at once. Further calls wait in line, up to
+    max_queue of them and for at most max_wait_ms each; calls arriving at a
+    full queue, or still waiting when their time is up, are shed with
+    OverloadedError. A released slot is handed straight to the next waiter,
+    so waiters are served in arrival order.
+    """
+    
+    def __init__(self, max_in_flight: int, max_queue: int, max_wait_ms: float):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.reset()
+    
+    def reset(self) -> None:
+        """Forget in-flight calls, waiters and counters."""
+        self._waiters.clear()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+    
+    @property
+    def queued(self) -> int:
+        """Number of calls waiting for a slot."""
+        return len(self._waiters)
+    
+    async def acquire(self) -> None:
+        """
+        Take a slot, waiting in line if all are in use.
+        
+        Raises:
+            OverloadedError: If the queue is full or the wait exceeds max_wait_ms
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            raise OverloadedError("LLM admission queue is full")
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.shed_timeout += 1
+            raise OverloadedError(f"LLM admission wait exceeded {self.max_wait * 1000:g} ms")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the caller was cancelled; pass it on
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        # The releasing call handed its slot over, so in_flight is unchanged
+        self.admitted += 1
+    
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+    
+    def release(self) -> None:
+        """Give the slot to the next waiter, or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block: async with admission.slot(): ..."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight and queued counts with admission and shedding counters."""
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout
+        }
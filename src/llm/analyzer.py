@@ -1,106 +1,453 @@
-from src.common.models import Transaction, RiskAnalysis
+from src.common.models import Transaction, RiskAnalysis, VelocitySnapshot
 from src.common.config import Settings
-from src.llm.prompts import get_risk_analysis_prompt
-from src.llm.parser import parse_llm_response
-import requests
-from typing import Dict, Any
-import json
+from src.llm.prompts import (
+    get_risk_analysis_prompt,
+    get_batch_risk_analysis_prompt,
+    get_compact_risk_analysis_prompt,
+    get_compact_batch_risk_analysis_prompt
+)
+from src.llm.encoding import compact_transaction, dumps_compact, encode_compact_transactions
+from src.llm.parser import IncrementalVerdictParser, parse_llm_response, parse_batch_llm_response
+from src.llm.client import post_chat_completion, stream_chat_completion
+from src.llm.admission import OverloadedError
+from src.llm.batching import MicroBatcher
+from src.llm.cache import SharedVerdictCache, VerdictCache, transaction_fingerprint
+from src.llm.velocity import SharedVelocityTracker, VelocityTracker
+from src.llm.rules import RuleEngine
+from src.common.constants import CACHE_SETTINGS, TIME_RISK_FACTORS
+from src.common.shared_state import shared_state
+from src.common.stats import register_stats_provider
+from src.common.metrics import stage_timer, analysis_fallbacks, llm_parse_failures, risk_scores
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import httpx
 
+logger = logging.getLogger(__name__)
 settings = Settings()
 
-async def analyze_transaction_risk(transaction: Transaction) -> RiskAnalysis:
+# Declarative risk rules, reloaded when the rule file changes
+risk_rule_overrides: Dict[str, Any] = {}
+if settings.HIGH_RISK_COUNTRIES is not None:
+    logger.warning("HIGH_RISK_COUNTRIES is deprecated; set high_risk_countries in %s instead", settings.RISK_RULES_PATH)
+    risk_rule_overrides = {"high_risk_countries": {"countries": settings.HIGH_RISK_COUNTRIES}}
+rule_engine = RuleEngine(
+    settings.RISK_RULES_PATH,
+    check_interval=settings.RISK_RULES_RELOAD_SECONDS,
+    overrides=risk_rule_overrides
+)
+register_stats_provider("risk_rules", rule_engine.stats)
+
+# Number of transactions decided by each tier of the scoring pipeline
+tier_decisions: Dict[str, int] = {
+    "rule_low": 0,
+    "rule_high": 0,
+    "llm": 0,
+    "fallback": 0,
+    "shed": 0
+}
+register_stats_provider("tiered_scoring", lambda: dict(tier_decisions))
+
+# Recent transaction counts and amounts per customer, card and IP address
+if shared_state is not None:
+    velocity_tracker: VelocityTracker = SharedVelocityTracker(
+        shared_state,
+        window_minutes=TIME_RISK_FACTORS["VELOCITY_WINDOW_MINUTES"],
+        bucket_seconds=settings.VELOCITY_BUCKET_SECONDS
+    )
+else:
+    velocity_tracker = VelocityTracker(
+        window_minutes=TIME_RISK_FACTORS["VELOCITY_WINDOW_MINUTES"],
+        bucket_seconds=settings.VELOCITY_BUCKET_SECONDS,
+        max_keys=settings.VELOCITY_MAX_KEYS
+    )
+register_stats_provider("velocity", velocity_tracker.stats)
+
+# Receives the LLM's decision while the rest of a streamed verdict is arriving
+DecisionCallback = Callable[[RiskAnalysis], None]
+
+async def analyze_transaction_risk(transaction: Transaction, on_decision: Optional[DecisionCallback] = None) -> RiskAnalysis:
     """
     Analyze transaction risk using Groq LLM.
     
     Args:
         transaction: Transaction object to analyze
-        
+        on_decision: Optional callback for the early decision of a streamed
+            LLM verdict (LLM_STREAMING_ENABLED); not called for verdicts that
+            are not streamed
+    
     Returns:
         RiskAnalysis: Analysis results including risk score and factors
-        
+    
     Raises:
+        OverloadedError: If admission control sheds the LLM call and
+            LLM_SHED_MODE is reject
         Exception: If LLM analysis fails
     """
     try:
+        # Record the transaction and get recent activity for its customer, card and IP
+        velocity = velocity_tracker.record(transaction) if settings.VELOCITY_TRACKING_ENABLED else None
+        
         # Calculate base risk score first
-        base_risk_score = calculate_base_risk_score(transaction)
+        with stage_timer("base_score"):
+            base_risk_score = calculate_base_risk_score(transaction, velocity)
+        
+        # Decide confidently low or high risk transactions without the LLM
+        if settings.TIERED_SCORING_ENABLED:
+            rule_analysis = decide_by_rules(transaction, velocity)
+            if rule_analysis is not None:
+                risk_scores.labels("rules").observe(rule_analysis.risk_score)
+                return rule_analysis
         
         try:
-            # Prepare transaction data for the prompt
-            transaction_json = transaction.model_dump_json()
-            
-            # Get the prompt template
-            prompt = get_risk_analysis_prompt(transaction_json)
-            
-            # Call Groq API
-            headers = {
-                "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": settings.GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": prompt["system"]},
-                    {"role": "user", "content": prompt["user"]}
-                ],
-                "temperature": settings.LLM_TEMPERATURE,
-                "max_tokens": settings.LLM_MAX_TOKENS
-            }
-            
-            response = requests.post(
-                f"{settings.GROQ_API_ENDPOINT}/chat/completions",
-                headers=headers,
-                json=payload
+            if settings.VERDICT_CACHE_ENABLED:
+                analysis = await verdict_cache.get_or_compute(
+                    transaction_fingerprint(transaction, velocity_level(velocity)),
+                    lambda: request_verdict(transaction, velocity, on_decision)
+                )
+            else:
+                analysis = await request_verdict(transaction, velocity, on_decision)
+            # Counted only once a verdict arrives; shed and fallback requests have their own tiers
+            tier_decisions["llm"] += 1
+            risk_scores.labels("llm").observe(analysis.risk_score)
+            return analysis
+        
+        except OverloadedError:
+            # Too many LLM calls in flight; shed this one
+            if settings.LLM_SHED_MODE == "reject":
+                raise
+            tier_decisions["shed"] += 1
+            risk_scores.labels("shed").observe(base_risk_score)
+            return RiskAnalysis(
+                risk_score=base_risk_score,
+                risk_factors=["LLM overloaded - using base risk score"],
+                reasoning="Risk analysis based on basic transaction properties because the LLM is at capacity.",
+                degraded=True
             )
-            
-            response.raise_for_status()
-            
-            # Parse and validate LLM response
-            llm_response = response.json()["choices"][0]["message"]["content"]
-            risk_analysis = parse_llm_response(llm_response)
-            
-            return risk_analysis
-            
-        except (requests.exceptions.RequestException, Exception) as e:
+        
+        except (httpx.HTTPError, asyncio.TimeoutError, Exception) as e:
             # If LLM analysis fails, return base risk analysis
+            tier_decisions["fallback"] += 1
+            analysis_fallbacks.inc()
+            risk_scores.labels("fallback").observe(base_risk_score)
             return RiskAnalysis(
                 risk_score=base_risk_score,
                 risk_factors=["LLM analysis unavailable - using base risk score"],
-                reasoning="Risk analysis based on basic transaction properties due to LLM service unavailability."
+                reasoning="Risk analysis based on basic transaction properties due to LLM service unavailability.",
+                degraded=True
             )
-            
+    
+    except OverloadedError:
+        raise
     except Exception as e:
         raise Exception(f"Risk analysis failed completely: {str(e)}")
 
-def calculate_base_risk_score(transaction: Transaction) -> float:
+async def request_verdict(
+    transaction: Transaction,
+    velocity: Optional[VelocitySnapshot] = None,
+    on_decision: Optional[DecisionCallback] = None
+) -> RiskAnalysis:
+    """Get an LLM verdict for a transaction, micro-batched or streamed when enabled."""
+    if settings.LLM_BATCHING_ENABLED:
+        return await _batcher.submit(transaction, velocity)
+    if settings.LLM_STREAMING_ENABLED:
+        return await request_llm_analysis_streamed(transaction, velocity, on_decision=on_decision)
+    return await request_llm_analysis(transaction, velocity)
+
+def build_chat_payload(prompt: Dict[str, str], max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Build a Groq chat completion request body from a system/user prompt."""
+    return {
+        "model": settings.GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": prompt["system"]},
+            {"role": "user", "content": prompt["user"]}
+        ],
+        "temperature": settings.LLM_TEMPERATURE,
+        "max_tokens": max_tokens or settings.LLM_MAX_TOKENS
+    }
+
+def build_risk_prompt(
+    transaction: Transaction,
+    velocity: Optional[VelocitySnapshot] = None,
+    encoding: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Build the single-transaction prompt.
+    
+    Args:
+        transaction: Transaction to analyze
+        velocity: Optional recent activity for the transaction
+        encoding: full (the transaction as JSON) or compact (short keys and
+            derived features); defaults to LLM_PROMPT_ENCODING
+    
+    Raises:
+        ValueError: If the encoding is unknown
+    """
+    encoding = encoding or settings.LLM_PROMPT_ENCODING
+    if encoding == "compact":
+        return get_compact_risk_analysis_prompt(dumps_compact(compact_transaction(transaction, velocity)))
+    if encoding == "full":
+        # Prepare transaction data for the prompt
+        transaction_json = transaction.model_dump_json()
+        velocity_json = velocity.model_dump_json() if velocity is not None else None
+        return get_risk_analysis_prompt(transaction_json, velocity_json)
+    raise ValueError(f"Unknown prompt encoding: {encoding}")
+
+def build_batch_risk_prompt(
+    items: List[Tuple[Transaction, Optional[VelocitySnapshot]]],
+    encoding: Optional[str] = None
+) -> Dict[str, str]:
+    """Build the multi-transaction prompt; see build_risk_prompt for encodings."""
+    encoding = encoding or settings.LLM_PROMPT_ENCODING
+    if encoding == "compact":
+        return get_compact_batch_risk_analysis_prompt(encode_compact_transactions(items))
+    if encoding == "full":
+        transactions_json = "[" + ",".join(t.model_dump_json() for t, _ in items) + "]"
+        velocity_json = "{" + ",".join(
+            f'"{transaction.transaction_id}":{velocity.model_dump_json()}'
+            for transaction, velocity in items if velocity is not None
+        ) + "}"
+        return get_batch_risk_analysis_prompt(transactions_json, velocity_json if velocity_json != "{}" else None)
+    raise ValueError(f"Unknown prompt encoding: {encoding}")
+
+async def request_llm_analysis(
+    transaction: Transaction,
+    velocity: Optional[VelocitySnapshot] = None,
+    encoding: Optional[str] = None
+) -> RiskAnalysis:
+    """
+    Analyze a single transaction with one Groq chat completion.
+    
+    Args:
+        transaction: Transaction to analyze
+        velocity: Optional recent activity for the transaction
+        encoding: Prompt encoding; defaults to LLM_PROMPT_ENCODING
+    
+    Returns:
+        RiskAnalysis parsed from the LLM response
+    """
+    with stage_timer("prompt_build"):
+        prompt = build_risk_prompt(transaction, velocity, encoding)
+    
+    # Call Groq API
+    response = await post_chat_completion(build_chat_payload(prompt))
+    
+    # Parse and validate LLM response
+    try:
+        with stage_timer("parse"):
+            llm_response = response["choices"][0]["message"]["content"]
+            return parse_llm_response(llm_response)
+    except (KeyError, IndexError, TypeError, ValueError):
+        llm_parse_failures.inc()
+        raise
+
+async def request_llm_analysis_streamed(
+    transaction: Transaction,
+    velocity: Optional[VelocitySnapshot] = None,
+    encoding: Optional[str] = None,
+    on_decision: Optional[DecisionCallback] = None
+) -> RiskAnalysis:
+    """
+    Analyze a single transaction with one streamed Groq chat completion.
+    
+    The completion is parsed as it streams, and on_decision receives the
+    risk score and recommended action as soon as both are complete. If the
+    stream fails after that, the decision is returned without the rest of
+    the verdict so it never contradicts what on_decision reported.
+    
+    Args:
+        transaction: Transaction to analyze
+        velocity: Optional recent activity for the transaction
+        encoding: Prompt encoding; defaults to LLM_PROMPT_ENCODING
+        on_decision: Optional callback for the early decision
+    
+    Returns:
+        RiskAnalysis parsed from the complete LLM response
+    """
+    with stage_timer("prompt_build"):
+        prompt = build_risk_prompt(transaction, velocity, encoding)
+    
+    parser = IncrementalVerdictParser()
+    decision: Optional[RiskAnalysis] = None
+    try:
+        async for content in stream_chat_completion(build_chat_payload(prompt)):
+            parser.feed(content)
+            if decision is None:
+                decision = parser.decision()
+                if decision is not None and on_decision is not None:
+                    on_decision(decision)
+    except Exception:
+        if decision is None:
+            raise
+        return complete_decision(decision)
+    
+    try:
+        with stage_timer("parse"):
+            return parse_llm_response(parser.text)
+    except ValueError:
+        llm_parse_failures.inc()
+        if decision is None:
+            raise
+        return complete_decision(decision)
+
+def complete_decision(decision: RiskAnalysis) -> RiskAnalysis:
+    """Turn an early decision into the final verdict when the rest of the stream was lost."""
+    return RiskAnalysis(
+        risk_score=decision.risk_score,
+        risk_factors=decision.risk_factors,
+        reasoning=decision.reasoning or "LLM response ended after its decision; reasoning unavailable.",
+        recommended_action=decision.recommended_action
+    )
+
+async def request_batch_llm_analysis(items: List[Tuple[Transaction, Optional[VelocitySnapshot]]]) -> Dict[str, Optional[RiskAnalysis]]:
+    """
+    Analyze several transactions with one Groq chat completion.
+    
+    Args:
+        items: Transactions to analyze with their optional recent activity
+    
+    Returns:
+        Dict mapping transaction IDs to their RiskAnalysis, or None where the
+        LLM returned no valid verdict
+    """
+    transactions = [transaction for transaction, _ in items]
+    with stage_timer("prompt_build"):
+        prompt = build_batch_risk_prompt(items)
+    
+    max_tokens = min(settings.LLM_MAX_TOKENS * len(transactions), settings.LLM_BATCH_MAX_TOKENS)
+    response = await post_chat_completion(build_chat_payload(prompt, max_tokens))
+    
+    try:
+        with stage_timer("parse"):
+            llm_response = response["choices"][0]["message"]["content"]
+            return parse_batch_llm_response(llm_response, [t.transaction_id for t in transactions])
+    except (KeyError, IndexError, TypeError, ValueError):
+        llm_parse_failures.inc()
+        raise
+
+# Packs transactions arriving within a short window into one completion
+_batcher = MicroBatcher(
+    request_batch_llm_analysis,
+    max_size=settings.LLM_BATCH_MAX_SIZE,
+    max_wait_ms=settings.LLM_BATCH_MAX_WAIT_MS
+)
+
+# Shares LLM verdicts between structurally identical transactions
+if shared_state is not None:
+    verdict_cache: VerdictCache = SharedVerdictCache(
+        shared_state,
+        ttl_seconds=CACHE_SETTINGS["TRANSACTION_CACHE_TTL"],
+        max_size=CACHE_SETTINGS["MAX_CACHE_SIZE"]
+    )
+else:
+    verdict_cache = VerdictCache(
+        ttl_seconds=CACHE_SETTINGS["TRANSACTION_CACHE_TTL"],
+        max_size=CACHE_SETTINGS["MAX_CACHE_SIZE"]
+    )
+register_stats_provider("verdict_cache", verdict_cache.stats)
+
+def calculate_base_risk_score(transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> float:
     """
     Calculate initial risk score based on basic transaction properties.
     This serves as a fallback if LLM analysis fails.
     
+    Countries, cross-border, amount tiers, velocity and time of day are
+    weighted by the current risk rules.
+    
     Args:
         transaction: Transaction to analyze
-        
+        velocity: Optional recent activity for the transaction's customer, card and IP
+    
     Returns:
         float: Base risk score between 0.0 and 1.0
     """
-    risk_score = 0.0
+    return rule_engine.rules.base_score(transaction, velocity)
+
+def velocity_level(velocity: Optional[VelocitySnapshot]) -> int:
+    """
+    Classify recent activity against the rules' max transactions per hour.
+    
+    Args:
+        velocity: Recent activity, or None if velocity tracking is disabled
+    
+    Returns:
+        int: 0 for normal activity, 1 for elevated (over half the limit), 2 for over the limit
+    """
+    return rule_engine.rules.velocity_level(velocity)
+
+def calculate_rule_risk(transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> Tuple[float, List[str]]:
+    """
+    Calculate the deterministic rule score used to tier transactions.
+    Extends the base risk score with the payment method and merchant
+    category risk tables of the current risk rules.
+    
+    Args:
+        transaction: Transaction to analyze
+        velocity: Optional recent activity for the transaction's customer, card and IP
+    
+    Returns:
+        Tuple of the rule score between 0.0 and 1.0 and the matched risk factors
+    """
+    return rule_engine.rules.rule_risk(transaction, velocity)
+
+def decide_by_rules(transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> Optional[RiskAnalysis]:
+    """
+    Decide a transaction from its rule score when the score is confidently
+    outside the ambiguous band.
+    
+    Args:
+        transaction: Transaction to analyze
+        velocity: Optional recent activity for the transaction
+    
+    Returns:
+        RiskAnalysis if the rules are conclusive, None if the LLM should decide
+    """
+    rule_score, risk_factors = calculate_rule_risk(transaction, velocity)
+    
+    if rule_score < settings.REVIEW_THRESHOLD - settings.TIER_LOW_MARGIN:
+        tier_decisions["rule_low"] += 1
+        return RiskAnalysis(
+            risk_score=rule_score,
+            risk_factors=risk_factors,
+            reasoning="Decided by deterministic rules: rule score is confidently below the review threshold.",
+            recommended_action="allow"
+        )
     
-    # Check for high-risk countries
-    if transaction.customer.country in settings.HIGH_RISK_COUNTRIES:
-        risk_score += 0.4
-    if transaction.payment_method.country_of_issue in settings.HIGH_RISK_COUNTRIES:
-        risk_score += 0.4
+    if rule_score >= settings.HIGH_RISK_THRESHOLD + settings.TIER_HIGH_MARGIN:
+        tier_decisions["rule_high"] += 1
+        return RiskAnalysis(
+            risk_score=rule_score,
+            risk_factors=risk_factors,
+            reasoning="Decided by deterministic rules: rule score is confidently above the high risk threshold.",
+            recommended_action="block"
+        )
     
-    # Check for cross-border transaction
-    if transaction.customer.country != transaction.payment_method.country_of_issue:
-        risk_score += 0.3
+    return None
+
+def provisional_risk_analysis(transaction: Transaction) -> RiskAnalysis:
+    """
+    Build a rule-based RiskAnalysis to answer with while the LLM verdict is pending.
+    
+    The transaction must already have been recorded by analyze_transaction_risk,
+    so its velocity is looked up rather than recorded again.
     
-    # Check for high-value transaction (over 1000)
-    if transaction.amount > 1000:
-        risk_score += 0.3
-    elif transaction.amount > 500:
-        risk_score += 0.2
+    Args:
+        transaction: Transaction being analyzed
     
-    # Normalize risk score to be between 0 and 1
-    return min(risk_score, 1.0)
\ No newline at end of file
+    Returns:
+        RiskAnalysis from the rule score
+    """
+    velocity = velocity_tracker.query(transaction) if settings.VELOCITY_TRACKING_ENABLED else None
+    rule_score, risk_factors = calculate_rule_risk(transaction, velocity)
+    if rule_score >= settings.HIGH_RISK_THRESHOLD:
+        action = "block"
+    elif rule_score >= settings.REVIEW_THRESHOLD:
+        action = "review"
+    else:
+        action = "allow"
+    return RiskAnalysis(
+        risk_score=rule_score,
+        risk_factors=risk_factors,
+        reasoning="Provisional rule-based score: the LLM analysis did not finish within the deadline.",
+        recommended_action=action
+    )
\ No newline at end of file
@@ -0,0 +1,88 @@
+from src.common.models import Transaction, RiskAnalysis, VelocitySnapshot
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+
+BatchItem = Tuple[Transaction, Optional[VelocitySnapshot]]
+BatchAnalyzer = Callable[[List[BatchItem]], Awaitable[Dict[str, Optional[RiskAnalysis]]]]
+
+class MicroBatcher:
+    """
+    Collect transactions arriving within a short window and analyze them with
+    a single LLM completion.
+    
+    A batch is flushed as soon as it holds max_size transactions or when
+    max_wait_ms has elapsed since its first transaction arrived.
+    """
+    
+    def __init__(self, analyze_batch: BatchAnalyzer, max_size: int, max_wait_ms: float):
+        self.analyze_batch = analyze_batch
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: List[BatchItem] = []
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def submit(self, transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> RiskAnalysis:
+        """
+        Queue a transaction for the next batch and wait for its verdict.
+        
+        Args:
+            transaction: Transaction to analyze
+            velocity: Optional recent activity for the transaction
+            
+        Returns:
+            RiskAnalysis for the transaction
+            
+        Raises:
+            ValueError: If the batch response has no valid verdict for the transaction
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        if transaction.transaction_id not in self._waiters:
+            self._pending.append((transaction, velocity))
+            self._waiters[transaction.transaction_id] = []
+        self._waiters[transaction.transaction_id].append(future)
+        
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self.flush)
+        
+        return await future
+    
+    def flush(self) -> None:
+        """Send all pending transactions as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        
+        items, waiters = self._pending, self._waiters
+        self._pending, self._waiters = [], {}
+        
+        task = asyncio.get_running_loop().create_task(self._run_batch(items, waiters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_batch(self, items: List[BatchItem], waiters: Dict[str, List[asyncio.Future]]) -> None:
+        try:
+            results = await self.analyze_batch(items)
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        
+        for tx_id, futures in waiters.items():
+            analysis = results.get(tx_id)
+            for future in futures:
+                if future.done():
+                    continue
+                if analysis is None:
+                    future.set_exception(ValueError(f"No valid verdict for transaction {tx_id}"))
+                else:
+                    future.set_result(analysis)
@@ -0,0 +1,191 @@
+from src.common.models import Transaction, RiskAnalysis
+from src.common.constants import AMOUNT_BUCKETS
+from src.common.shared_state import SharedState
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import bisect
+import time
+
+def amount_bucket(amount: float) -> int:
+    """Return the index of the AMOUNT_BUCKETS range the amount falls into."""
+    return bisect.bisect_right(AMOUNT_BUCKETS, amount)
+
+def transaction_fingerprint(transaction: Transaction, velocity_level: int = 0) -> str:
+    """
+    Build a canonical cache key from the risk-relevant features of a transaction.
+    
+    IDs, names, IP addresses and timestamps are excluded so structurally
+    identical transactions share a verdict.
+    
+    Args:
+        transaction: Transaction to fingerprint
+        velocity_level: Recent activity level, so bursts are not served normal verdicts
+    
+    Returns:
+        str: Cache key
+    """
+    return "|".join((
+        transaction.customer.country,
+        transaction.payment_method.country_of_issue,
+        transaction.payment_method.type,
+        transaction.merchant.category,
+        transaction.currency,
+        str(amount_bucket(transaction.amount)),
+        str(velocity_level)
+    ))
+
+class VerdictCache:
+    """
+    Bounded TTL/LRU cache of LLM risk verdicts with in-flight request coalescing.
+    
+    Concurrent misses on the same key share a single computation; failed
+    computations are never cached.
+    """
+    
+    def __init__(self, ttl_seconds: float, max_size: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl_seconds
+        self.max_size = max(1, max_size)
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, RiskAnalysis]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key: str) -> Optional[RiskAnalysis]:
+        """Return the cached verdict for key, or None if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, analysis = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return analysis
+    
+    def set(self, key: str, analysis: RiskAnalysis) -> None:
+        """Store a verdict, evicting the least recently used entries when full."""
+        self._entries[key] = (self.clock() + self.ttl, analysis)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[RiskAnalysis]]) -> RiskAnalysis:
+        """
+        Return the cached verdict for key, computing it once on a miss.
+        
+        Args:
+            key: Cache key
+            compute: Coroutine factory producing the verdict
+        
+        Returns:
+            RiskAnalysis from the cache, an in-flight computation or a new one
+        """
+        analysis = self.get(key)
+        if analysis is not None:
+            self.hits += 1
+            return analysis
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            analysis = await compute()
+        except asyncio.CancelledError:
+            # Waiters must not be cancelled along with the request that led the call
+            future.set_exception(RuntimeError("Coalesced LLM call was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            self.set(key, analysis)
+            future.set_result(analysis)
+            return analysis
+        finally:
+            del self._inflight[key]
+    
+    def clear(self) -> None:
+        """Drop all cached verdicts and reset counters."""
+        self._entries.clear()
+        self.hits = self.misses = self.coalesced = self.evictions = self.expirations = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "in_flight": len(self._inflight)
+        }
+
+class SharedVerdictCache(VerdictCache):
+    """
+    VerdictCache backed by SharedState, so a verdict computed by one worker
+    process is served by all of them.
+    
+    The in-process entries stay in front as a first level; a local miss
+    reads the shared entry and keeps a copy until the shared entry expires.
+    Concurrent misses are still coalesced per process only.
+    """
+    
+    NAMESPACE = "verdicts"
+    
+    def __init__(self, shared: SharedState, ttl_seconds: float, max_size: int, clock: Callable[[], float] = time.monotonic):
+        super().__init__(ttl_seconds, max_size, clock)
+        self.shared = shared
+        shared.set_max_size(self.NAMESPACE, max_size)
+        self.shared_hits = 0
+    
+    def get(self, key: str) -> Optional[RiskAnalysis]:
+        """Return the verdict for key from this process or the shared store."""
+        analysis = super().get(key)
+        if analysis is not None:
+            return analysis
+        entry = self.shared.get(self.NAMESPACE, key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        analysis = RiskAnalysis.model_validate_json(value)
+        self.shared_hits += 1
+        # Keep the local copy no longer than the shared entry
+        super().set(key, analysis)
+        self._entries[key] = (self.clock() + (expires_at - self.shared.clock()), analysis)
+        return analysis
+    
+    def set(self, key: str, analysis: RiskAnalysis) -> None:
+        """Store a verdict in this process and the shared store."""
+        super().set(key, analysis)
+        self.shared.set(self.NAMESPACE, key, analysis.model_dump_json(), self.ttl)
+    
+    def clear(self) -> None:
+        """Drop all cached verdicts, shared ones included, and reset counters."""
+        super().clear()
+        self.shared.clear(self.NAMESPACE)
+        self.shared_hits = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters, with the shared entry count and hits."""
+        return {
+            **super().stats(),
+            "shared_size": self.shared.count(self.NAMESPACE),
+            "shared_hits": self.shared_hits
+        }
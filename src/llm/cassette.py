@@ -0,0 +1,233 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import httpx
+
+CASSETTE_VERSION = 1
+
+# Headers describing the raw upstream body, which no longer apply once it is decoded
+BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    """
+    Fingerprint an LLM request by method, path and canonical JSON body.
+    
+    Key order and whitespace in the body do not change the fingerprint.
+    """
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        canonical = body.decode("utf-8", errors="replace")
+    return hashlib.sha256(f"{method.upper()} {path}\n{canonical}".encode()).hexdigest()
+
+def _fingerprint(request: httpx.Request) -> str:
+    return request_fingerprint(request.method, request.url.path, request.content)
+
+class Cassette:
+    """
+    Recorded LLM interactions, stored as a JSON file.
+    
+    Responses are kept per request fingerprint in the order they were
+    recorded. Replay walks each fingerprint's responses in order and starts
+    over once they are used up.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._interactions: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+    
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        """Load a cassette file; a missing file gives an empty cassette."""
+        cassette = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                content = f.read()
+            document = json.loads(content) if content else {}
+            for interaction in document.get("interactions", []):
+                cassette._interactions.setdefault(interaction["fingerprint"], []).append(interaction)
+        return cassette
+    
+    def __len__(self) -> int:
+        return sum(len(responses) for responses in self._interactions.values())
+    
+    def record(self, request: httpx.Request, response: httpx.Response, content: bytes) -> None:
+        """Add a request and its response."""
+        try:
+            request_body: Any = json.loads(request.content)
+        except ValueError:
+            request_body = request.content.decode("utf-8", errors="replace")
+        interaction = {
+            "fingerprint": _fingerprint(request),
+            "request": {"method": request.method, "path": request.url.path, "body": request_body},
+            "response": {
+                "status_code": response.status_code,
+                "headers": {
+                    key: value for key, value in response.headers.items()
+                    if key.lower() in ("content-type", "retry-after")
+                },
+                "body": content.decode("utf-8", errors="replace")
+            }
+        }
+        with self._lock:
+            self._interactions.setdefault(interaction["fingerprint"], []).append(interaction)
+            self.dirty = True
+    
+    def next_response(self, request: httpx.Request) -> Optional[Dict[str, Any]]:
+        """Return the next recorded response for a request, or None if it was never recorded."""
+        fingerprint = _fingerprint(request)
+        with self._lock:
+            responses = self._interactions.get(fingerprint)
+            if not responses:
+                return None
+            position = self._positions.get(fingerprint, 0)
+            self._positions[fingerprint] = (position + 1) % len(responses)
+            return responses[position]["response"]
+    
+    def save(self) -> None:
+        """Write the cassette atomically if anything was recorded."""
+        with self._lock:
+            if not self.dirty:
+                return
+            document = {
+                "version": CASSETTE_VERSION,
+                "interactions": [
+                    interaction
+                    for responses in self._interactions.values()
+                    for interaction in responses
+                ]
+            }
+            self.dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(document, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Forward requests to the real transport and record every response.
+    
+    The cassette is saved when the transport is closed, i.e. when the LLM
+    client shuts down.
+    """
+    
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+        self.recorded = 0
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        self.cassette.record(request, response, content)
+        self.recorded += 1
+        # The body was consumed and decoded; hand the client a response built from it
+        return httpx.Response(
+            response.status_code,
+            headers=[(k, v) for k, v in response.headers.items() if k.lower() not in BODY_HEADERS],
+            content=content,
+            request=request
+        )
+    
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+        self.cassette.save()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of recorded interactions."""
+        return {"mode": "record", "recorded": self.recorded, "cassette_size": len(self.cassette)}
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Serve LLM responses from a cassette, without network access.
+    
+    Every response is delayed by latency_ms plus up to jitter_ms, and a
+    fraction of requests fail with a 5xx (error_rate) or a 429 carrying
+    Retry-After (rate_limit_rate). With a seed the injected faults are
+    reproducible. Requests that were never recorded get a 404.
+    """
+    
+    def __init__(
+        self,
+        cassette: Cassette,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after_seconds: float = 1.0,
+        error_status: int = 503,
+        seed: Optional[int] = None
+    ):
+        self.cassette = cassette
+        self.latency = max(0.0, latency_ms) / 1000
+        self.jitter = max(0.0, jitter_ms) / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.replayed = 0
+        self.misses = 0
+        self.injected_errors = 0
+        self.injected_rate_limits = 0
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        roll = self._random.random()
+        if delay:
+            await asyncio.sleep(delay)
+        
+        if roll < self.rate_limit_rate:
+            self.injected_rate_limits += 1
+            return httpx.Response(
+                429,
+                headers={"Retry-After": f"{self.retry_after_seconds:g}"},
+                json={"error": {"message": "Rate limit exceeded (injected)"}},
+                request=request
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.injected_errors += 1
+            return httpx.Response(
+                self.error_status,
+                json={"error": {"message": "Upstream error (injected)"}},
+                request=request
+            )
+        
+        recorded = self.cassette.next_response(request)
+        if recorded is None:
+            self.misses += 1
+            return httpx.Response(
+                404,
+                json={"error": {"message": "No recorded response for this request"}},
+                request=request
+            )
+        self.replayed += 1
+        return httpx.Response(
+            recorded["status_code"],
+            headers=recorded.get("headers", {}),
+            content=recorded["body"].encode(),
+            request=request
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return replay hit, miss and injected fault counters."""
+        return {
+            "mode": "replay",
+            "cassette_size": len(self.cassette),
+            "replayed": self.replayed,
+            "misses": self.misses,
+            "injected_errors": self.injected_errors,
+            "injected_rate_limits": self.injected_rate_limits
+        }
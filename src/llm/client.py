@@ -0,0 +1,288 @@
+from src.common.config import Settings
+from src.common.stats import register_stats_provider
+from src.common.metrics import stage_timer, llm_responses
+from src.llm.resilience import CircuitBreaker, ResilientCaller, RetryBudget
+from src.llm.admission import AdmissionController
+from src.llm.cassette import Cassette, RecordingTransport, ReplayTransport
+from typing import AsyncIterator, Dict, Any, Optional
+import asyncio
+import json
+import httpx
+
+settings = Settings()
+
+# Shared HTTP client for all LLM calls. Created on application startup and
+# closed on shutdown; lazily created if used outside the application lifespan.
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Circuit breaker, retries and hedging around every chat completion
+llm_resilience = ResilientCaller(
+    breaker=CircuitBreaker(
+        failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+        slow_call_ms=settings.LLM_BREAKER_SLOW_CALL_MS
+    ),
+    budget=RetryBudget(settings.LLM_RETRY_BUDGET_RATIO, settings.LLM_RETRY_BUDGET_MIN),
+    max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+    base_delay_ms=settings.LLM_RETRY_BASE_DELAY_MS,
+    max_delay_ms=settings.LLM_RETRY_MAX_DELAY_MS,
+    hedging_enabled=settings.LLM_HEDGING_ENABLED,
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+    hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    hedge_min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS
+)
+register_stats_provider("llm_resilience", llm_resilience.stats)
+
+# Cap on concurrent chat completions; a retried or hedged call holds one slot
+llm_admission = AdmissionController(
+    max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+    max_queue=settings.LLM_ADMISSION_QUEUE_SIZE,
+    max_wait_ms=settings.LLM_ADMISSION_WAIT_MS
+)
+register_stats_provider("llm_admission", llm_admission.stats)
+
+def max_call_seconds() -> float:
+    """
+    Return the longest post_chat_completion can take: the admission wait,
+    every attempt running to LLM_TOTAL_TIMEOUT and the longest backoff
+    between attempts.
+    """
+    attempts = max(1, settings.LLM_RETRY_MAX_ATTEMPTS)
+    return (
+        settings.LLM_ADMISSION_WAIT_MS / 1000
+        + attempts * settings.LLM_TOTAL_TIMEOUT
+        + (attempts - 1) * settings.LLM_RETRY_MAX_DELAY_MS / 1000
+    )
+
+# Cassette shared by every record/replay transport, and the transport in use
+_cassette: Optional[Cassette] = None
+_configured_transport: Optional[httpx.AsyncBaseTransport] = None
+
+def get_cassette() -> Cassette:
+    """Load the LLM_CASSETTE_PATH cassette once and share it."""
+    global _cassette
+    if _cassette is None or _cassette.path != settings.LLM_CASSETTE_PATH:
+        _cassette = Cassette.load(settings.LLM_CASSETTE_PATH)
+    return _cassette
+
+def create_llm_transport(limits: httpx.Limits) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Create the transport selected by LLM_TRANSPORT_MODE.
+    
+    Returns:
+        None for live (httpx's default network transport), a RecordingTransport
+        for record or a ReplayTransport for replay
+    
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    global _configured_transport
+    mode = settings.LLM_TRANSPORT_MODE
+    if mode == "live":
+        transport = None
+    elif mode == "record":
+        transport = RecordingTransport(get_cassette(), httpx.AsyncHTTPTransport(limits=limits))
+    elif mode == "replay":
+        transport = ReplayTransport(
+            get_cassette(),
+            latency_ms=settings.LLM_REPLAY_LATENCY_MS,
+            jitter_ms=settings.LLM_REPLAY_JITTER_MS,
+            error_rate=settings.LLM_REPLAY_ERROR_RATE,
+            rate_limit_rate=settings.LLM_REPLAY_RATE_LIMIT_RATE,
+            retry_after_seconds=settings.LLM_REPLAY_RETRY_AFTER_SECONDS,
+            seed=settings.LLM_REPLAY_SEED
+        )
+    else:
+        raise ValueError(f"Unknown LLM transport mode: {mode}")
+    _configured_transport = transport
+    return transport
+
+def transport_stats() -> Dict[str, Any]:
+    """Return record/replay counters for the configured transport."""
+    if _configured_transport is None:
+        return {"mode": settings.LLM_TRANSPORT_MODE}
+    return _configured_transport.stats()
+
+register_stats_provider("llm_transport", transport_stats)
+
+def _build_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Create a pooled keep-alive client configured for the Groq API."""
+    limits = httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+    )
+    if transport is None:
+        transport = create_llm_transport(limits)
+    return httpx.AsyncClient(
+        base_url=settings.GROQ_API_ENDPOINT,
+        headers={
+            "Authorization": f"Bearer {settings.GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        },
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT,
+            connect=settings.LLM_CONNECT_TIMEOUT
+        ),
+        limits=limits,
+        transport=transport
+    )
+
+async def start_llm_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+    """
+    Create the shared LLM client. Called on application startup.
+    
+    Args:
+        transport: Optional httpx transport; defaults to the one selected by
+            LLM_TRANSPORT_MODE
+    """
+    global _client, _client_loop
+    await close_llm_client()
+    _client = _build_client(transport)
+    _client_loop = asyncio.get_running_loop()
+
+async def close_llm_client() -> None:
+    """Close the shared LLM client. Called on application shutdown."""
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+def get_llm_client() -> httpx.AsyncClient:
+    """
+    Get the shared LLM client for the running event loop.
+    
+    Pooled connections are bound to the loop that opened them, so a client
+    created on a different loop is replaced rather than reused.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+async def _post_chat_completion_once(payload: Dict[str, Any]) -> Dict[str, Any]:
+    client = get_llm_client()
+    try:
+        with stage_timer("llm_call"):
+            response = await asyncio.wait_for(
+                client.post("/chat/completions", json=payload),
+                timeout=settings.LLM_TOTAL_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        llm_responses.labels("timeout").inc()
+        raise
+    except httpx.HTTPError:
+        llm_responses.labels("error").inc()
+        raise
+    llm_responses.labels(str(response.status_code)).inc()
+    response.raise_for_status()
+    return response.json()
+
+async def post_chat_completion(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send a chat completion request to the Groq API.
+    
+    Transient failures (timeouts, connection errors, 429 and 5xx) are retried
+    with jittered backoff within the retry budget, and an open circuit
+    breaker rejects the call without touching the network.
+    
+    Args:
+        payload: Chat completion request body
+    
+    Returns:
+        Dict containing the decoded JSON response
+    
+    Raises:
+        CircuitOpenError: If the circuit breaker is open
+        OverloadedError: If admission control sheds the call
+        httpx.HTTPError: If the request fails or returns an error status
+        asyncio.TimeoutError: If an attempt exceeds LLM_TOTAL_TIMEOUT
+    """
+    if not settings.LLM_ADMISSION_ENABLED:
+        return await llm_resilience.call(lambda: _post_chat_completion_once(payload))
+    async with llm_admission.slot():
+        return await llm_resilience.call(lambda: _post_chat_completion_once(payload))
+
+async def _open_chat_completion_stream(payload: Dict[str, Any], deadline: float) -> httpx.Response:
+    client = get_llm_client()
+    request = client.build_request("POST", "/chat/completions", json={**payload, "stream": True})
+    try:
+        with stage_timer("llm_call"):
+            response = await asyncio.wait_for(
+                client.send(request, stream=True),
+                timeout=deadline - asyncio.get_running_loop().time()
+            )
+    except asyncio.TimeoutError:
+        llm_responses.labels("timeout").inc()
+        raise
+    except httpx.HTTPError:
+        llm_responses.labels("error").inc()
+        raise
+    llm_responses.labels(str(response.status_code)).inc()
+    if response.is_error:
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+async def stream_chat_completion(payload: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from the Groq API as server-sent events.
+    
+    Opening the stream goes through the same admission control and
+    resilience policy as post_chat_completion, without hedging; once the
+    response has started, errors are not retried. The admission slot is
+    held until the stream ends, which must be within LLM_TOTAL_TIMEOUT.
+    
+    Args:
+        payload: Chat completion request body; stream is set automatically
+    
+    Yields:
+        Content deltas of the first choice, in order
+    
+    Raises:
+        CircuitOpenError: If the circuit breaker is open
+        OverloadedError: If admission control sheds the call
+        httpx.HTTPError: If the request fails or returns an error status
+        asyncio.TimeoutError: If the stream exceeds LLM_TOTAL_TIMEOUT
+        ValueError: If the stream reports an error or is malformed
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LLM_TOTAL_TIMEOUT
+    admitted = settings.LLM_ADMISSION_ENABLED
+    if admitted:
+        await llm_admission.acquire()
+    try:
+        response = await llm_resilience.call(lambda: _open_chat_completion_stream(payload, deadline), hedge=False)
+    except BaseException:
+        if admitted:
+            llm_admission.release()
+        raise
+    lines = response.aiter_lines()
+    try:
+        with stage_timer("llm_stream"):
+            while True:
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), timeout=deadline - loop.time())
+                except StopAsyncIteration:
+                    return
+                if not line.startswith("data:"):
+                    # Blank separators, comments and other SSE fields
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                event = json.loads(data)
+                if "error" in event:
+                    raise ValueError(f"LLM stream error: {event['error']}")
+                choices = event.get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+    finally:
+        await response.aclose()
+        if admitted:
+            llm_admission.release()
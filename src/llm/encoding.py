@@ -0,0 +1,109 @@
+from src.common.models import Transaction, VelocitySnapshot
+from src.common.constants import AMOUNT_BUCKETS
+from src.llm.cache import amount_bucket
+from src.llm.rules import utc_hour
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import math
+import re
+
+# Key legend shared with the compact system prompt
+COMPACT_KEYS = {
+    "id": "transaction id (batch prompts only)",
+    "amt": "amount",
+    "cur": "currency",
+    "ab": "amount bucket",
+    "h": "hour of day (UTC, 0-23)",
+    "cc": "customer country",
+    "ic": "card issuing country",
+    "xb": "cross-border (1 if customer and card countries differ)",
+    "pm": "payment method",
+    "mc": "merchant category",
+    "v": "activity in the last w minutes as [count, amount] for customer (c), card (k) and IP (i)"
+}
+
+# Words longer than this are counted as several tokens
+_CHARS_PER_TOKEN = 4
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+def amount_bucket_label(amount: float) -> str:
+    """Return the AMOUNT_BUCKETS range of an amount, e.g. "250-500" or "10000+"."""
+    index = amount_bucket(amount)
+    if index == 0:
+        return f"<{AMOUNT_BUCKETS[0]:g}"
+    if index == len(AMOUNT_BUCKETS):
+        return f"{AMOUNT_BUCKETS[-1]:g}+"
+    return f"{AMOUNT_BUCKETS[index - 1]:g}-{AMOUNT_BUCKETS[index]:g}"
+
+def compact_velocity(velocity: VelocitySnapshot) -> Dict[str, Any]:
+    """Encode recent activity as [count, amount] pairs with short keys."""
+    return {
+        "w": velocity.window_minutes,
+        "c": [velocity.customer_count, round(velocity.customer_amount, 2)],
+        "k": [velocity.card_count, round(velocity.card_amount, 2)],
+        "i": [velocity.ip_count, round(velocity.ip_amount, 2)]
+    }
+
+def compact_transaction(
+    transaction: Transaction,
+    velocity: Optional[VelocitySnapshot] = None,
+    include_id: bool = False
+) -> Dict[str, Any]:
+    """
+    Encode the risk-relevant fields of a transaction with short keys.
+    
+    IDs, names, the IP address and the full timestamp are dropped; the
+    cross-border flag, hour of day and amount bucket are added so the model
+    does not have to derive them.
+    
+    Args:
+        transaction: Transaction to encode
+        velocity: Optional recent activity
+        include_id: Keep the transaction ID, needed to match batch verdicts
+    
+    Returns:
+        Dict using the COMPACT_KEYS keys
+    """
+    customer_country = transaction.customer.country
+    card_country = transaction.payment_method.country_of_issue
+    encoded: Dict[str, Any] = {"id": transaction.transaction_id} if include_id else {}
+    encoded.update({
+        "amt": transaction.amount,
+        "cur": transaction.currency,
+        "ab": amount_bucket_label(transaction.amount),
+        "h": utc_hour(transaction.timestamp),
+        "cc": customer_country,
+        "ic": card_country,
+        "xb": int(customer_country != card_country),
+        "pm": transaction.payment_method.type,
+        "mc": transaction.merchant.category
+    })
+    if velocity is not None:
+        encoded["v"] = compact_velocity(velocity)
+    return encoded
+
+def dumps_compact(value: Any) -> str:
+    """Serialize JSON without whitespace."""
+    return json.dumps(value, separators=(",", ":"))
+
+def encode_compact_transactions(items: List[Tuple[Transaction, Optional[VelocitySnapshot]]]) -> str:
+    """Encode a batch of transactions, with their IDs, as one compact JSON array."""
+    return dumps_compact([compact_transaction(t, v, include_id=True) for t, v in items])
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a text without a tokenizer.
+    
+    Runs of letters or digits count one token per four characters, and
+    every punctuation character counts as one token. This tracks BPE
+    tokenizers closely enough to compare prompt encodings; it is not an
+    exact count.
+    """
+    return sum(
+        math.ceil(len(piece) / _CHARS_PER_TOKEN) if piece[0].isalnum() else 1
+        for piece in _TOKEN_PIECES.findall(text)
+    )
+
+def estimate_prompt_tokens(prompt: Dict[str, str]) -> int:
+    """Estimate the input tokens of a system/user prompt, including per-message overhead."""
+    return sum(estimate_tokens(content) + 4 for content in prompt.values())
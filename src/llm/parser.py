@@ -1,6 +1,6 @@
 from src.common.models import RiskAnalysis
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 def parse_llm_response(response: str) -> RiskAnalysis:
     """
@@ -18,40 +18,212 @@ def parse_llm_response(response: str) -> RiskAnalysis:
     try:
         # Parse JSON response
         data = json.loads(response)
-        
-        # Validate required fields
-        required_fields = ["risk_score", "risk_factors", "reasoning", "recommended_action"]
-        for field in required_fields:
-            if field not in data:
-                raise ValueError(f"Missing required field: {field}")
-        
-        # Validate risk score range
-        risk_score = float(data["risk_score"])
-        if not 0.0 <= risk_score <= 1.0:
-            raise ValueError("Risk score must be between 0.0 and 1.0")
-        
-        # Validate risk factors
-        if not isinstance(data["risk_factors"], list):
-            raise ValueError("Risk factors must be a list")
-        
-        # Validate recommended action
-        valid_actions = ["allow", "review", "block"]
-        if data["recommended_action"] not in valid_actions:
-            raise ValueError(f"Invalid recommended action. Must be one of: {valid_actions}")
-        
-        # Create RiskAnalysis object
-        return RiskAnalysis(
-            risk_score=risk_score,
-            risk_factors=data["risk_factors"],
-            reasoning=data["reasoning"],
-            recommended_action=data["recommended_action"]
-        )
+        return build_risk_analysis(data)
         
     except json.JSONDecodeError:
         raise ValueError("Invalid JSON response from LLM")
     except Exception as e:
         raise ValueError(f"Error parsing LLM response: {str(e)}")
 
+def build_risk_analysis(data: Dict[str, Any]) -> RiskAnalysis:
+    """
+    Validate a decoded LLM verdict and build a RiskAnalysis object.
+    
+    Args:
+        data: Decoded verdict
+    
+    Returns:
+        RiskAnalysis object
+    
+    Raises:
+        ValueError: If the verdict is invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Verdict must be a JSON object")
+    
+    # Validate required fields
+    required_fields = ["risk_score", "risk_factors", "reasoning", "recommended_action"]
+    for field in required_fields:
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+    
+    # Validate risk score range
+    risk_score = float(data["risk_score"])
+    if not 0.0 <= risk_score <= 1.0:
+        raise ValueError("Risk score must be between 0.0 and 1.0")
+    
+    # Validate risk factors
+    if not isinstance(data["risk_factors"], list):
+        raise ValueError("Risk factors must be a list")
+    
+    # Validate recommended action
+    valid_actions = ["allow", "review", "block"]
+    if data["recommended_action"] not in valid_actions:
+        raise ValueError(f"Invalid recommended action. Must be one of: {valid_actions}")
+    
+    # Create RiskAnalysis object
+    return RiskAnalysis(
+        risk_score=risk_score,
+        risk_factors=data["risk_factors"],
+        reasoning=data["reasoning"],
+        recommended_action=data["recommended_action"]
+    )
+
+# Fields an early decision needs; the prompts ask for them first
+DECISION_FIELDS = ("risk_score", "recommended_action")
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CONTINUATION = "0123456789.eE+-"
+
+class IncrementalVerdictParser:
+    """
+    Parse a streamed LLM verdict as it arrives.
+    
+    Top-level fields of the verdict object are decoded as soon as each one is
+    complete, so the decision (risk score and recommended action) is known
+    before the reasoning has finished streaming. Scanning stops once the
+    decision is known; the full text is validated with parse_llm_response
+    when the stream ends.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self._decoder = json.JSONDecoder()
+        self._position: Optional[int] = None
+        self._after_value = False
+        self._stopped = False
+        self._needs_closing = False
+    
+    def feed(self, chunk: str) -> None:
+        """Append a chunk of the completion and decode any newly completed fields."""
+        self.text += chunk
+        if self._stopped:
+            return
+        if self._needs_closing and '"' not in chunk and "]" not in chunk and "}" not in chunk:
+            # A long reasoning string is not re-decoded for every chunk
+            return
+        self._scan()
+    
+    def _skip_whitespace(self, position: int) -> int:
+        text = self.text
+        while position < len(text) and text[position] in _WHITESPACE:
+            position += 1
+        return position
+    
+    def _scan(self) -> None:
+        text = self.text
+        if self._position is None:
+            start = text.find("{")
+            if start < 0:
+                return
+            self._position = start + 1
+        
+        while True:
+            position = self._skip_whitespace(self._position)
+            if position >= len(text):
+                return
+            if text[position] == "}":
+                self._stopped = True
+                return
+            if self._after_value:
+                if text[position] != ",":
+                    self._stopped = True
+                    return
+                position = self._skip_whitespace(position + 1)
+                if position >= len(text):
+                    return
+            if text[position] != '"':
+                # Not a JSON object member; leave the error to the final parse
+                self._stopped = True
+                return
+            try:
+                key, position = self._decoder.raw_decode(text, position)
+                position = self._skip_whitespace(position)
+                if position >= len(text):
+                    return
+                if text[position] != ":":
+                    self._stopped = True
+                    return
+                position = self._skip_whitespace(position + 1)
+                value, end = self._decoder.raw_decode(text, position)
+            except ValueError:
+                # Incomplete member; wait for more text
+                self._needs_closing = position < len(text) and text[position] in '"[{'
+                return
+            self._needs_closing = False
+            if end >= len(text) or text[end] in _NUMBER_CONTINUATION:
+                # A number may continue in the next chunk, e.g. "0." before "75"
+                return
+            self.fields[key] = value
+            self._position = end
+            self._after_value = True
+            if all(field in self.fields for field in DECISION_FIELDS):
+                self._stopped = True
+                return
+    
+    def decision(self) -> Optional[RiskAnalysis]:
+        """
+        Return the verdict's decision once its risk score and action have streamed.
+        
+        Fields that have not streamed yet are left empty. Returns None until
+        both decision fields are complete, or if either is invalid.
+        """
+        if not all(field in self.fields for field in DECISION_FIELDS):
+            return None
+        risk_factors = self.fields.get("risk_factors")
+        reasoning = self.fields.get("reasoning")
+        try:
+            return RiskAnalysis(
+                risk_score=float(self.fields["risk_score"]),
+                risk_factors=risk_factors if isinstance(risk_factors, list) else [],
+                reasoning=reasoning if isinstance(reasoning, str) else "",
+                recommended_action=self.fields["recommended_action"]
+            )
+        except (TypeError, ValueError):
+            return None
+
+def parse_batch_llm_response(response: str, transaction_ids: List[str]) -> Dict[str, Optional[RiskAnalysis]]:
+    """
+    Split a multi-transaction LLM response into per-transaction RiskAnalysis objects.
+    
+    Args:
+        response: JSON string from LLM containing an array of verdicts
+        transaction_ids: IDs of the transactions included in the prompt
+    
+    Returns:
+        Dict mapping each transaction ID to its RiskAnalysis, or None if the
+        verdict is missing or malformed
+    
+    Raises:
+        ValueError: If the response is not a JSON array of verdicts
+    """
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON response from LLM")
+    
+    # Some models wrap the array in an object, e.g. {"verdicts": [...]}
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), None)
+    if not isinstance(data, list):
+        raise ValueError("Batch response must be a JSON array of verdicts")
+    
+    results: Dict[str, Optional[RiskAnalysis]] = {tx_id: None for tx_id in transaction_ids}
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        tx_id = item.get("transaction_id")
+        if tx_id not in results or results[tx_id] is not None:
+            continue
+        try:
+            results[tx_id] = build_risk_analysis(item)
+        except Exception:
+            # Leave malformed verdicts as None so the caller falls back
+            continue
+    
+    return results
+
 def extract_key_insights(analysis: RiskAnalysis) -> Dict[str, Any]:
     """
     Extract key insights from risk analysis for notification purposes.
@@ -1,12 +1,13 @@
-from typing import Dict
+from typing import Dict, Optional
 
-def get_risk_analysis_prompt(transaction_json: str) -> Dict[str, str]:
+def get_risk_analysis_prompt(transaction_json: str, velocity_json: Optional[str] = None) -> Dict[str, str]:
     """
     Generate the prompt for transaction risk analysis.
     
     Args:
         transaction_json: Transaction data in JSON format
-        
+        velocity_json: Optional recent activity for the customer, card and IP in JSON format
+    
     Returns:
         Dict containing system and user prompts
     """
@@ -18,9 +19,9 @@ def get_risk_analysis_prompt(transaction_json: str) -> Dict[str, str]:
     Response format:
     {{
         "risk_score": 0.0-1.0,
+        "recommended_action": "allow|review|block",
         "risk_factors": ["factor1", "factor2"...],
-        "reasoning": "Brief analysis explanation",
-        "recommended_action": "allow|review|block"
+        "reasoning": "Brief analysis explanation"
     }}
     
     Consider:
@@ -36,6 +37,8 @@ def get_risk_analysis_prompt(transaction_json: str) -> Dict[str, str]:
     """
     
     user_prompt = f"Analyze this transaction:\n{transaction_json}"
+    if velocity_json:
+        user_prompt += f"\n\nRecent activity for this customer, card and IP address:\n{velocity_json}"
     
     return {
         "system": system_prompt,
@@ -62,4 +65,94 @@ def get_transaction_summary_prompt(transaction_json: str) -> Dict[str, str]:
     return {
         "system": system_prompt,
         "user": user_prompt
-    }
\ No newline at end of file
+    }
+
+def get_batch_risk_analysis_prompt(transactions_json: str, velocity_json: Optional[str] = None) -> Dict[str, str]:
+    """
+    Generate the prompt for analyzing several transactions in one completion.
+    
+    Args:
+        transactions_json: JSON array of transactions
+        velocity_json: Optional JSON object of recent activity keyed by transaction ID
+    
+    Returns:
+        Dict containing system and user prompts
+    """
+    system_prompt = """
+    You are a specialized financial risk analyst. Evaluate each transaction independently 
+    and determine a risk score from 0.0 (no risk) to 1.0 (extremely high risk) based on 
+    fraud patterns. Provide clear reasoning and risk factors for every transaction.
+    
+    Response format (a JSON array with exactly one verdict per transaction):
+    [
+        {
+            "transaction_id": "tx_...",
+            "risk_score": 0.0-1.0,
+            "risk_factors": ["factor1", "factor2"...],
+            "reasoning": "Brief analysis explanation",
+            "recommended_action": "allow|review|block"
+        }
+    ]
+    
+    Consider:
+    1. Geographic mismatches (customer/payment country differences, high-risk jurisdictions)
+    2. Transaction patterns (unusual amounts, timing)
+    3. Payment method risks
+    4. Merchant category risks
+    
+    Score guidelines:
+    - 0.0-0.3: Allow (low risk)
+    - 0.3-0.7: Review (medium risk)
+    - 0.7-1.0: Block (high risk)
+    """
+    
+    user_prompt = f"Analyze these transactions:\n{transactions_json}"
+    if velocity_json:
+        user_prompt += f"\n\nRecent activity for each transaction's customer, card and IP address:\n{velocity_json}"
+    
+    return {
+        "system": system_prompt,
+        "user": user_prompt
+    }
+
+COMPACT_SYSTEM_PROMPT = """Financial fraud risk analyst. Score transaction risk 0.0 (none) to 1.0 (extreme).
+Weigh geographic mismatch, high-risk jurisdictions, unusual amount or hour, activity bursts, payment method and merchant category risk.
+Bands: <0.3 allow, 0.3-0.7 review, >=0.7 block.
+Input keys: amt amount, cur currency, ab amount bucket, h hour UTC, cc customer country, ic card issuing country, xb cross-border 1/0, pm payment method, mc merchant category, v activity in last w minutes as [count,amount] for customer c, card k, IP i."""
+
+def get_compact_risk_analysis_prompt(transaction_json: str) -> Dict[str, str]:
+    """
+    Generate the short-form risk analysis prompt for a compact transaction encoding.
+    
+    Args:
+        transaction_json: Transaction encoded by compact_transaction, including any activity
+    
+    Returns:
+        Dict containing system and user prompts
+    """
+    system_prompt = COMPACT_SYSTEM_PROMPT + """
+Reply with JSON only: {"risk_score":0.0-1.0,"recommended_action":"allow|review|block","risk_factors":["..."],"reasoning":"one or two sentences"}"""
+    
+    return {
+        "system": system_prompt,
+        "user": transaction_json
+    }
+
+def get_compact_batch_risk_analysis_prompt(transactions_json: str) -> Dict[str, str]:
+    """
+    Generate the short-form prompt for a JSON array of compact transaction encodings.
+    
+    Args:
+        transactions_json: Array of transactions encoded by compact_transaction with their IDs
+    
+    Returns:
+        Dict containing system and user prompts
+    """
+    system_prompt = COMPACT_SYSTEM_PROMPT + """
+Score each transaction independently. id is the transaction id.
+Reply with a JSON array, one verdict per transaction: [{"transaction_id":"tx_...","risk_score":0.0-1.0,"risk_factors":["..."],"reasoning":"one or two sentences","recommended_action":"allow|review|block"}]"""
+    
+    return {
+        "system": system_prompt,
+        "user": transactions_json
+    }
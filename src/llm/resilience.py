@@ -0,0 +1,306 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from collections import deque
+import asyncio
+import random
+import time
+import httpx
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open."""
+
+def is_retryable(error: BaseException) -> bool:
+    """Return True for transient failures: timeouts, transport errors, 429 and 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Return the Retry-After delay of a 429/503 response, if it has one in seconds."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    try:
+        return max(0.0, float(error.response.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    
+    Calls slower than slow_call_ms count as failures. After failure_threshold
+    consecutive failures the breaker opens and rejects calls for
+    reset_seconds, then lets a single probe through (half-open); the probe's
+    outcome closes or re-opens it.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_seconds: float,
+        slow_call_ms: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.slow_call_ms = slow_call_ms
+        self.clock = clock
+        self.reset()
+    
+    def reset(self) -> None:
+        """Close the breaker and reset counters."""
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+        self.slow_calls = 0
+    
+    def allow(self) -> None:
+        """
+        Check whether a call may proceed.
+        
+        Raises:
+            CircuitOpenError: If the breaker is open or a half-open probe is already running
+        """
+        if self.state == self.OPEN:
+            if self.clock() - self.opened_at < self.reset_seconds:
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit breaker is open")
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit breaker is half-open")
+            self.probe_in_flight = True
+    
+    def record_success(self, latency_ms: float) -> None:
+        """Record a completed call; slow calls count as failures."""
+        if self.slow_call_ms is not None and latency_ms > self.slow_call_ms:
+            self.slow_calls += 1
+            self.record_failure()
+            return
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the breaker past the threshold."""
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return breaker state and counters."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "slow_calls": self.slow_calls
+        }
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of calls.
+    
+    Every call deposits ratio tokens and every retry withdraws one, so a
+    failing upstream sees at most (1 + ratio) times the normal traffic once
+    the initial min_retries tokens are spent.
+    """
+    
+    def __init__(self, ratio: float, min_retries: int):
+        self.ratio = max(0.0, ratio)
+        self.min_retries = max(0, min_retries)
+        self.capacity = float(max(1, self.min_retries))
+        self.reset()
+    
+    def reset(self) -> None:
+        """Refill the initial retry allowance."""
+        self.tokens = float(self.min_retries)
+        self.exhausted = 0
+    
+    def deposit(self) -> None:
+        """Credit the budget for one call."""
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        """Spend one token on a retry; False when the budget is exhausted."""
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+class LatencyTracker:
+    """Recent call latencies, used to pick the hedging delay."""
+    
+    def __init__(self, max_samples: int = 256):
+        self._samples: deque = deque(maxlen=max_samples)
+    
+    def add(self, latency_ms: float) -> None:
+        """Record a call latency."""
+        self._samples.append(latency_ms)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def percentile(self, percentile: float) -> float:
+        """Return the nearest-rank percentile of the recorded latencies."""
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        rank = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+        return ordered[rank]
+    
+    def clear(self) -> None:
+        """Forget all recorded latencies."""
+        self._samples.clear()
+
+class ResilientCaller:
+    """
+    Wrap an LLM call with a circuit breaker, budgeted jittered retries and
+    optional hedging.
+    
+    With hedging enabled, a second identical request is sent when the first
+    has not finished within the hedge percentile of recent latencies; the
+    first response wins and the other request is cancelled.
+    """
+    
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        budget: RetryBudget,
+        max_attempts: int,
+        base_delay_ms: float,
+        max_delay_ms: float,
+        hedging_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_ms: float = 50.0,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    ):
+        self.breaker = breaker
+        self.budget = budget
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay_ms) / 1000
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self.hedging_enabled = hedging_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = max(0.0, hedge_min_delay_ms) / 1000
+        self.sleep = sleep
+        self.latencies = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def reset(self) -> None:
+        """Close the breaker and reset all counters."""
+        self.breaker.reset()
+        self.budget.reset()
+        self.latencies.clear()
+        self.retries = self.hedges = self.hedge_wins = 0
+    
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After up to max_delay."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+    
+    async def call(self, func: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        Run func with the resilience policy.
+        
+        Args:
+            func: Coroutine factory performing one LLM request
+            hedge: Allow hedging; disable it for results that must be closed,
+                such as open streams, since a losing hedge is discarded
+        
+        Returns:
+            The first successful result
+        
+        Raises:
+            CircuitOpenError: If the breaker rejects the call
+            Exception: The last error once retries or the retry budget are exhausted
+        """
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            self.breaker.allow()
+            started = time.perf_counter()
+            try:
+                result = await self._attempt(func, hedge)
+            except asyncio.CancelledError:
+                self.breaker.probe_in_flight = False
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                if not is_retryable(e) or attempt >= self.max_attempts or not self.budget.withdraw():
+                    raise
+                self.retries += 1
+                await self.sleep(self.backoff(attempt, e))
+                attempt += 1
+                continue
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.latencies.add(latency_ms)
+            self.breaker.record_success(latency_ms)
+            return result
+    
+    async def _attempt(self, func: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        if not hedge or not self.hedging_enabled or len(self.latencies) < self.hedge_min_samples:
+            return await func()
+        
+        delay = max(self.hedge_min_delay, self.latencies.percentile(self.hedge_percentile) / 1000)
+        primary = asyncio.ensure_future(func())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            
+            self.hedges += 1
+            hedge = asyncio.ensure_future(func())
+            tasks.append(hedge)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return breaker state, retry and hedging counters."""
+        return {
+            **self.breaker.stats(),
+            "retries": self.retries,
+            "retry_budget_exhausted": self.budget.exhausted,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50_ms": round(self.latencies.percentile(50), 3),
+            "latency_p95_ms": round(self.latencies.percentile(95), 3)
+        }
@@ -0,0 +1,281 @@
+from src.common.models import Transaction, VelocitySnapshot
+from src.common.constants import (
+    HIGH_RISK_COUNTRIES,
+    TIME_RISK_FACTORS,
+    PAYMENT_METHOD_RISK,
+    MERCHANT_CATEGORY_RISK,
+    RULE_TABLE_WEIGHTS
+)
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import bisect
+import json
+import os
+import threading
+import time
+
+# Rules used when no rule file exists; they reproduce the built-in scoring
+DEFAULT_RISK_RULES: Dict[str, Any] = {
+    "high_risk_countries": {
+        "countries": HIGH_RISK_COUNTRIES,
+        "customer_weight": 0.4,
+        "card_weight": 0.4
+    },
+    "cross_border": {"weight": 0.3},
+    "amount": {
+        "tiers": [{"above": 500.0, "weight": 0.2}, {"above": 1000.0, "weight": 0.3}],
+        "factor_above": 500.0
+    },
+    "velocity": {
+        "max_transactions_per_hour": TIME_RISK_FACTORS["MAX_TRANSACTIONS_PER_HOUR"],
+        "weight": 0.3
+    },
+    "time_of_day": {
+        "unusual_hours": list(TIME_RISK_FACTORS["UNUSUAL_HOURS"]),
+        "weight": 0.0
+    },
+    "payment_method_risk": PAYMENT_METHOD_RISK,
+    "merchant_category_risk": MERCHANT_CATEGORY_RISK,
+    "table_weights": {
+        "payment_method": RULE_TABLE_WEIGHTS["PAYMENT_METHOD"],
+        "merchant_category": RULE_TABLE_WEIGHTS["MERCHANT_CATEGORY"],
+        "unknown_risk": RULE_TABLE_WEIGHTS["UNKNOWN_RISK"],
+        "factor_above": 0.5
+    }
+}
+
+def utc_hour(timestamp: datetime) -> int:
+    """Return the hour of day in UTC; naive timestamps are taken to be UTC."""
+    if timestamp.tzinfo is None:
+        return timestamp.hour
+    return timestamp.astimezone(timezone.utc).hour
+
+class CompiledRules:
+    """
+    Risk rules compiled into flat lookups: a frozenset of countries, sorted
+    amount thresholds for bisect, dict tables and a 24-entry hour table.
+    Instances are never modified, so they can be swapped atomically.
+    """
+    
+    __slots__ = (
+        "source", "countries", "customer_country_weight", "card_country_weight",
+        "cross_border_weight", "amount_thresholds", "amount_weights", "amount_factor_above",
+        "max_transactions_per_hour", "velocity_weight", "unusual_hours", "hour_weights",
+        "payment_risk", "merchant_risk", "payment_weight", "merchant_weight",
+        "unknown_risk", "table_factor_above"
+    )
+    
+    def __init__(self, rules: Dict[str, Any]):
+        self.source = rules
+        countries = rules["high_risk_countries"]
+        self.countries = frozenset(code.upper() for code in countries["countries"])
+        self.customer_country_weight = float(countries["customer_weight"])
+        self.card_country_weight = float(countries["card_weight"])
+        self.cross_border_weight = float(rules["cross_border"]["weight"])
+        
+        tiers = sorted(rules["amount"]["tiers"], key=lambda tier: float(tier["above"]))
+        self.amount_thresholds = [float(tier["above"]) for tier in tiers]
+        self.amount_weights = [float(tier["weight"]) for tier in tiers]
+        self.amount_factor_above = float(rules["amount"]["factor_above"])
+        
+        velocity = rules["velocity"]
+        self.max_transactions_per_hour = float(velocity["max_transactions_per_hour"])
+        self.velocity_weight = float(velocity["weight"])
+        
+        time_of_day = rules["time_of_day"]
+        start, end = (int(hour) % 24 for hour in time_of_day["unusual_hours"])
+        self.unusual_hours = (start, end)
+        weight = float(time_of_day["weight"])
+        # The unusual window may wrap past midnight, e.g. 22 to 5
+        if start > end:
+            unusual = [hour >= start or hour < end for hour in range(24)]
+        else:
+            unusual = [start <= hour < end for hour in range(24)]
+        self.hour_weights = tuple(weight if flag else 0.0 for flag in unusual)
+        
+        self.payment_risk = {k: float(v) for k, v in rules["payment_method_risk"].items()}
+        self.merchant_risk = {k: float(v) for k, v in rules["merchant_category_risk"].items()}
+        tables = rules["table_weights"]
+        self.payment_weight = float(tables["payment_method"])
+        self.merchant_weight = float(tables["merchant_category"])
+        self.unknown_risk = float(tables["unknown_risk"])
+        self.table_factor_above = float(tables["factor_above"])
+    
+    def velocity_level(self, velocity: Optional[VelocitySnapshot]) -> int:
+        """Return 0 for normal, 1 for elevated (over half the limit), 2 for over the limit."""
+        if velocity is None:
+            return 0
+        limit = self.max_transactions_per_hour * velocity.window_minutes / 60
+        count = max(velocity.customer_count, velocity.card_count, velocity.ip_count)
+        if count > limit:
+            return 2
+        if count > limit / 2:
+            return 1
+        return 0
+    
+    def amount_weight(self, amount: float) -> float:
+        """Return the weight of the highest amount tier the amount is above."""
+        index = bisect.bisect_left(self.amount_thresholds, amount)
+        return self.amount_weights[index - 1] if index else 0.0
+    
+    def base_score(self, transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> float:
+        """Score countries, cross-border, amount, velocity and time of day."""
+        customer_country = transaction.customer.country
+        card_country = transaction.payment_method.country_of_issue
+        score = self.amount_weight(transaction.amount) + self.hour_weights[utc_hour(transaction.timestamp)]
+        if customer_country in self.countries:
+            score += self.customer_country_weight
+        if card_country in self.countries:
+            score += self.card_country_weight
+        if customer_country != card_country:
+            score += self.cross_border_weight
+        if velocity is not None and self.velocity_level(velocity) == 2:
+            score += self.velocity_weight
+        return min(score, 1.0)
+    
+    def rule_risk(self, transaction: Transaction, velocity: Optional[VelocitySnapshot] = None) -> Tuple[float, List[str]]:
+        """Score the base rules plus the weighted payment method and merchant category tables."""
+        risk_factors: List[str] = []
+        customer_country = transaction.customer.country
+        card_country = transaction.payment_method.country_of_issue
+        
+        if customer_country in self.countries:
+            risk_factors.append(f"High-risk customer country ({customer_country})")
+        if card_country in self.countries:
+            risk_factors.append(f"High-risk card issuing country ({card_country})")
+        if customer_country != card_country:
+            risk_factors.append(f"Cross-border payment ({customer_country}/{card_country})")
+        if transaction.amount > self.amount_factor_above:
+            risk_factors.append(f"High transaction amount ({transaction.amount} {transaction.currency})")
+        if self.velocity_level(velocity) == 2:
+            risk_factors.append(
+                f"High transaction velocity ({max(velocity.customer_count, velocity.card_count, velocity.ip_count)} "
+                f"transactions in {velocity.window_minutes} minutes)"
+            )
+        hour = utc_hour(transaction.timestamp)
+        if self.hour_weights[hour] > 0:
+            risk_factors.append(f"Unusual transaction time ({hour:02d}:00 UTC)")
+        
+        payment_risk = self.payment_risk.get(transaction.payment_method.type, self.unknown_risk)
+        category_risk = self.merchant_risk.get(transaction.merchant.category, self.unknown_risk)
+        if payment_risk >= self.table_factor_above:
+            risk_factors.append(f"High-risk payment method ({transaction.payment_method.type})")
+        if category_risk >= self.table_factor_above:
+            risk_factors.append(f"High-risk merchant category ({transaction.merchant.category})")
+        
+        risk_score = (
+            self.base_score(transaction, velocity)
+            + self.payment_weight * payment_risk
+            + self.merchant_weight * category_risk
+        )
+        return min(risk_score, 1.0), risk_factors
+
+def merge_rules(defaults: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Overlay a rule file on the defaults, merging nested sections key by key."""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict) and not key.endswith("_risk"):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+def compile_rules(rules: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None) -> CompiledRules:
+    """
+    Compile a rule document (merged over DEFAULT_RISK_RULES, with overrides merged on top).
+    
+    Raises:
+        ValueError: If the rules are malformed
+    """
+    try:
+        return CompiledRules(merge_rules(merge_rules(DEFAULT_RISK_RULES, rules), overrides or {}))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid risk rules: {e!r}")
+
+class RuleEngine:
+    """
+    Holds the compiled risk rules and hot-reloads them from a JSON file.
+    
+    The file is checked at most every check_interval seconds; when its stat
+    signature changes it is recompiled and swapped in as a whole. A file
+    that fails to parse or compile leaves the current rules in place.
+    Overrides are merged over every version of the file.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[str],
+        check_interval: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+        overrides: Optional[Dict[str, Any]] = None
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self.overrides = overrides or {}
+        self._rules = compile_rules({}, self.overrides)
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.version = 0
+        self.loaded_at: Optional[datetime] = None
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+        self.reload()
+    
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    
+    def reload(self) -> bool:
+        """
+        Recompile the rule file if it changed since the last load.
+        
+        Returns:
+            bool: True if new rules were swapped in
+        """
+        with self._lock:
+            self._next_check = self.clock() + self.check_interval
+            signature = self._stat()
+            if signature == self._signature:
+                return False
+            try:
+                if signature is None:
+                    rules = compile_rules({}, self.overrides)
+                else:
+                    with open(self.path, "r") as f:
+                        rules = compile_rules(json.load(f), self.overrides)
+            except (OSError, ValueError) as e:
+                # Remember the broken file so it is not re-parsed until it changes again
+                self._signature = signature
+                self.reload_errors += 1
+                self.last_error = str(e)
+                return False
+            self._signature = signature
+            self._rules = rules
+            self.version += 1
+            self.loaded_at = datetime.utcnow()
+            self.last_error = None
+            return True
+    
+    @property
+    def rules(self) -> CompiledRules:
+        """The current rules, reloading first if the check interval has passed."""
+        if self.clock() >= self._next_check:
+            self.reload()
+        return self._rules
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the loaded rule version and reload counters."""
+        return {
+            "path": self.path,
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,258 @@
+from src.common.models import Transaction, VelocitySnapshot
+from src.common.shared_state import SharedState
+from typing import Callable, Dict, List, Tuple
+from collections import OrderedDict
+from array import array
+import time
+
+class SlidingWindow:
+    """
+    Bucketed sliding window of transaction counts and amount sums.
+    
+    The window is a ring of fixed-width time buckets. Advancing the ring clears
+    at most one full revolution of buckets, so updates and queries are O(1).
+    """
+    
+    __slots__ = ("counts", "sums", "head", "total_count", "total_amount")
+    
+    def __init__(self, num_buckets: int):
+        self.counts = array("I", bytes(4 * num_buckets))
+        self.sums = array("d", bytes(8 * num_buckets))
+        self.head = -1
+        self.total_count = 0
+        self.total_amount = 0.0
+    
+    def _advance(self, bucket: int) -> None:
+        if self.head < 0:
+            self.head = bucket
+            return
+        size = len(self.counts)
+        steps = min(bucket - self.head, size)
+        for i in range(1, steps + 1):
+            slot = (bucket - steps + i) % size
+            self.total_count -= self.counts[slot]
+            self.total_amount -= self.sums[slot]
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+        self.head = bucket
+        if self.total_count == 0:
+            # Avoid accumulating floating point drift once the window is empty
+            self.total_amount = 0.0
+    
+    def add(self, bucket: int, amount: float) -> None:
+        """Record one transaction of the given amount in a time bucket."""
+        if bucket > self.head:
+            self._advance(bucket)
+        elif bucket <= self.head - len(self.counts):
+            # Older than the window; nothing to count
+            return
+        slot = bucket % len(self.counts)
+        self.counts[slot] += 1
+        self.sums[slot] += amount
+        self.total_count += 1
+        self.total_amount += amount
+    
+    def totals(self, bucket: int) -> Tuple[int, float]:
+        """Return the transaction count and amount sum for the window ending at bucket."""
+        if bucket > self.head:
+            self._advance(bucket)
+        return self.total_count, self.total_amount
+
+class VelocityTracker:
+    """
+    In-process velocity tracker keyed by customer, card and IP address.
+    
+    Transactions are bucketed by the time they are received (epoch seconds
+    from clock), not by their client-supplied timestamp, so senders cannot
+    backdate transactions out of the window or push it forward. Keys are
+    kept in least-recently-updated order; keys idle for longer than the
+    window are dropped, and the oldest keys are evicted once max_keys is
+    reached.
+    """
+    
+    def __init__(
+        self,
+        window_minutes: int,
+        bucket_seconds: int = 60,
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.time
+    ):
+        self.window_minutes = window_minutes
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.num_buckets = max(1, (window_minutes * 60) // self.bucket_seconds)
+        self.max_keys = max(1, max_keys)
+        self.clock = clock
+        self._windows: "OrderedDict[str, SlidingWindow]" = OrderedDict()
+        self.evictions = 0
+    
+    @staticmethod
+    def transaction_keys(transaction: Transaction) -> Tuple[str, str, str]:
+        """Return the customer, card and IP keys for a transaction."""
+        return (
+            f"cust:{transaction.customer.id}",
+            f"card:{transaction.payment_method.last_four}:{transaction.payment_method.country_of_issue}",
+            f"ip:{transaction.customer.ip_address}"
+        )
+    
+    def _bucket(self) -> int:
+        return int(self.clock()) // self.bucket_seconds
+    
+    def _evict(self, bucket: int) -> None:
+        # Drop keys whose whole window has expired, oldest first
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if window.head > bucket - self.num_buckets and len(self._windows) <= self.max_keys:
+                break
+            del self._windows[key]
+            self.evictions += 1
+    
+    def record(self, transaction: Transaction) -> VelocitySnapshot:
+        """
+        Record a transaction and return the velocity including it.
+        
+        Args:
+            transaction: Transaction to record
+        
+        Returns:
+            VelocitySnapshot for the transaction's customer, card and IP
+        """
+        bucket = self._bucket()
+        totals = []
+        for key in self.transaction_keys(transaction):
+            window = self._windows.get(key)
+            if window is None:
+                window = SlidingWindow(self.num_buckets)
+                self._windows[key] = window
+            else:
+                self._windows.move_to_end(key)
+            window.add(bucket, transaction.amount)
+            totals.append(window.totals(bucket))
+        self._evict(bucket)
+        return self._snapshot(totals)
+    
+    def query(self, transaction: Transaction) -> VelocitySnapshot:
+        """
+        Return the current velocity for a transaction without recording it.
+        
+        Args:
+            transaction: Transaction to look up
+        
+        Returns:
+            VelocitySnapshot for the transaction's customer, card and IP
+        """
+        bucket = self._bucket()
+        totals = []
+        for key in self.transaction_keys(transaction):
+            window = self._windows.get(key)
+            totals.append(window.totals(bucket) if window is not None else (0, 0.0))
+        return self._snapshot(totals)
+    
+    def _snapshot(self, totals) -> VelocitySnapshot:
+        (customer_count, customer_amount), (card_count, card_amount), (ip_count, ip_amount) = totals
+        return VelocitySnapshot(
+            window_minutes=self.window_minutes,
+            customer_count=customer_count,
+            customer_amount=round(customer_amount, 2),
+            card_count=card_count,
+            card_amount=round(card_amount, 2),
+            ip_count=ip_count,
+            ip_amount=round(ip_amount, 2)
+        )
+    
+    def clear(self) -> None:
+        """Forget all tracked keys."""
+        self._windows.clear()
+        self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return tracker counters."""
+        return {
+            "tracked_keys": len(self._windows),
+            "max_keys": self.max_keys,
+            "evictions": self.evictions
+        }
+
+VELOCITY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS velocity (
+        key TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (key, bucket)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_velocity_bucket ON velocity (bucket)"
+]
+
+ADD_SQL = (
+    "INSERT INTO velocity (key, bucket, count, amount) VALUES (?, ?, 1, ?) "
+    "ON CONFLICT (key, bucket) DO UPDATE SET count = count + 1, amount = amount + excluded.amount"
+)
+TOTALS_SQL = (
+    "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(amount), 0.0) FROM velocity "
+    "WHERE key = ? AND bucket > ? AND bucket <= ?"
+)
+
+class SharedVelocityTracker(VelocityTracker):
+    """
+    Velocity tracker stored in SharedState, so transactions seen by any
+    worker process count towards the same windows.
+    
+    Every (key, time bucket) pair is one row; recording a transaction
+    updates its three rows and reads the window totals in one write
+    transaction. Buckets older than the window are deleted in bulk every
+    purge_every records per process.
+    """
+    
+    def __init__(
+        self,
+        shared: SharedState,
+        window_minutes: int,
+        bucket_seconds: int = 60,
+        purge_every: int = 1000,
+        clock: Callable[[], float] = time.time
+    ):
+        super().__init__(window_minutes, bucket_seconds, clock=clock)
+        shared.ensure_schema(VELOCITY_SCHEMA)
+        self.shared = shared
+        self.purge_every = max(1, purge_every)
+        self._records = 0
+    
+    def _totals(self, conn, keys: Tuple[str, str, str], bucket: int) -> List[Tuple[int, float]]:
+        return [tuple(conn.execute(TOTALS_SQL, (key, bucket - self.num_buckets, bucket)).fetchone()) for key in keys]
+    
+    def record(self, transaction: Transaction) -> VelocitySnapshot:
+        """Record a transaction and return the velocity including it."""
+        bucket = self._bucket()
+        keys = self.transaction_keys(transaction)
+        self._records += 1
+        with self.shared.fail_open():
+            with self.shared.write() as conn:
+                if self._records >= self.purge_every:
+                    self._records = 0
+                    self.evictions += conn.execute(
+                        "DELETE FROM velocity WHERE bucket <= ?", (bucket - self.num_buckets,)
+                    ).rowcount
+                conn.executemany(ADD_SQL, [(key, bucket, transaction.amount) for key in keys])
+                totals = self._totals(conn, keys, bucket)
+            return self._snapshot(totals)
+        # Locked: reads still work, so report the velocity without this transaction
+        return self.query(transaction)
+    
+    def query(self, transaction: Transaction) -> VelocitySnapshot:
+        """Return the current velocity for a transaction without recording it."""
+        keys = self.transaction_keys(transaction)
+        return self._snapshot(self._totals(self.shared.connection(), keys, self._bucket()))
+    
+    def clear(self) -> None:
+        """Forget all tracked keys."""
+        self.shared.connection().execute("DELETE FROM velocity")
+        self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return tracker counters."""
+        return {
+            "tracked_keys": self.shared.connection().execute("SELECT COUNT(DISTINCT key) FROM velocity").fetchone()[0],
+            "evictions": self.evictions
+        }
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Security
+from fastapi import APIRouter, Depends, HTTPException, Security, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from src.common.models import AdminNotification
+from src.common.models import AdminNotification, NotificationQuery
 from src.common.config import Settings
-from typing import List, Dict
-import json
-import aiofiles
+from src.common.stats import collect_stats, register_stats_provider
+from src.notifications.dispatcher import AlertChannel, AlertDispatcher, SMTPChannel, WebhookChannel, FileChannel
+from src.notifications.queue import WriteBehindQueue
+from src.notifications.repository import NotificationRepository
+from src.notifications.store import NotificationStore, datetime_handler
+from src.notifications.sqlite_store import SQLiteNotificationRepository
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
-import os
+import json
+import base64
+import binascii
 
 router = APIRouter()
 security = HTTPBasic()
@@ -15,26 +22,116 @@ settings = Settings()
 # In a production environment, use a proper database
 NOTIFICATIONS_FILE = "notifications.json"
 
-async def load_notifications() -> List[Dict]:
-    """Load notifications from storage."""
+def create_notification_repository() -> NotificationRepository:
+    """Create the notification repository selected by NOTIFICATION_BACKEND."""
+    if settings.NOTIFICATION_BACKEND == "sqlite":
+        return SQLiteNotificationRepository(
+            settings.NOTIFICATION_DB_PATH,
+            migrate_from=NOTIFICATIONS_FILE if settings.NOTIFICATION_MIGRATE_JSON else None
+        )
+    if settings.NOTIFICATION_BACKEND == "json":
+        if settings.SERVER_WORKERS > 1:
+            # Every worker would append to the file on its own
+            raise ValueError("The json notification backend supports a single worker; set NOTIFICATION_BACKEND=sqlite")
+        # Notifications are loaded once and served from memory; writes go through to the file
+        return NotificationStore(NOTIFICATIONS_FILE)
+    raise ValueError(f"Unknown notification backend: {settings.NOTIFICATION_BACKEND}")
+
+notification_store = create_notification_repository()
+
+# Webhook responses hand notifications to this queue instead of waiting for the write
+notification_queue = WriteBehindQueue(
+    notification_store,
+    max_size=settings.NOTIFICATION_QUEUE_MAX_SIZE,
+    batch_size=settings.NOTIFICATION_FLUSH_BATCH_SIZE,
+    flush_interval_ms=settings.NOTIFICATION_FLUSH_INTERVAL_MS
+)
+register_stats_provider("notification_queue", notification_queue.stats)
+
+def create_alert_channels() -> List[AlertChannel]:
+    """Create an alert channel for each one configured with ALERT_* settings."""
+    channels: List[AlertChannel] = []
+    if settings.ALERT_SMTP_HOST:
+        channels.append(SMTPChannel(
+            settings.ALERT_SMTP_HOST,
+            settings.ALERT_SMTP_PORT,
+            settings.ALERT_EMAIL_FROM,
+            settings.ALERT_EMAIL_TO,
+            timeout=settings.ALERT_TIMEOUT,
+            starttls=settings.ALERT_SMTP_STARTTLS,
+            username=settings.ALERT_SMTP_USERNAME,
+            password=settings.ALERT_SMTP_PASSWORD,
+            concurrency=settings.ALERT_SMTP_CONCURRENCY
+        ))
+    if settings.ALERT_WEBHOOK_URL:
+        channels.append(WebhookChannel(
+            settings.ALERT_WEBHOOK_URL,
+            timeout=settings.ALERT_TIMEOUT,
+            format=settings.ALERT_WEBHOOK_FORMAT,
+            concurrency=settings.ALERT_WEBHOOK_CONCURRENCY
+        ))
+    if settings.ALERT_FILE_PATH:
+        channels.append(FileChannel(settings.ALERT_FILE_PATH))
+    return channels
+
+# Stored notifications are also sent to administrators from background tasks
+alert_dispatcher = AlertDispatcher(
+    create_alert_channels(),
+    max_queue_size=settings.ALERT_QUEUE_MAX_SIZE,
+    max_attempts=settings.ALERT_MAX_ATTEMPTS,
+    retry_base_delay_ms=settings.ALERT_RETRY_BASE_DELAY_MS,
+    digest_seconds=settings.ALERT_DIGEST_SECONDS
+)
+register_stats_provider("alerts", alert_dispatcher.stats)
+
+# Pagination limits for the notifications API
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 500
+if DEFAULT_PAGE_SIZE > MAX_PAGE_SIZE:
+    raise ValueError("DEFAULT_PAGE_SIZE must not exceed MAX_PAGE_SIZE")
+
+def encode_cursor(key: int, descending: bool) -> str:
+    """Encode the key of the last returned notification as an opaque cursor."""
+    raw = json.dumps({"k": key, "d": descending}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, descending: bool) -> int:
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Raises:
+        HTTPException: If the cursor is invalid or was issued for another sort order
+    """
     try:
-        if not os.path.exists(NOTIFICATIONS_FILE):
-            return []
-        async with aiofiles.open(NOTIFICATIONS_FILE, mode='r') as f:
-            content = await f.read()
-            return json.loads(content) if content else []
-    except Exception:
-        return []
-
-async def save_notifications(notifications: List[Dict]) -> None:
-    """Save notifications to storage."""
-    def datetime_handler(obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return str(obj)
-
-    async with aiofiles.open(NOTIFICATIONS_FILE, mode='w') as f:
-        await f.write(json.dumps(notifications, default=datetime_handler))
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, cursor_descending = int(data["k"]), bool(data["d"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_descending != descending:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return key
+
+def notification_filters(
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_risk_score: Optional[float] = Query(None, ge=0.0, le=1.0),
+    max_risk_score: Optional[float] = Query(None, ge=0.0, le=1.0),
+    customer_id: Optional[str] = None,
+    merchant_id: Optional[str] = None
+) -> NotificationQuery:
+    """Collect notification filters from query parameters."""
+    return NotificationQuery(
+        status=status,
+        since=since,
+        until=until,
+        min_risk_score=min_risk_score,
+        max_risk_score=max_risk_score,
+        customer_id=customer_id,
+        merchant_id=merchant_id
+    )
 
 async def send_notification(notification: AdminNotification) -> None:
     """
@@ -43,36 +140,55 @@ async def send_notification(notification: AdminNotification) -> None:
     Args:
         notification: AdminNotification object
     """
+    await send_notifications([notification])
+
+async def send_notifications(new_notifications: List[AdminNotification]) -> None:
+    """
+    Send several notifications to administrators with a single storage write.
+    
+    While the write-behind queue is running the notifications are only
+    queued; otherwise they are written before returning. Alerts are handed
+    to the alert dispatcher, which sends them in the background.
+    
+    Args:
+        new_notifications: AdminNotification objects to store
+    """
+    if not new_notifications:
+        return
+    
     try:
-        # Load existing notifications
-        notifications = await load_notifications()
-        
-        # Add new notification
-        notifications.append(notification.model_dump())
-        
-        # Save updated notifications
-        await save_notifications(notifications)
-        
-        # In a production environment, you would also want to:
-        # 1. Send email alerts
-        # 2. Trigger push notifications
-        # 3. Update admin dashboard
-        # 4. Log the notification in monitoring system
+        # Add new notifications to the store, appending them to the file
+        await notification_queue.put_many([n.model_dump() for n in new_notifications])
         
+        # Email, webhook and file alerts; never waits, even when a channel is backed up
+        alert_dispatcher.submit(new_notifications)
+    
     except Exception as e:
         raise Exception(f"Failed to send notification: {str(e)}")
 
 @router.get("/notifications", response_model=List[AdminNotification])
 async def get_notifications(
+    response: Response,
     credentials: HTTPBasicCredentials = Depends(security),
-    status: str = None
+    filters: NotificationQuery = Depends(notification_filters),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern=r"^(asc|desc)$")
 ) -> List[AdminNotification]:
     """
-    Get list of notifications with optional status filter.
+    Get list of notifications with optional filters and keyset pagination.
+    
+    Pages hold limit notifications (DEFAULT_PAGE_SIZE when not given). The
+    X-Next-Cursor response header carries the cursor for the next page when
+    more notifications match; GET /notifications/export streams them all.
     
     Args:
         credentials: Admin credentials
-        status: Optional status filter (pending, reviewed, dismissed)
+        filters: Status (pending, reviewed, dismissed), time range, risk score range,
+            customer and merchant filters
+        limit: Page size, at most MAX_PAGE_SIZE
+        cursor: Opaque cursor from a previous page
+        order: asc (oldest first) or desc (newest first)
     """
     # Verify admin credentials
     if not verify_admin_auth(credentials):
@@ -82,18 +198,60 @@ async def get_notifications(
             headers={"WWW-Authenticate": "Basic"}
         )
     
+    descending = order == "desc"
+    after = decode_cursor(cursor, descending) if cursor else None
+    page_size = limit or DEFAULT_PAGE_SIZE
+    
     try:
-        notifications = await load_notifications()
+        # Fetch one extra notification to know whether another page exists
+        page = await notification_store.query(filters, limit=page_size + 1, after=after, descending=descending)
+        if len(page) > page_size:
+            page = page[:page_size]
+            response.headers["X-Next-Cursor"] = encode_cursor(page[-1][0], descending)
         
-        # Apply status filter if provided
-        if status:
-            notifications = [n for n in notifications if n.get("status") == status]
-        
-        return [AdminNotification(**n) for n in notifications]
+        return [AdminNotification(**n) for _, n in page]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/notifications/export")
+async def export_notifications(
+    credentials: HTTPBasicCredentials = Depends(security),
+    filters: NotificationQuery = Depends(notification_filters),
+    order: str = Query("asc", pattern=r"^(asc|desc)$")
+) -> StreamingResponse:
+    """
+    Stream matching notifications as newline-delimited JSON.
+    
+    Notifications are read page by page and written out as stored, so large
+    exports never hold the full result or re-validate every model in memory.
+    
+    Args:
+        credentials: Admin credentials
+        filters: Notification filters (see get_notifications)
+        order: asc (oldest first) or desc (newest first)
+    """
+    if not verify_admin_auth(credentials):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    
+    descending = order == "desc"
+    
+    async def stream() -> AsyncIterator[bytes]:
+        after = None
+        while True:
+            page = await notification_store.query(filters, limit=EXPORT_PAGE_SIZE, after=after, descending=descending)
+            if page:
+                yield "".join(json.dumps(n, default=datetime_handler) + "\n" for _, n in page).encode()
+            if len(page) < EXPORT_PAGE_SIZE:
+                break
+            after = page[-1][0]
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.put("/notifications/{notification_id}/status")
 async def update_notification_status(
     notification_id: str,
@@ -120,20 +278,34 @@ async def update_notification_status(
         )
     
     try:
-        notifications = await load_notifications()
-        
-        # Find and update notification
-        for notification in notifications:
-            if notification.get("transaction_id") == notification_id:
-                notification["status"] = status
-                notification["updated_at"] = datetime.utcnow().isoformat()
-                await save_notifications(notifications)
-                return {"message": f"Notification status updated to {status}"}
-        
-        raise HTTPException(status_code=404, detail="Notification not found")
-        
+        # Find the notification through the transaction index and update it
+        updated = await notification_store.update_status(notification_id, status)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not updated:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    
+    return {"message": f"Notification status updated to {status}"}
+
+@router.get("/stats")
+async def get_stats(
+    credentials: HTTPBasicCredentials = Depends(security)
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the runtime counters reported by every registered component.
+    
+    Args:
+        credentials: Admin credentials
+    """
+    if not verify_admin_auth(credentials):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    
+    return collect_stats()
 
 def verify_admin_auth(credentials: HTTPBasicCredentials) -> bool:
     """Verify admin credentials."""
@@ -0,0 +1,361 @@
+from src.common.models import AdminNotification
+from src.notifications.templates import (
+    create_email_notification,
+    create_email_digest,
+    create_slack_notification,
+    create_slack_digest
+)
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from email.message import EmailMessage
+from datetime import datetime
+import asyncio
+import json
+import smtplib
+import aiofiles
+import httpx
+
+class AlertChannel(ABC):
+    """
+    Destination for administrator alerts.
+    
+    send() delivers one message, either a single alert or a digest of
+    several, and raises on failure so the dispatcher can retry it. At most
+    concurrency messages are sent to a channel at once.
+    """
+    
+    name = "channel"
+    
+    def __init__(self, concurrency: int = 1):
+        self.concurrency = max(1, concurrency)
+    
+    async def open(self) -> None:
+        """Acquire resources (connections, clients) before the first send."""
+    
+    async def close(self) -> None:
+        """Release resources acquired by open()."""
+    
+    @abstractmethod
+    async def send(self, notifications: List[AdminNotification]) -> None:
+        """
+        Deliver one message.
+        
+        Args:
+            notifications: The alert, or the alerts folded into a digest
+        
+        Raises:
+            Exception: If the message was not delivered
+        """
+
+def render_email(notifications: List[AdminNotification]) -> Dict[str, str]:
+    """Return the email subject and body for one alert or a digest."""
+    if len(notifications) == 1:
+        return create_email_notification(notifications[0])
+    return create_email_digest(notifications)
+
+class SMTPChannel(AlertChannel):
+    """
+    Email alerts sent through an SMTP relay.
+    
+    smtplib is blocking, so each message is sent from a worker thread over
+    its own connection.
+    """
+    
+    name = "smtp"
+    
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        sender: str,
+        recipients: Sequence[str],
+        timeout: float,
+        starttls: bool = False,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        concurrency: int = 2
+    ):
+        super().__init__(concurrency)
+        if not recipients:
+            raise ValueError("SMTP alerts need at least one recipient")
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.timeout = timeout
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+    
+    def build_message(self, notifications: List[AdminNotification]) -> EmailMessage:
+        """Build the email for one alert or a digest."""
+        content = render_email(notifications)
+        message = EmailMessage()
+        message["Subject"] = content["subject"]
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(content["body"])
+        return message
+    
+    async def send(self, notifications: List[AdminNotification]) -> None:
+        await asyncio.to_thread(self._send, self.build_message(notifications))
+    
+    def _send(self, message: EmailMessage) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+class WebhookChannel(AlertChannel):
+    """
+    Alerts POSTed as JSON to an HTTP endpoint.
+    
+    The slack format posts Block Kit messages, as accepted by Slack incoming
+    webhooks; the json format posts {"alerts": [...]} with the notification
+    fields.
+    """
+    
+    name = "webhook"
+    FORMATS = ("slack", "json")
+    
+    def __init__(
+        self,
+        url: str,
+        timeout: float,
+        format: str = "slack",
+        concurrency: int = 4,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        super().__init__(concurrency)
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown alert webhook format: {format}")
+        self.url = url
+        self.timeout = timeout
+        self.format = format
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    async def open(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, transport=self.transport)
+    
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def payload(self, notifications: List[AdminNotification]) -> Dict[str, Any]:
+        """Return the request body for one alert or a digest."""
+        if self.format == "json":
+            return {"alerts": [n.model_dump(mode="json") for n in notifications]}
+        if len(notifications) == 1:
+            return create_slack_notification(notifications[0])
+        return create_slack_digest(notifications)
+    
+    async def send(self, notifications: List[AdminNotification]) -> None:
+        await self.open()
+        response = await self._client.post(self.url, json=self.payload(notifications))
+        response.raise_for_status()
+
+class FileChannel(AlertChannel):
+    """
+    Alerts appended to a local file, one JSON line per message with the
+    email subject and the notifications.
+    """
+    
+    name = "file"
+    
+    def __init__(self, path: str):
+        # Lines are appended one at a time
+        super().__init__(concurrency=1)
+        self.path = path
+    
+    async def send(self, notifications: List[AdminNotification]) -> None:
+        line = json.dumps({
+            "sent_at": datetime.utcnow().isoformat(),
+            "subject": render_email(notifications)["subject"],
+            "alerts": [n.model_dump(mode="json") for n in notifications]
+        })
+        async with aiofiles.open(self.path, mode="a") as f:
+            await f.write(line + "\n")
+
+class _ChannelLane:
+    # Queue, tasks and counters of one channel
+    
+    def __init__(self, channel: AlertChannel):
+        self.channel = channel
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.messages = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.last_error: Optional[str] = None
+
+class AlertDispatcher:
+    """
+    Delivers administrator alerts to every channel from background tasks.
+    
+    submit() never waits: each channel has its own bounded queue, and alerts
+    arriving at a full queue are dropped and counted, so a burst of
+    high-risk transactions or a slow channel cannot hold up the webhook
+    path. Each channel is served by as many tasks as its concurrency allows.
+    Failed sends are retried up to max_attempts times with exponential
+    backoff.
+    
+    With digest_seconds > 0, each channel instead collects the alerts
+    arriving within digest_seconds of the first one and sends them as a
+    single message. close() sends pending digests at once and waits for
+    every queued alert.
+    
+    Alerts submitted while the dispatcher is not running are not delivered.
+    """
+    
+    def __init__(
+        self,
+        channels: Iterable[AlertChannel],
+        max_queue_size: int,
+        max_attempts: int = 3,
+        retry_base_delay_ms: float = 500.0,
+        digest_seconds: float = 0.0
+    ):
+        self.channels = list(channels)
+        names = [channel.name for channel in self.channels]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Alert channel names must be unique: {names}")
+        self.max_queue_size = max(1, max_queue_size)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = max(0.0, retry_base_delay_ms) / 1000
+        self.digest_seconds = max(0.0, digest_seconds)
+        self._lanes = [_ChannelLane(channel) for channel in self.channels]
+        self._flush: Optional[asyncio.Event] = None
+        self._running = False
+    
+    @property
+    def running(self) -> bool:
+        return self._running
+    
+    async def start(self) -> None:
+        """Open the channels and start their tasks."""
+        if self._running or not self._lanes:
+            return
+        loop = asyncio.get_running_loop()
+        self._flush = asyncio.Event()
+        for lane in self._lanes:
+            await lane.channel.open()
+            lane.queue = asyncio.Queue(maxsize=self.max_queue_size)
+            if self.digest_seconds:
+                lane.tasks = [loop.create_task(self._collect(lane))]
+            else:
+                lane.tasks = [loop.create_task(self._work(lane)) for _ in range(lane.channel.concurrency)]
+        self._running = True
+    
+    async def close(self) -> None:
+        """Send everything still queued, then stop the tasks and close the channels."""
+        if not self._running:
+            return
+        self._running = False
+        self._flush.set()
+        for lane in self._lanes:
+            await lane.queue.join()
+        for lane in self._lanes:
+            tasks, lane.tasks = lane.tasks, []
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await lane.channel.close()
+    
+    def submit(self, notifications: Iterable[AdminNotification]) -> int:
+        """
+        Queue alerts for every channel without waiting.
+        
+        Args:
+            notifications: AdminNotification objects to send
+        
+        Returns:
+            int: Number of alerts queued, summed over channels
+        """
+        if not self._running:
+            return 0
+        notifications = list(notifications)
+        queued = 0
+        for lane in self._lanes:
+            for notification in notifications:
+                try:
+                    lane.queue.put_nowait(notification)
+                    queued += 1
+                except asyncio.QueueFull:
+                    lane.dropped += 1
+        return queued
+    
+    async def _work(self, lane: _ChannelLane) -> None:
+        while True:
+            notification = await lane.queue.get()
+            try:
+                await self._send(lane, [notification])
+            finally:
+                lane.queue.task_done()
+    
+    async def _collect(self, lane: _ChannelLane) -> None:
+        while True:
+            batch = [await lane.queue.get()]
+            try:
+                # Wait out the interval unless close() asks for the digest now
+                await asyncio.wait_for(self._flush.wait(), timeout=self.digest_seconds)
+            except asyncio.TimeoutError:
+                pass
+            while True:
+                try:
+                    batch.append(lane.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._send(lane, batch)
+            finally:
+                for _ in batch:
+                    lane.queue.task_done()
+    
+    async def _send(self, lane: _ChannelLane, notifications: List[AdminNotification]) -> None:
+        lane.in_flight += 1
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    await lane.channel.send(notifications)
+                except Exception as e:
+                    lane.last_error = f"{type(e).__name__}: {e}"
+                    if attempt == self.max_attempts:
+                        lane.failed += len(notifications)
+                        return
+                    lane.retries += 1
+                    await asyncio.sleep(self.retry_base_delay * 2 ** (attempt - 1))
+                else:
+                    lane.messages += 1
+                    lane.sent += len(notifications)
+                    return
+        finally:
+            lane.in_flight -= 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and delivery counters per channel."""
+        stats: Dict[str, Any] = {
+            "running": self._running,
+            "channels": len(self._lanes),
+            "digest_seconds": self.digest_seconds
+        }
+        for lane in self._lanes:
+            name = lane.channel.name
+            stats.update({
+                f"{name}_depth": lane.queue.qsize() if lane.queue is not None else 0,
+                f"{name}_in_flight": lane.in_flight,
+                f"{name}_messages": lane.messages,
+                f"{name}_sent": lane.sent,
+                f"{name}_failed": lane.failed,
+                f"{name}_dropped": lane.dropped,
+                f"{name}_retries": lane.retries,
+                f"{name}_last_error": lane.last_error
+            })
+        return stats
@@ -0,0 +1,140 @@
+from src.common.metrics import stage_timer
+from src.notifications.repository import NotificationRepository
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindQueue:
+    """
+    Bounded in-process queue that persists notifications in the background.
+    
+    A single drain task group-commits up to batch_size notifications per
+    repository write, waiting at most flush_interval_ms for a batch to fill.
+    Producers wait when the queue is full. Failed writes are retried up to
+    max_attempts times; a batch that still fails is dropped and logged.
+    Before start() (and after close()) notifications are written directly.
+    """
+    
+    def __init__(
+        self,
+        repository: NotificationRepository,
+        max_size: int,
+        batch_size: int,
+        flush_interval_ms: float,
+        max_attempts: int = 3
+    ):
+        self.repository = repository
+        self.max_size = max(1, max_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000
+        self.max_attempts = max(1, max_attempts)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    async def start(self) -> None:
+        """Start the background drain task."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+    
+    async def close(self) -> None:
+        """Flush everything still queued and stop the drain task."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    
+    async def put_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Queue notifications for persistence, waiting while the queue is full.
+        
+        Args:
+            records: Notification dicts as produced by AdminNotification.model_dump()
+        """
+        if self._task is None:
+            with stage_timer("notification_persist"):
+                await self.repository.add_many(records)
+            return
+        for record in records:
+            await self._queue.put(record)
+    
+    def _take(self, batch: List[Dict[str, Any]]) -> None:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+    
+    async def _drain(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            self._take(batch)
+            if len(batch) < self.batch_size and self.flush_interval > 0:
+                # Give a burst a moment to fill the batch before committing
+                await asyncio.sleep(self.flush_interval)
+                self._take(batch)
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                with stage_timer("notification_persist"):
+                    await self.repository.add_many(batch)
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt == self.max_attempts:
+                    self.failed += len(batch)
+                    logger.error(
+                        "Dropped %d notifications after %d failed writes: %s (transactions: %s)",
+                        len(batch), attempt, e, ", ".join(str(r.get("transaction_id")) for r in batch)
+                    )
+                    return
+                await asyncio.sleep(0.05 * 2 ** (attempt - 1))
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.written += len(batch)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and flush counters."""
+        return {
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0
+        }
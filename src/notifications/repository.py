@@ -0,0 +1,100 @@
+from src.common.models import NotificationQuery
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+
+def epoch_seconds(value: Optional[datetime]) -> Optional[float]:
+    """Convert a query datetime to an epoch value (naive means UTC)."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def record_matches(query: NotificationQuery, record: Dict[str, Any], timestamp: float) -> bool:
+    """
+    Check a stored notification against the query filters.
+    
+    Args:
+        query: Notification filters
+        record: Notification dict
+        timestamp: Epoch timestamp of the notification
+    
+    Returns:
+        bool: True if the notification passes every filter
+    """
+    if query.status and record.get("status") != query.status:
+        return False
+    since, until = epoch_seconds(query.since), epoch_seconds(query.until)
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp >= until:
+        return False
+    risk_score = record.get("risk_score") or 0.0
+    if query.min_risk_score is not None and risk_score < query.min_risk_score:
+        return False
+    if query.max_risk_score is not None and risk_score > query.max_risk_score:
+        return False
+    details = record.get("transaction_details") or {}
+    if query.customer_id and (details.get("customer") or {}).get("id") != query.customer_id:
+        return False
+    if query.merchant_id and (details.get("merchant") or {}).get("id") != query.merchant_id:
+        return False
+    return True
+
+class NotificationRepository(ABC):
+    """
+    Storage interface for admin notifications.
+    
+    Records are plain notification dicts as produced by
+    AdminNotification.model_dump(). Implementations must be safe to call
+    from the event loop without blocking it for long.
+    """
+    
+    async def start(self) -> None:
+        """Open the storage. Called on application startup."""
+    
+    async def close(self) -> None:
+        """Release the storage. Called on application shutdown."""
+    
+    @abstractmethod
+    async def add_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Store new notifications."""
+    
+    @abstractmethod
+    async def query(
+        self,
+        query: NotificationQuery,
+        limit: int,
+        after: Optional[int] = None,
+        descending: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Keyset-paginated listing of notifications.
+        
+        Args:
+            query: Notification filters
+            limit: Maximum number of notifications to return
+            after: Key of the last notification of the previous page
+            descending: Return newest notifications first
+        
+        Returns:
+            List of (key, notification dict) pairs in the requested order
+        """
+    
+    @abstractmethod
+    async def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Return the first notification for a transaction, if any."""
+    
+    @abstractmethod
+    async def update_status(self, transaction_id: str, status: str) -> bool:
+        """
+        Update the status of the first notification for a transaction.
+        
+        Returns:
+            bool: True if a notification was updated, False if none was found
+        """
+    
+    @abstractmethod
+    async def count(self) -> int:
+        """Return the number of stored notifications."""
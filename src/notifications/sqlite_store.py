@@ -0,0 +1,225 @@
+from src.common.models import NotificationQuery
+from src.notifications.repository import NotificationRepository, epoch_seconds
+from src.notifications.store import datetime_handler, read_notifications_file, timestamp_key
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import json
+import os
+import sqlite3
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        timestamp REAL NOT NULL,
+        risk_score REAL NOT NULL,
+        customer_id TEXT,
+        merchant_id TEXT,
+        updated_at TEXT,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_notifications_transaction_id ON notifications (transaction_id)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications (status, id)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_timestamp ON notifications (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_customer ON notifications (customer_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_merchant ON notifications (merchant_id, id)"
+]
+
+# Statements are kept constant so sqlite3's statement cache reuses the prepared form
+INSERT_SQL = (
+    "INSERT INTO notifications "
+    "(transaction_id, status, timestamp, risk_score, customer_id, merchant_id, updated_at, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+UPDATE_STATUS_SQL = (
+    "UPDATE notifications SET status = ?, updated_at = ? WHERE id = "
+    "(SELECT id FROM notifications WHERE transaction_id = ? ORDER BY id LIMIT 1)"
+)
+GET_SQL = "SELECT data, status, updated_at FROM notifications WHERE transaction_id = ? ORDER BY id LIMIT 1"
+COUNT_SQL = "SELECT COUNT(*) FROM notifications"
+
+def record_to_row(record: Dict[str, Any]) -> Tuple:
+    """Convert a notification dict into an INSERT parameter tuple."""
+    data = json.loads(json.dumps(record, default=datetime_handler))
+    details = data.get("transaction_details") or {}
+    return (
+        data.get("transaction_id"),
+        data.get("status") or "pending",
+        timestamp_key(data.get("timestamp")),
+        float(data.get("risk_score") or 0.0),
+        (details.get("customer") or {}).get("id"),
+        (details.get("merchant") or {}).get("id"),
+        data.get("updated_at"),
+        json.dumps(data)
+    )
+
+def row_to_record(data: str, status: str, updated_at: Optional[str]) -> Dict[str, Any]:
+    """Rebuild a notification dict from a stored row."""
+    record = json.loads(data)
+    record["status"] = status
+    if updated_at is not None:
+        record["updated_at"] = updated_at
+    return record
+
+class SQLiteNotificationRepository(NotificationRepository):
+    """
+    Notification repository backed by SQLite in WAL mode.
+    
+    The connection lives on a dedicated single worker thread so queries never
+    run on the event loop, and WAL mode lets readers proceed while a write
+    is in progress. Indexes cover transaction_id, status and timestamp.
+    """
+    
+    def __init__(self, path: str, migrate_from: Optional[str] = None):
+        self.path = path
+        self.migrate_from = migrate_from
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def _connect(self) -> None:
+        # Runs on the worker thread, which owns the connection
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        self._conn = conn
+        if self.migrate_from:
+            self._import_json(self.migrate_from)
+    
+    def _import_json(self, json_path: str) -> int:
+        # Imports only into an empty database; the count is checked inside the
+        # write transaction so concurrently starting workers import once
+        if not os.path.exists(json_path):
+            return 0
+        return self._insert(read_notifications_file(json_path), only_if_empty=True)
+    
+    def _insert(self, records: Iterable[Dict[str, Any]], only_if_empty: bool = False) -> int:
+        rows = [record_to_row(record) for record in records]
+        if not rows:
+            return 0
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if only_if_empty and self._conn.execute(COUNT_SQL).fetchone()[0] > 0:
+                return 0
+            self._conn.executemany(INSERT_SQL, rows)
+        return len(rows)
+    
+    async def _run(self, func: Callable, *args) -> Any:
+        if self._executor is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def start(self) -> None:
+        """Open the database, creating the schema and importing the JSON file if new."""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notifications-db")
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+    
+    async def close(self) -> None:
+        """Close the database connection and its worker thread."""
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        
+        def _close() -> None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        
+        await asyncio.get_running_loop().run_in_executor(executor, _close)
+        executor.shutdown(wait=True)
+    
+    async def add_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Insert notifications in a single transaction."""
+        records = list(records)
+        if records:
+            await self._run(self._insert, records)
+    
+    def _query(self, query: NotificationQuery, limit: int, after: Optional[int], descending: bool) -> List[Tuple[int, Dict[str, Any]]]:
+        filters = [
+            ("status = ?", query.status or None),
+            ("timestamp >= ?", epoch_seconds(query.since)),
+            ("timestamp < ?", epoch_seconds(query.until)),
+            ("risk_score >= ?", query.min_risk_score),
+            ("risk_score <= ?", query.max_risk_score),
+            ("customer_id = ?", query.customer_id or None),
+            ("merchant_id = ?", query.merchant_id or None),
+            ("id < ?" if descending else "id > ?", after)
+        ]
+        clauses = [clause for clause, value in filters if value is not None]
+        params = [value for _, value in filters if value is not None]
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(
+            f"SELECT id, data, status, updated_at FROM notifications{where} "
+            f"ORDER BY id {'DESC' if descending else 'ASC'} LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [(row[0], row_to_record(*row[1:])) for row in rows]
+    
+    async def query(
+        self,
+        query: NotificationQuery,
+        limit: int,
+        after: Optional[int] = None,
+        descending: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Keyset-paginated listing of notifications keyed by row id."""
+        return await self._run(self._query, query, limit, after, descending)
+    
+    def _get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(GET_SQL, (transaction_id,)).fetchone()
+        return row_to_record(*row) if row else None
+    
+    async def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Return the first notification for a transaction, if any."""
+        return await self._run(self._get, transaction_id)
+    
+    def _update_status(self, transaction_id: str, status: str) -> bool:
+        cursor = self._conn.execute(
+            UPDATE_STATUS_SQL, (status, datetime.utcnow().isoformat(), transaction_id)
+        )
+        return cursor.rowcount > 0
+    
+    async def update_status(self, transaction_id: str, status: str) -> bool:
+        """Update the status of the first notification for a transaction."""
+        return await self._run(self._update_status, transaction_id, status)
+    
+    def _count(self) -> int:
+        return self._conn.execute(COUNT_SQL).fetchone()[0]
+    
+    async def count(self) -> int:
+        """Return the number of stored notifications."""
+        return await self._run(self._count)
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    """
+    One-shot migration of the JSON notifications file into a SQLite database.
+    
+    Args:
+        json_path: Path to the existing notifications JSON file
+        db_path: Path to the SQLite database to create or fill
+    
+    Returns:
+        int: Number of notifications imported (0 if the database already had data)
+    """
+    repository = SQLiteNotificationRepository(db_path)
+    repository._connect()
+    try:
+        return repository._import_json(json_path)
+    finally:
+        repository._conn.close()
+
+if __name__ == "__main__":
+    import sys
+    
+    source = sys.argv[1] if len(sys.argv) > 1 else "notifications.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "notifications.db"
+    print(f"Imported {migrate_json_to_sqlite(source, target)} notifications into {target}")
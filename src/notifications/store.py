@@ -0,0 +1,339 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
+import bisect
+import json
+import os
+import threading
+from src.common.models import NotificationQuery
+from src.notifications.repository import NotificationRepository, record_matches
+
+def datetime_handler(obj: Any) -> Any:
+    """JSON fallback serializer matching the notifications file format."""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+def timestamp_key(value: Any) -> float:
+    """Convert a stored ISO timestamp into a sortable epoch value (naive means UTC)."""
+    try:
+        dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return 0.0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def status_log_path(path: str) -> str:
+    """Path of the append-only status change log kept next to a notifications file."""
+    return f"{path}.status"
+
+def _read_status_log(path: str) -> List[Dict[str, Any]]:
+    try:
+        with open(status_log_path(path), "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    changes = []
+    for line in lines:
+        try:
+            change = json.loads(line)
+        except ValueError:
+            # A line cut short by a crash mid-append
+            continue
+        if isinstance(change, dict) and "transaction_id" in change and "status" in change:
+            changes.append(change)
+    return changes
+
+def apply_status_changes(records: List[Dict[str, Any]], changes: Iterable[Dict[str, Any]]) -> None:
+    """Apply status change log entries to the first notification of each transaction."""
+    first: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        first.setdefault(record.get("transaction_id"), record)
+    for change in changes:
+        record = first.get(change["transaction_id"])
+        if record is not None:
+            record["status"] = change["status"]
+            record["updated_at"] = change.get("updated_at")
+
+def read_notifications_file(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a notifications file with its status change log applied.
+    
+    Args:
+        path: Path to the notifications JSON file
+    
+    Returns:
+        List of notification dicts (empty if the file is missing)
+    
+    Raises:
+        ValueError: If the file is not valid JSON
+    """
+    try:
+        with open(path, "r") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return []
+    records = json.loads(content) if content else []
+    apply_status_changes(records, _read_status_log(path))
+    return records
+
+class NotificationStore(NotificationRepository):
+    """
+    In-memory notification store backed by the JSON notifications file.
+    
+    The file is parsed once and then served from memory, with indexes by
+    transaction ID and status. New notifications are appended to the end of
+    the JSON array in place. Status changes are appended as JSON
+    lines to a status log next to the file (status_log_path) and replayed on
+    load; compact() folds the log into the file, which happens once
+    compact_every changes have been logged and on close(). If either file is
+    changed by anyone else (detected with a stat check) the store reloads.
+    """
+    
+    def __init__(self, path: str, compact_every: int = 1000):
+        self.path = path
+        self.log_path = status_log_path(path)
+        self.compact_every = max(1, compact_every)
+        self._logged_changes = 0
+        self._loaded = False
+        self._signature: Optional[Tuple[Any, Any]] = None
+        self._pending_writes = 0
+        self._persisted_upto = 0
+        self._write_lock = threading.Lock()
+        # Held while a write and the matching in-memory change are in progress
+        self._lock = asyncio.Lock()
+        self._reset()
+    
+    def _reset(self) -> None:
+        self._records: List[Dict[str, Any]] = []
+        self._serialized: List[str] = []
+        self._by_transaction: Dict[str, List[int]] = {}
+        self._by_status: Dict[str, List[int]] = {}
+    
+    @staticmethod
+    def _stat_file(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    
+    def _stat(self) -> Tuple[Any, Any]:
+        return (self._stat_file(self.path), self._stat_file(self.log_path))
+    
+    def _index(self, seq: int, record: Dict[str, Any]) -> None:
+        self._by_transaction.setdefault(record.get("transaction_id"), []).append(seq)
+        bisect.insort(self._by_status.setdefault(record.get("status"), []), seq)
+    
+    def _add_record(self, record: Dict[str, Any], serialized: str) -> None:
+        seq = len(self._records)
+        self._records.append(record)
+        self._serialized.append(serialized)
+        self._index(seq, record)
+    
+    def load(self) -> None:
+        """(Re)load all notifications from the file into memory."""
+        with self._write_lock:
+            self._reset()
+            self._signature = self._stat()
+            try:
+                with open(self.path, "r") as f:
+                    content = f.read()
+                records = json.loads(content) if content else []
+            except (OSError, ValueError):
+                records = []
+            changes = _read_status_log(self.path)
+            apply_status_changes(records, changes)
+            self._logged_changes = len(changes)
+            for record in records:
+                self._add_record(record, json.dumps(record, default=datetime_handler))
+            self._persisted_upto = len(self._records)
+            self._loaded = True
+    
+    async def start(self) -> None:
+        """Load all notifications into memory. Called on application startup."""
+        self.load()
+    
+    async def close(self) -> None:
+        """Fold the status log into the file. Called on application shutdown."""
+        if self._loaded and self._logged_changes:
+            await self.compact()
+    
+    def ensure_fresh(self) -> None:
+        """Load on first use and reload if the file was changed externally."""
+        if not self._loaded:
+            self.load()
+        elif self._pending_writes == 0 and self._stat() != self._signature:
+            self.load()
+    
+    def _append_sync(self, entries: List[Tuple[int, str]]) -> None:
+        with self._write_lock:
+            # Skip records already written by compaction
+            serialized = [text for seq, text in entries if seq >= self._persisted_upto]
+            if not serialized:
+                return
+            chunk = ", ".join(serialized)
+            try:
+                f = open(self.path, "r+b")
+            except FileNotFoundError:
+                f = None
+            if f is None or os.fstat(f.fileno()).st_size == 0:
+                if f is not None:
+                    f.close()
+                with open(self.path, "wb") as out:
+                    out.write(f"[{chunk}]".encode())
+            else:
+                with f:
+                    # Step back over trailing whitespace to the closing bracket
+                    end = f.seek(0, os.SEEK_END)
+                    pos = end
+                    while pos > 0:
+                        f.seek(pos - 1)
+                        char = f.read(1)
+                        if not char.isspace():
+                            break
+                        pos -= 1
+                    if char != b"]":
+                        raise ValueError("Notifications file is not a JSON array")
+                    f.seek(pos - 2 if pos >= 2 else 0)
+                    empty = f.read(2) == b"[]"
+                    f.seek(pos - 1)
+                    f.write(f"{'' if empty else ', '}{chunk}]".encode())
+                    f.truncate()
+            self._signature = self._stat()
+    
+    def _log_status_sync(self, line: str) -> None:
+        with self._write_lock:
+            with open(self.log_path, "a") as f:
+                f.write(line + "\n")
+            self._signature = self._stat()
+    
+    def _compact_sync(self) -> None:
+        with self._write_lock:
+            count = len(self._serialized)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write("[" + ", ".join(self._serialized[:count]) + "]")
+            self._persisted_upto = count
+            os.replace(tmp_path, self.path)
+            # Replaying entries that survive a crash here is harmless; they are already applied
+            try:
+                os.remove(self.log_path)
+            except FileNotFoundError:
+                pass
+            self._signature = self._stat()
+    
+    async def compact(self) -> None:
+        """Rewrite the file with the current statuses and empty the status log."""
+        async with self._lock:
+            await self._compact()
+    
+    async def _compact(self) -> None:
+        # Callers hold self._lock
+        self._logged_changes = 0
+        await self._write(self._compact_sync)
+    
+    async def _write(self, func, *args) -> None:
+        self._pending_writes += 1
+        try:
+            await asyncio.to_thread(func, *args)
+        finally:
+            self._pending_writes -= 1
+    
+    async def add_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Append notifications to the file, then add them to memory.
+        
+        A failed write leaves the store unchanged, so the batch can be retried.
+        
+        Args:
+            records: Notification dicts as produced by AdminNotification.model_dump()
+        """
+        self.ensure_fresh()
+        serialized = [json.dumps(record, default=datetime_handler) for record in records]
+        if not serialized:
+            return
+        async with self._lock:
+            await self._write(self._append_sync, list(enumerate(serialized, len(self._records))))
+            for text in serialized:
+                self._add_record(json.loads(text), text)
+    
+    async def query(
+        self,
+        query: NotificationQuery,
+        limit: int,
+        after: Optional[int] = None,
+        descending: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Keyset-paginated listing of notifications. Keys are insertion positions;
+        a status filter walks the status index instead of every record.
+        """
+        self.ensure_fresh()
+        seqs = self._by_status.get(query.status, []) if query.status else range(len(self._records))
+        
+        if descending:
+            end = bisect.bisect_left(seqs, after) if after is not None else len(seqs)
+            candidates = (seqs[i] for i in range(end - 1, -1, -1))
+        else:
+            start = bisect.bisect_right(seqs, after) if after is not None else 0
+            candidates = (seqs[i] for i in range(start, len(seqs)))
+        
+        results = []
+        for seq in candidates:
+            record = self._records[seq]
+            if record_matches(query, record, timestamp_key(record.get("timestamp"))):
+                results.append((seq, record))
+                if len(results) >= limit:
+                    break
+        return results
+    
+    async def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Return the first notification for a transaction, if any."""
+        self.ensure_fresh()
+        seqs = self._by_transaction.get(transaction_id)
+        return self._records[seqs[0]] if seqs else None
+    
+    async def update_status(self, transaction_id: str, status: str) -> bool:
+        """
+        Update the status of the first notification for a transaction.
+        
+        Args:
+            transaction_id: Transaction ID of the notification
+            status: New status
+        
+        Returns:
+            bool: True if a notification was updated, False if none was found
+        """
+        self.ensure_fresh()
+        async with self._lock:
+            seqs = self._by_transaction.get(transaction_id)
+            if not seqs:
+                return False
+            
+            seq = seqs[0]
+            updated_at = datetime.utcnow().isoformat()
+            change = {"transaction_id": transaction_id, "status": status, "updated_at": updated_at}
+            # Log first, so a failed write leaves the notification unchanged
+            await self._write(self._log_status_sync, json.dumps(change))
+            
+            record = self._records[seq]
+            old_seqs = self._by_status.get(record.get("status"), [])
+            index = bisect.bisect_left(old_seqs, seq)
+            if index < len(old_seqs) and old_seqs[index] == seq:
+                old_seqs.pop(index)
+            record["status"] = status
+            record["updated_at"] = updated_at
+            bisect.insort(self._by_status.setdefault(status, []), seq)
+            self._serialized[seq] = json.dumps(record, default=datetime_handler)
+            
+            self._logged_changes += 1
+            if self._logged_changes >= self.compact_every:
+                await self._compact()
+        return True
+    
+    async def count(self) -> int:
+        """Return the number of stored notifications."""
+        self.ensure_fresh()
+        return len(self._records)
@@ -1,7 +1,10 @@
 from src.common.models import Transaction, RiskAnalysis, AdminNotification
-from typing import Dict, Any
+from typing import Dict, Any, List
 from datetime import datetime
 
+# Transactions listed in a Slack digest before it is cut short
+SLACK_DIGEST_MAX_LINES = 40
+
 def format_transaction_details(transaction: Transaction) -> str:
     """
     Format transaction details for notification.
@@ -143,4 +146,76 @@ def create_slack_notification(notification: AdminNotification) -> Dict[str, Any]
                 }
             }
         ]
-    }
\ No newline at end of file
+    }
+
+def create_email_digest(notifications: List[AdminNotification]) -> Dict[str, str]:
+    """
+    Create email content summarizing several notifications.
+    
+    Args:
+        notifications: AdminNotification objects, oldest first
+        
+    Returns:
+        Dict containing email subject and body
+    """
+    highest = max(n.risk_score for n in notifications)
+    subject = f"{len(notifications)} High Risk Transaction Alerts - Highest Score {highest:.2f}"
+    
+    lines = "\n".join(
+        f"    - {n.transaction_id}: score {n.risk_score:.2f}, "
+        f"{n.transaction_details.amount} {n.transaction_details.currency}, "
+        f"{', '.join(n.risk_factors) or 'no risk factors'}"
+        for n in notifications
+    )
+    body = f"""
+    {len(notifications)} HIGH RISK TRANSACTIONS DETECTED
+    
+{lines}
+    
+    Please review these transactions in the admin dashboard.
+    
+    Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}
+    """
+    
+    return {
+        "subject": subject,
+        "body": body
+    }
+
+def create_slack_digest(notifications: List[AdminNotification]) -> Dict[str, Any]:
+    """
+    Create a Slack message summarizing several notifications.
+    
+    Args:
+        notifications: AdminNotification objects, oldest first
+        
+    Returns:
+        Dict containing Slack message format
+    """
+    highest = max(n.risk_score for n in notifications)
+    lines = [
+        f"• *{n.transaction_id}* - {n.risk_score:.2f} - "
+        f"{n.transaction_details.amount} {n.transaction_details.currency}"
+        for n in notifications[:SLACK_DIGEST_MAX_LINES]
+    ]
+    if len(notifications) > SLACK_DIGEST_MAX_LINES:
+        # Slack truncates section text beyond 3000 characters
+        lines.append(f"…and {len(notifications) - SLACK_DIGEST_MAX_LINES} more")
+    return {
+        "blocks": [
+            {
+                "type": "header",
+                "text": {
+                    "type": "plain_text",
+                    "text": f"🚨 {len(notifications)} High Risk Transactions - Highest Score {highest:.2f}"
+                }
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": "\n".join(lines)
+                }
+            }
+        ]
+    }
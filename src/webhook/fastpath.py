@@ -0,0 +1,97 @@
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import ValidationError
+from src.common.metrics import stage_seconds, stage_timer
+from src.common.models import Transaction
+from typing import Any, Callable, Optional
+from datetime import datetime, timezone
+import time
+
+def _valid_ipv4(address: str) -> bool:
+    # The model pattern guarantees four groups of 1-3 digits, but pydantic's \d
+    # also matches non-ASCII digits; ipaddress rejects those, octets over 255
+    # and leading zeros
+    if not address.isascii():
+        return False
+    return all(part == "0" or (part[0] != "0" and int(part) <= 255) for part in address.split("."))
+
+def fast_decode_transaction(body: bytes) -> Optional[Transaction]:
+    """
+    Decode and validate a webhook body in one pass.
+    
+    pydantic-core parses the raw JSON straight into the model, so the body is
+    never materialized as a dict, and only the checks validate_transaction_data
+    makes beyond the model's own constraints are repeated here. Returns a
+    Transaction only if the body would pass both the Transaction model and
+    validate_transaction_data; otherwise returns None so the caller can take
+    the regular path and report the exact errors.
+    
+    Args:
+        body: Raw request body
+    
+    Returns:
+        Optional[Transaction]: The transaction, or None if it needs the regular path
+    """
+    try:
+        transaction = Transaction.model_validate_json(body)
+    except ValidationError:
+        return None
+    # Naive timestamps cannot be compared to now and fail validation
+    timestamp = transaction.timestamp
+    if timestamp.tzinfo is None or timestamp > datetime.now(timezone.utc):
+        return None
+    if not _valid_ipv4(transaction.customer.ip_address):
+        return None
+    return transaction
+
+def is_json_request(request: Request) -> bool:
+    """Return True if the request declares a plain JSON body."""
+    content_type = request.headers.get("content-type", "")
+    return content_type.split(";", 1)[0].strip().lower() == "application/json"
+
+class FastTransactionRoute(APIRoute):
+    """
+    Route that skips FastAPI's body decoding and dependency resolution for
+    transactions that are certainly valid.
+    
+    Subclasses implement handle_fast, which receives the pre-validated
+    transaction and returns a Response, or None to fall back. Every request
+    the fast path is not sure about goes through the regular route handler,
+    so error responses are unchanged.
+    
+    The fast decode is timed as the decode_fast stage. Endpoints call
+    finish_regular_decode to time FastAPI's decoding as decode_regular.
+    """
+    
+    async def handle_fast(self, request: Request, transaction: Transaction) -> Optional[Response]:
+        return None
+    
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        regular_handler = super().get_route_handler()
+        
+        async def route_handler(request: Request) -> Response:
+            if request.method == "POST" and is_json_request(request):
+                # The body is cached on the request, so the regular path does not read it twice
+                body = await request.body()
+                with stage_timer("decode_fast"):
+                    transaction = fast_decode_transaction(body)
+                if transaction is not None:
+                    response = await self.handle_fast(request, transaction)
+                    if response is not None:
+                        return response
+            request.state.decode_started = time.perf_counter()
+            return await regular_handler(request)
+        
+        return route_handler
+
+def finish_regular_decode(request: Request) -> None:
+    """
+    Record the decode_regular stage: the time FastAPI took to read, parse and
+    validate the body and resolve dependencies before calling the endpoint.
+    
+    Args:
+        request: Request handed to the regular route handler by FastTransactionRoute
+    """
+    started = getattr(request.state, "decode_started", None)
+    if started is not None:
+        stage_seconds.labels("decode_regular").observe(time.perf_counter() - started)
@@ -0,0 +1,203 @@
+from src.common.shared_state import SharedState
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import math
+import time
+
+class IdempotencyStore:
+    """
+    Bounded in-memory record of recent webhook deliveries, keyed by
+    transaction ID.
+    
+    The first delivery of a key runs its handler; later deliveries get the
+    stored result instead. Deliveries arriving while the first is still
+    running wait for it rather than running the handler again. Failed
+    deliveries are not stored, so a retry after an error is processed
+    normally. Results expire ttl_seconds after they complete and the least
+    recently delivered keys are dropped once max_size is reached.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl_seconds
+        self.clock = clock
+        # Value is the pending Future while the first delivery runs, then its result
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.processed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.evictions = 0
+    
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+    
+    def _store(self, key: str, expires_at: float, value: Any) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def run(self, key: str, handler: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run a delivery's handler once per key.
+        
+        Args:
+            key: Delivery key, the transaction ID
+            handler: Coroutine function producing the delivery's result
+        
+        Returns:
+            Tuple of the result and whether it was replayed from an earlier
+            delivery rather than produced by this call
+        
+        Raises:
+            Exception: Whatever the handler raised, for the first delivery
+                and for deliveries waiting on it
+        """
+        while True:
+            found, value = self._lookup(key)
+            if not found:
+                break
+            if not isinstance(value, asyncio.Future):
+                self.replayed += 1
+                return value, True
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(value), True
+            except asyncio.CancelledError:
+                if not value.cancelled():
+                    raise
+                # The first delivery was cancelled; run the handler here instead
+        
+        pending = asyncio.get_running_loop().create_future()
+        self._store(key, math.inf, pending)
+        try:
+            result, replayed = await self._deliver(key, handler)
+        except BaseException as e:
+            if self._entries.get(key, (None, None))[1] is pending:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(e)
+                # Retrieved here so an error nobody waited for is not logged
+                pending.exception()
+            raise
+        
+        pending.set_result(result)
+        if replayed:
+            self.replayed += 1
+        else:
+            self.processed += 1
+        self._store(key, self.clock() + self.ttl, result)
+        return result, replayed
+    
+    async def _deliver(self, key: str, handler: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        # First delivery of a key in this process
+        return await handler(), False
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored result for a key, or None if unknown, expired or still running."""
+        found, value = self._lookup(key)
+        if not found or isinstance(value, asyncio.Future):
+            return None
+        return value
+    
+    def clear(self) -> None:
+        """Forget all deliveries and reset counters."""
+        self._entries.clear()
+        self.processed = self.replayed = self.coalesced = self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return delivery counters."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "processed": self.processed,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions
+        }
+
+class SharedIdempotencyStore(IdempotencyStore):
+    """
+    IdempotencyStore that also deduplicates across worker processes through
+    SharedState.
+    
+    The first process to see a key claims it with a pending marker and
+    replaces the marker with the encoded result once the handler is done;
+    a failed handler deletes it. Other processes poll the shared entry
+    until the result appears. A claim lasts claim_seconds and is renewed
+    every third of that while the handler runs, so a slow handler keeps it
+    and a later delivery only takes over once the owner has died.
+    Deliveries within one process are coalesced as usual before reaching
+    the shared entry.
+    
+    Args:
+        encode: Converts a result to a string for the shared entry
+        decode: Rebuilds a result from its string
+        claim_seconds: Seconds a claim outlives its last renewal
+        poll_interval: Seconds between checks of a pending shared entry
+    """
+    
+    NAMESPACE = "webhook_deliveries"
+    PENDING = ""
+    
+    def __init__(
+        self,
+        shared: SharedState,
+        max_size: int,
+        ttl_seconds: float,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+        claim_seconds: float = 60.0,
+        poll_interval: float = 0.05,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        super().__init__(max_size, ttl_seconds, clock)
+        self.shared = shared
+        self.encode = encode
+        self.decode = decode
+        self.claim_seconds = claim_seconds
+        self.poll_interval = poll_interval
+        shared.set_max_size(self.NAMESPACE, max_size)
+    
+    async def _deliver(self, key: str, handler: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        while not self.shared.add(self.NAMESPACE, key, self.PENDING, self.claim_seconds):
+            entry = self.shared.get(self.NAMESPACE, key)
+            if entry is not None and entry[0] != self.PENDING:
+                return self.decode(entry[0]), True
+            if entry is not None:
+                # Another process is handling this key
+                await asyncio.sleep(self.poll_interval)
+        renewal = asyncio.ensure_future(self._renew(key))
+        try:
+            result = await handler()
+        except BaseException:
+            self.shared.delete(self.NAMESPACE, key)
+            raise
+        finally:
+            renewal.cancel()
+        self.shared.set(self.NAMESPACE, key, self.encode(result), self.ttl)
+        return result, False
+    
+    async def _renew(self, key: str) -> None:
+        while True:
+            await asyncio.sleep(self.claim_seconds / 3)
+            if not self.shared.renew(self.NAMESPACE, key, self.PENDING, self.claim_seconds):
+                return
+    
+    def clear(self) -> None:
+        """Forget all deliveries, shared ones included, and reset counters."""
+        super().clear()
+        self.shared.clear(self.NAMESPACE)
@@ -0,0 +1,176 @@
+from src.common.models import Transaction, RiskAnalysis, AnalysisResult
+from src.webhook.results import AnalysisResultStore
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import uuid
+import httpx
+
+# Job ID, transaction and optional callback URL
+AnalysisJob = Tuple[str, Transaction, Optional[str]]
+
+class AnalysisJobQueue:
+    """
+    Bounded queue of transactions analyzed by a pool of background workers.
+    
+    Each job's progress (queued, processing, final or failed) is recorded in
+    the result store, and the final result is POSTed to the job's callback
+    URL if it has one. check_callback, if given, returns a reason to refuse
+    a callback URL (or None to POST to it) and the checked address to
+    connect to. The POST goes to that address, with the URL's host kept
+    for the Host header and TLS, so the host is not resolved a second time
+    (a DNS rebinding host cannot swap in another address after the check).
+    Redirects are not followed. close() lets the workers finish every
+    queued job.
+    """
+    
+    def __init__(
+        self,
+        analyze: Callable[[Transaction], Awaitable[RiskAnalysis]],
+        results: AnalysisResultStore,
+        on_result: Callable[[Transaction, RiskAnalysis], Awaitable[None]],
+        max_size: int,
+        workers: int,
+        callback_timeout: float,
+        callback_transport: Optional[httpx.AsyncBaseTransport] = None,
+        check_callback: Optional[Callable[[str], Awaitable[Tuple[Optional[str], Optional[str]]]]] = None
+    ):
+        self.analyze = analyze
+        self.results = results
+        self.on_result = on_result
+        self.max_size = max(1, max_size)
+        self.worker_count = max(1, workers)
+        self.callback_timeout = callback_timeout
+        self.callback_transport = callback_transport
+        self.check_callback = check_callback
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._callback_client: Optional[httpx.AsyncClient] = None
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.on_result_failed = 0
+        self.callbacks_sent = 0
+        self.callbacks_failed = 0
+        self.callbacks_refused = 0
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+    
+    async def start(self) -> None:
+        """Start the worker pool."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._callback_client = httpx.AsyncClient(
+            timeout=self.callback_timeout,
+            transport=self.callback_transport
+        )
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._work()) for _ in range(self.worker_count)]
+    
+    async def close(self) -> None:
+        """Finish all queued jobs and stop the worker pool."""
+        if not self._workers:
+            return
+        await self._queue.join()
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self._callback_client.aclose()
+        self._callback_client = None
+    
+    def submit(self, transaction: Transaction, callback_url: Optional[str] = None) -> str:
+        """
+        Queue a transaction for analysis without waiting for it.
+        
+        Args:
+            transaction: Transaction to analyze
+            callback_url: Optional URL to POST the result to
+        
+        Returns:
+            str: Job ID
+        
+        Raises:
+            RuntimeError: If the worker pool is not running
+            asyncio.QueueFull: If the queue is at capacity
+        """
+        if not self._workers:
+            raise RuntimeError("Analysis workers are not running")
+        job_id = uuid.uuid4().hex
+        try:
+            self._queue.put_nowait((job_id, transaction, callback_url))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.submitted += 1
+        self.results.record(transaction.transaction_id, "queued", job_id=job_id)
+        return job_id
+    
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            finally:
+                self._queue.task_done()
+    
+    async def _process(self, job: AnalysisJob) -> None:
+        job_id, transaction, callback_url = job
+        self.results.record(transaction.transaction_id, "processing", job_id=job_id)
+        try:
+            analysis = await self.analyze(transaction)
+        except Exception as e:
+            result = self.results.record(transaction.transaction_id, "failed", job_id=job_id, error=str(e))
+            self.failed += 1
+        else:
+            result = self.results.record(transaction.transaction_id, "final", analysis, job_id=job_id)
+            self.completed += 1
+            try:
+                await self.on_result(transaction, analysis)
+            except Exception:
+                # The verdict stands even if notifying administrators failed
+                self.on_result_failed += 1
+        if callback_url:
+            await self._deliver(callback_url, result)
+    
+    async def _deliver(self, callback_url: str, result: AnalysisResult) -> None:
+        address = None
+        if self.check_callback is not None:
+            error, address = await self.check_callback(callback_url)
+            if error is not None:
+                self.callbacks_refused += 1
+                return
+        url = httpx.URL(callback_url)
+        headers: Dict[str, str] = {}
+        extensions: Dict[str, str] = {}
+        if address is not None:
+            headers["Host"] = url.netloc.decode("ascii")
+            extensions["sni_hostname"] = url.host
+            url = url.copy_with(host=address)
+        try:
+            response = await self._callback_client.post(
+                url, json=result.model_dump(mode="json"), headers=headers, extensions=extensions
+            )
+            response.raise_for_status()
+            self.callbacks_sent += 1
+        except httpx.HTTPError:
+            self.callbacks_failed += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Return queue depth, worker count and job counters."""
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "workers": len(self._workers),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "on_result_failed": self.on_result_failed,
+            "callbacks_sent": self.callbacks_sent,
+            "callbacks_failed": self.callbacks_failed,
+            "callbacks_refused": self.callbacks_refused
+        }
@@ -0,0 +1,126 @@
+from src.common.models import AnalysisResult, RiskAnalysis
+from src.common.shared_state import SharedState
+from typing import Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import time
+
+class AnalysisResultStore:
+    """
+    Bounded in-memory record of queued, provisional and final risk verdicts,
+    keyed by transaction ID. Entries expire after ttl_seconds and the least
+    recently updated entries are dropped once max_size is reached.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, AnalysisResult]]" = OrderedDict()
+        self.recorded: Dict[str, int] = {}
+        self.evictions = 0
+    
+    def record(
+        self,
+        transaction_id: str,
+        status: str,
+        analysis: Optional[RiskAnalysis] = None,
+        job_id: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> AnalysisResult:
+        """
+        Record the current state of a transaction's analysis.
+        
+        Args:
+            transaction_id: Transaction ID
+            status: queued, processing, provisional, final or failed
+            analysis: Risk analysis for provisional and final results
+            job_id: Async job ID; kept from the previous entry if omitted
+            error: Failure detail for failed results
+        
+        Returns:
+            The recorded AnalysisResult
+        """
+        previous = self.get(transaction_id)
+        if job_id is None and previous is not None:
+            job_id = previous.job_id
+        result = AnalysisResult(
+            transaction_id=transaction_id,
+            job_id=job_id,
+            status=status,
+            error=error,
+            updated_at=datetime.utcnow(),
+            **(analysis.model_dump() if analysis is not None else {})
+        )
+        self.recorded[status] = self.recorded.get(status, 0) + 1
+        self._entries[transaction_id] = (self.clock() + self.ttl, result)
+        self._entries.move_to_end(transaction_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return result
+    
+    def get(self, transaction_id: str) -> Optional[AnalysisResult]:
+        """Return the latest result for a transaction, or None if unknown or expired."""
+        entry = self._entries.get(transaction_id)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= self.clock():
+            del self._entries[transaction_id]
+            return None
+        return result
+    
+    def clear(self) -> None:
+        """Drop all results and reset counters."""
+        self._entries.clear()
+        self.recorded = {}
+        self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return result store counters."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "evictions": self.evictions,
+            **{f"recorded_{status}": count for status, count in sorted(self.recorded.items())}
+        }
+
+class SharedAnalysisResultStore(AnalysisResultStore):
+    """
+    AnalysisResultStore kept in SharedState, so a result recorded by one
+    worker process can be fetched from any of them.
+    
+    Reads always go to the shared entry, since another process may have
+    updated it; the local entries only back the stats.
+    """
+    
+    NAMESPACE = "analysis_results"
+    
+    def __init__(self, shared: SharedState, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        super().__init__(max_size, ttl_seconds, clock)
+        self.shared = shared
+        shared.set_max_size(self.NAMESPACE, max_size)
+    
+    def record(
+        self,
+        transaction_id: str,
+        status: str,
+        analysis: Optional[RiskAnalysis] = None,
+        job_id: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> AnalysisResult:
+        """Record the current state of a transaction's analysis for every process."""
+        result = super().record(transaction_id, status, analysis, job_id, error)
+        self.shared.set(self.NAMESPACE, transaction_id, result.model_dump_json(), self.ttl)
+        return result
+    
+    def get(self, transaction_id: str) -> Optional[AnalysisResult]:
+        """Return the latest result for a transaction from the shared store."""
+        entry = self.shared.get(self.NAMESPACE, transaction_id)
+        return AnalysisResult.model_validate_json(entry[0]) if entry is not None else None
+    
+    def clear(self) -> None:
+        """Drop all results, shared ones included, and reset counters."""
+        super().clear()
+        self.shared.clear(self.NAMESPACE)
@@ -1,26 +1,323 @@
-from fastapi import APIRouter, Depends, HTTPException, Security
+from fastapi import APIRouter, Depends, HTTPException, Security, Request, Query, Response
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from src.common.models import Transaction, AdminNotification
+from pydantic import ValidationError
+from src.common.models import (
+    Transaction,
+    RiskAnalysis,
+    AnalysisResult,
+    AdminNotification,
+    BatchItemResult,
+    BatchItemError,
+    BatchWebhookResponse
+)
 from src.common.config import Settings
-from src.llm.analyzer import analyze_transaction_risk
-from src.notifications.admin import send_notification
+from src.common.constants import RATE_LIMITS, RATE_LIMIT_PERIODS
+from src.common.metrics import stage_timer
+from src.common.ratelimit import RateLimit, request_identity
+from src.common.shared_state import shared_state
+from src.common.stats import register_stats_provider
+from src.llm.admission import OverloadedError
+from src.llm.analyzer import analyze_transaction_risk, provisional_risk_analysis
+from src.llm.client import max_call_seconds
+from src.notifications.admin import send_notification, send_notifications
 from src.webhook.auth import verify_webhook_auth
+from src.webhook.fastpath import FastTransactionRoute, finish_regular_decode
+from src.webhook.idempotency import IdempotencyStore, SharedIdempotencyStore
+from src.webhook.jobs import AnalysisJobQueue
+from src.webhook.results import AnalysisResultStore, SharedAnalysisResultStore
 from src.webhook.validators import validate_transaction_data
-from typing import Dict
+from typing import Dict, List, Any, Optional, Set, Tuple
+from urllib.parse import urlparse
+import asyncio
+import ipaddress
+import socket
+import json
+import math
+import time
 
 router = APIRouter()
 security = HTTPBasic()
 settings = Settings()
 
-@router.post("/webhook", response_model=Dict[str, str])
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Batched transactions per credential and client IP. The middleware takes
+# one token per request before the body is read; the batch route charges
+# the rest of the items once it is parsed
+batch_rate_limit = RateLimit(
+    "webhook_batch",
+    ["/api/webhook/batch"],
+    RATE_LIMITS["WEBHOOK_BATCH"],
+    RATE_LIMIT_PERIODS["WEBHOOK_BATCH"],
+    ip_multiplier=settings.RATE_LIMIT_IP_MULTIPLIER,
+    max_keys=settings.RATE_LIMIT_MAX_KEYS,
+    shared=shared_state
+)
+# Shared buckets are compared across processes, so they need epoch time
+batch_rate_clock = time.monotonic if shared_state is None else time.time
+
+# Provisional and final verdicts of transactions answered before the LLM finished
+if shared_state is not None:
+    analysis_results: AnalysisResultStore = SharedAnalysisResultStore(
+        shared_state,
+        max_size=settings.ANALYSIS_RESULTS_MAX_SIZE,
+        ttl_seconds=settings.ANALYSIS_RESULTS_TTL_SECONDS
+    )
+else:
+    analysis_results = AnalysisResultStore(
+        max_size=settings.ANALYSIS_RESULTS_MAX_SIZE,
+        ttl_seconds=settings.ANALYSIS_RESULTS_TTL_SECONDS
+    )
+_deferred_analyses: Set[asyncio.Task] = set()
+register_stats_provider(
+    "analysis_results",
+    lambda: {**analysis_results.stats(), "pending": len(_deferred_analyses)}
+)
+
+def create_notification(transaction: Transaction, risk_analysis: RiskAnalysis) -> AdminNotification:
+    """Build the admin notification for a high-risk transaction."""
+    return AdminNotification(
+        transaction_id=transaction.transaction_id,
+        risk_score=risk_analysis.risk_score,
+        risk_factors=risk_analysis.risk_factors,
+        transaction_details=transaction,
+        llm_analysis=risk_analysis.reasoning
+    )
+
+async def notify_if_high_risk(transaction: Transaction, risk_analysis: RiskAnalysis) -> None:
+    """Notify administrators of a final verdict over HIGH_RISK_THRESHOLD."""
+    if risk_analysis.risk_score >= settings.HIGH_RISK_THRESHOLD:
+        await send_notification(create_notification(transaction, risk_analysis))
+
+# Background workers for webhooks submitted with mode=async
+analysis_jobs = AnalysisJobQueue(
+    analyze=lambda transaction: analyze_transaction_risk(transaction),
+    results=analysis_results,
+    on_result=lambda transaction, analysis: notify_if_high_risk(transaction, analysis),
+    max_size=settings.ANALYSIS_QUEUE_MAX_SIZE,
+    workers=settings.ANALYSIS_WORKERS,
+    callback_timeout=settings.ANALYSIS_CALLBACK_TIMEOUT,
+    # Checked again before each POST, which then connects to the checked address
+    check_callback=lambda callback_url: check_callback_url(callback_url)
+)
+register_stats_provider("analysis_jobs", analysis_jobs.stats)
+
+# Responses of recent webhook deliveries, replayed when a transaction is redelivered
+def encode_response(result: Any) -> str:
+    """Serialize a webhook response for the shared idempotency store."""
+    if isinstance(result, Response):
+        return json.dumps({"status_code": result.status_code, "body": result.body.decode(), "media_type": result.media_type})
+    return json.dumps({"content": result})
+
+def decode_response(value: str) -> Any:
+    """Rebuild a webhook response serialized by encode_response."""
+    data = json.loads(value)
+    if "content" in data:
+        return data["content"]
+    return Response(data["body"], status_code=data["status_code"], media_type=data["media_type"])
+
+if shared_state is not None:
+    webhook_deliveries: IdempotencyStore = SharedIdempotencyStore(
+        shared_state,
+        max_size=settings.WEBHOOK_IDEMPOTENCY_MAX_SIZE,
+        ttl_seconds=settings.WEBHOOK_IDEMPOTENCY_TTL_SECONDS,
+        encode=encode_response,
+        decode=decode_response,
+        # Renewed while the delivery runs; sized for a full analysis with every
+        # retry, a micro-batch wait and the notification, so only a dead owner lets it lapse
+        claim_seconds=max_call_seconds() + settings.LLM_BATCH_MAX_WAIT_MS / 1000 + settings.LLM_TOTAL_TIMEOUT
+    )
+else:
+    webhook_deliveries = IdempotencyStore(
+        max_size=settings.WEBHOOK_IDEMPOTENCY_MAX_SIZE,
+        ttl_seconds=settings.WEBHOOK_IDEMPOTENCY_TTL_SECONDS
+    )
+register_stats_provider("webhook_idempotency", webhook_deliveries.stats)
+
+def is_public_address(address: str) -> bool:
+    """Return True for globally routable IP addresses (not private, loopback, link-local or reserved)."""
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+async def check_callback_url(callback_url: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Check a callback URL before results are POSTed to it.
+    
+    The URL must be http(s). With ANALYSIS_CALLBACK_ALLOWED_HOSTS set, its
+    host must be listed; otherwise every address the host resolves to must
+    be public, so callers cannot point the server at loopback, internal or
+    cloud metadata addresses.
+    
+    Returns:
+        Tuple: Why the URL is refused (None if it is acceptable), and the
+            checked address to connect to (None for allowlisted hosts, which
+            are resolved as usual)
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url must be an http(s) URL", None
+    allowed = settings.ANALYSIS_CALLBACK_ALLOWED_HOSTS
+    if allowed:
+        return (None if parsed.hostname in allowed else "callback_url host is not allowed"), None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, None, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return "callback_url host does not resolve", None
+    if not infos or not all(is_public_address(info[4][0]) for info in infos):
+        return "callback_url must resolve to a public address", None
+    return None, infos[0][4][0]
+
+async def callback_url_error(callback_url: str) -> Optional[str]:
+    """Return why a callback URL is refused, or None if it is acceptable (see check_callback_url)."""
+    error, _ = await check_callback_url(callback_url)
+    return error
+
+async def validate_callback_url(callback_url: str) -> None:
+    """
+    Check that a callback URL is acceptable (see callback_url_error).
+    
+    Raises:
+        HTTPException: If the URL is not acceptable
+    """
+    error = await callback_url_error(callback_url)
+    if error is not None:
+        raise HTTPException(status_code=422, detail=error)
+
+async def finalize_deferred_analysis(transaction: Transaction, analysis_task: asyncio.Future) -> None:
+    """Record the final verdict of a deferred analysis and notify if it is high risk."""
+    try:
+        risk_analysis = await analysis_task
+    except Exception:
+        # Even the base score fallback failed; the provisional verdict stands
+        return
+    
+    analysis_results.record(transaction.transaction_id, "final", risk_analysis)
+    await notify_if_high_risk(transaction, risk_analysis)
+
+def defer_analysis(transaction: Transaction, analysis_task: asyncio.Future) -> None:
+    """Let an analysis finish in the background once the webhook has answered."""
+    deferred = asyncio.get_running_loop().create_task(finalize_deferred_analysis(transaction, analysis_task))
+    _deferred_analyses.add(deferred)
+    deferred.add_done_callback(_deferred_analyses.discard)
+
+async def analyze_for_response(transaction: Transaction) -> Tuple[RiskAnalysis, bool, bool]:
+    """
+    Analyze a transaction, answering before the full LLM verdict when possible.
+    
+    With LLM_STREAMING_ENABLED the LLM's decision is returned as soon as its
+    risk score and action have streamed. With WEBHOOK_DEADLINE_ENABLED the
+    rule score is returned if neither the decision nor the analysis arrives
+    within WEBHOOK_DEADLINE_MS. Either way the analysis keeps running in the
+    background and its full verdict is recorded (and notified) by
+    finalize_deferred_analysis.
+    
+    Args:
+        transaction: Transaction to analyze
+    
+    Returns:
+        Tuple of the risk analysis, whether it is provisional and whether the
+        full verdict is still pending
+    """
+    loop = asyncio.get_running_loop()
+    decision: Optional[asyncio.Future] = None
+    if settings.LLM_STREAMING_ENABLED:
+        decision = loop.create_future()
+        analysis = analyze_transaction_risk(
+            transaction,
+            on_decision=lambda early: decision.done() or decision.set_result(early)
+        )
+    else:
+        analysis = analyze_transaction_risk(transaction)
+    analysis_task = asyncio.ensure_future(analysis)
+    
+    waiting = {analysis_task} if decision is None else {analysis_task, decision}
+    timeout = settings.WEBHOOK_DEADLINE_MS / 1000 if settings.WEBHOOK_DEADLINE_ENABLED else None
+    try:
+        await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        analysis_task.cancel()
+        raise
+    if analysis_task.done():
+        return analysis_task.result(), False, False
+    
+    if decision is not None and decision.done():
+        defer_analysis(transaction, analysis_task)
+        return decision.result(), False, True
+    
+    provisional = provisional_risk_analysis(transaction)
+    analysis_results.record(transaction.transaction_id, "provisional", provisional)
+    defer_analysis(transaction, analysis_task)
+    return provisional, True, True
+
+async def drain_deferred_analyses(timeout: float) -> None:
+    """Wait for background LLM analyses to finish. Called on application shutdown."""
+    if _deferred_analyses:
+        await asyncio.wait(set(_deferred_analyses), timeout=timeout)
+
+class WebhookRoute(FastTransactionRoute):
+    """Webhook route whose already-valid transactions skip FastAPI body decoding."""
+    
+    async def handle_fast(self, request: Request, transaction: Transaction) -> Optional[Response]:
+        params = request.query_params
+        mode = params.get("mode")
+        if mode not in (None, "sync", "async") or any(len(params.getlist(key)) > 1 for key in params):
+            # Let FastAPI report the invalid query
+            return None
+        
+        credentials = await security(request)
+        result = await process_transaction(transaction, credentials, mode, params.get("callback_url"), validated=True)
+        return result if isinstance(result, Response) else JSONResponse(result)
+
 async def transaction_webhook(
+    request: Request,
     transaction: Transaction,
-    credentials: HTTPBasicCredentials = Depends(security)
+    credentials: HTTPBasicCredentials = Depends(security),
+    mode: Optional[str] = Query(None, pattern=r"^(sync|async)$"),
+    callback_url: Optional[str] = None
 ) -> Dict[str, str]:
-    """Handle incoming transaction webhooks and perform risk analysis."""
+    """
+    Handle incoming transaction webhooks and perform risk analysis.
+    
+    With mode=async the transaction is queued and 202 is returned at once;
+    the verdict is available from GET /analyses/{transaction_id} and is
+    POSTed to callback_url if given.
+    """
+    finish_regular_decode(request)
+    return await process_transaction(transaction, credentials, mode, callback_url)
+
+router.add_api_route(
+    "/webhook",
+    transaction_webhook,
+    methods=["POST"],
+    response_model=Dict[str, str],
+    route_class_override=WebhookRoute
+)
+
+async def process_transaction(
+    transaction: Transaction,
+    credentials: HTTPBasicCredentials,
+    mode: Optional[str],
+    callback_url: Optional[str],
+    validated: bool = False
+) -> Any:
+    """
+    Authenticate, validate and analyze a webhook transaction.
+    
+    Args:
+        transaction: Decoded transaction
+        credentials: Webhook credentials
+        mode: sync, async or None for WEBHOOK_DEFAULT_MODE
+        callback_url: Optional result callback for async mode
+        validated: True if the fast decoding path already ran validate_transaction_data's checks
+    """
     
     # Verify webhook authentication
-    if not verify_webhook_auth(credentials):
+    with stage_timer("auth"):
+        authenticated = verify_webhook_auth(credentials)
+    if not authenticated:
         raise HTTPException(
             status_code=401,
             detail="Invalid authentication credentials",
@@ -28,31 +325,256 @@ async def transaction_webhook(
         )
     
     # Validate transaction data
-    try:
-        validate_transaction_data(transaction)
-    except (ValueError, TypeError) as e:
-        raise HTTPException(status_code=422, detail=str(e))
+    if not validated:
+        try:
+            with stage_timer("validate"):
+                validate_transaction_data(transaction)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    asynchronous = (mode or settings.WEBHOOK_DEFAULT_MODE) == "async"
+    if callback_url:
+        if not asynchronous:
+            raise HTTPException(status_code=422, detail="callback_url requires mode=async")
+        await validate_callback_url(callback_url)
+    
+    if not settings.WEBHOOK_IDEMPOTENCY_ENABLED:
+        return await respond_to_transaction(transaction, asynchronous, callback_url)
+    
+    # Processors retry deliveries; a repeated transaction_id gets the original response
+    result, replayed = await webhook_deliveries.run(
+        transaction.transaction_id,
+        lambda: respond_to_transaction(transaction, asynchronous, callback_url)
+    )
+    return replay_response(result) if replayed else result
+
+def replay_response(result: Any) -> Response:
+    """Copy a stored webhook response, marked with an Idempotent-Replayed header."""
+    headers = {"Idempotent-Replayed": "true"}
+    if isinstance(result, Response):
+        return Response(result.body, status_code=result.status_code, media_type=result.media_type, headers=headers)
+    return JSONResponse(result, headers=headers)
+
+async def respond_to_transaction(transaction: Transaction, asynchronous: bool, callback_url: Optional[str]) -> Any:
+    """Queue or analyze an authenticated, validated transaction and build the webhook response."""
+    if asynchronous:
+        return submit_analysis_job(transaction, callback_url)
     
     # Analyze transaction risk using LLM
     try:
-        risk_analysis = await analyze_transaction_risk(transaction)
+        if settings.WEBHOOK_DEADLINE_ENABLED or settings.LLM_STREAMING_ENABLED:
+            risk_analysis, provisional, pending = await analyze_for_response(transaction)
+        else:
+            risk_analysis, provisional, pending = await analyze_transaction_risk(transaction), False, False
+    except OverloadedError:
+        raise HTTPException(status_code=503, detail="Risk analysis is at capacity", headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Risk analysis failed: {str(e)}")
     
-    # If high risk, notify administrators
-    if risk_analysis.risk_score >= settings.HIGH_RISK_THRESHOLD:
-        notification = AdminNotification(
-            transaction_id=transaction.transaction_id,
-            risk_score=risk_analysis.risk_score,
-            risk_factors=risk_analysis.risk_factors,
-            transaction_details=transaction,
-            llm_analysis=risk_analysis.reasoning
-        )
-        await send_notification(notification)
+    # If high risk, notify administrators (pending verdicts are notified once complete)
+    if not pending and risk_analysis.risk_score >= settings.HIGH_RISK_THRESHOLD:
+        await send_notification(create_notification(transaction, risk_analysis))
     
-    return {
+    response = {
         "status": "success",
         "message": "Transaction processed successfully",
         "transaction_id": transaction.transaction_id,
         "risk_score": str(risk_analysis.risk_score)
-    }
\ No newline at end of file
+    }
+    if settings.WEBHOOK_DEADLINE_ENABLED:
+        response["provisional"] = str(provisional).lower()
+    if settings.LLM_ADMISSION_ENABLED:
+        response["degraded"] = str(risk_analysis.degraded).lower()
+    return response
+
+def submit_analysis_job(transaction: Transaction, callback_url: Optional[str]) -> JSONResponse:
+    """Queue a transaction for background analysis and build the 202 response."""
+    try:
+        job_id = analysis_jobs.submit(transaction, callback_url)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Analysis queue is full", headers={"Retry-After": "1"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "accepted",
+            "message": "Transaction queued for analysis",
+            "transaction_id": transaction.transaction_id,
+            "job_id": job_id,
+            "result_url": f"/api/analyses/{transaction.transaction_id}"
+        }
+    )
+
+@router.get("/analyses/{transaction_id}", response_model=AnalysisResult)
+async def get_analysis(
+    transaction_id: str,
+    credentials: HTTPBasicCredentials = Depends(security)
+) -> AnalysisResult:
+    """Return the state of an async or deferred analysis."""
+    if not verify_webhook_auth(credentials):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    
+    result = analysis_results.get(transaction_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return result
+
+def parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """
+    Decode a batch request body into a list of raw transaction items.
+    
+    Args:
+        body: Raw request body, either a JSON array or NDJSON
+        content_type: Request content type
+    
+    Returns:
+        List of decoded items
+    
+    Raises:
+        ValueError: If the body cannot be decoded
+    """
+    if content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+        items = []
+        for line_number, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise ValueError(f"Invalid JSON on line {line_number}")
+        return items
+    
+    try:
+        items = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON body")
+    if not isinstance(items, list):
+        raise ValueError("Batch body must be a JSON array of transactions")
+    return items
+
+def format_validation_error(error: ValidationError) -> str:
+    """Flatten a Pydantic validation error into a single message."""
+    return "\n".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+@router.post("/webhook/batch", response_model=BatchWebhookResponse)
+async def transaction_batch_webhook(
+    request: Request,
+    credentials: HTTPBasicCredentials = Depends(security)
+) -> BatchWebhookResponse:
+    """
+    Handle a batch of transactions delivered as a JSON array or NDJSON.
+    
+    Every item is validated in a single pass and the valid ones are analyzed
+    concurrently, bounded by BATCH_ANALYSIS_CONCURRENCY. Invalid items are
+    reported individually and never fail the whole batch. Each item takes a
+    token from the webhook_batch rate limit (the first one in the middleware).
+    """
+    
+    # Verify webhook authentication
+    if not verify_webhook_auth(credentials):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    
+    try:
+        items = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    if len(items) > settings.WEBHOOK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds maximum size of {settings.WEBHOOK_BATCH_MAX_SIZE} transactions"
+        )
+    
+    if settings.RATE_LIMIT_ENABLED and len(items) > 1:
+        client_ip, authorization = request_identity(request.scope)
+        wait = batch_rate_limit.check(client_ip, authorization, batch_rate_clock(), tokens=len(items) - 1)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+    
+    # Validate all items in one pass
+    errors: List[BatchItemError] = []
+    valid: List[tuple] = []
+    for index, item in enumerate(items):
+        transaction_id = item.get("transaction_id") if isinstance(item, dict) else None
+        if not isinstance(transaction_id, str):
+            # Echoed back in the error, which only holds a string id
+            transaction_id = None
+        try:
+            transaction = Transaction.model_validate(item)
+            validate_transaction_data(transaction)
+            valid.append((index, transaction))
+        except ValidationError as e:
+            errors.append(BatchItemError(index=index, transaction_id=transaction_id, detail=format_validation_error(e)))
+        except (ValueError, TypeError) as e:
+            errors.append(BatchItemError(index=index, transaction_id=transaction_id, detail=str(e)))
+    
+    # Analyze valid transactions with bounded concurrency
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_ANALYSIS_CONCURRENCY))
+    
+    async def analyze(transaction: Transaction) -> RiskAnalysis:
+        async with semaphore:
+            return await analyze_transaction_risk(transaction)
+    
+    analyses = await asyncio.gather(
+        *(analyze(transaction) for _, transaction in valid),
+        return_exceptions=True
+    )
+    
+    results: List[BatchItemResult] = []
+    notifications: List[AdminNotification] = []
+    for (index, transaction), analysis in zip(valid, analyses):
+        if isinstance(analysis, Exception):
+            errors.append(BatchItemError(
+                index=index,
+                transaction_id=transaction.transaction_id,
+                detail=f"Risk analysis failed: {str(analysis)}"
+            ))
+            continue
+        
+        results.append(BatchItemResult(
+            index=index,
+            transaction_id=transaction.transaction_id,
+            risk_score=analysis.risk_score,
+            recommended_action=analysis.recommended_action,
+            degraded=analysis.degraded
+        ))
+        if analysis.risk_score >= settings.HIGH_RISK_THRESHOLD:
+            notifications.append(create_notification(transaction, analysis))
+    
+    # Persist all notifications in a single write
+    try:
+        await send_notifications(notifications)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    errors.sort(key=lambda e: e.index)
+    if not errors:
+        status = "success"
+    elif results:
+        status = "partial"
+    else:
+        status = "failed"
+    
+    return BatchWebhookResponse(
+        status=status,
+        processed=len(results),
+        failed=len(errors),
+        results=results,
+        errors=errors
+    )
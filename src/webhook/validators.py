@@ -1,11 +1,8 @@
 from src.common.models import Transaction
-from src.common.config import Settings
 from datetime import datetime, timezone
 from typing import List
 import ipaddress
 
-settings = Settings()
-
 def validate_transaction_data(transaction: Transaction) -> None:
     """
     Validate transaction data for completeness and correctness.
@@ -55,11 +52,7 @@ def validate_transaction_data(transaction: Transaction) -> None:
     if not transaction.merchant.id or not transaction.merchant.name or not transaction.merchant.category:
         errors.append("Missing required merchant information")
     
-    # Check for high-risk countries
-    if (transaction.customer.country in settings.HIGH_RISK_COUNTRIES or
-        transaction.payment_method.country_of_issue in settings.HIGH_RISK_COUNTRIES):
-        # We don't raise an error for high-risk countries, but we'll let the risk analysis handle it
-        pass
+    # High-risk countries are not an error; the risk rules score them
     
     if errors:
         raise ValueError("\n".join(errors))
\ No newline at end of file
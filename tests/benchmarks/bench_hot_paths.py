@@ -0,0 +1,143 @@
+"""
+Benchmarks for the per-transaction CPU paths: decoding, validation,
+rule scoring, prompt building, LLM response parsing and notification
+templates.
+"""
+from src.common.metrics import stage_timer
+from src.common.models import AdminNotification, RiskAnalysis, Transaction, VelocitySnapshot
+from src.common.ratelimit import RateLimit, RateLimitMiddleware
+from src.common.shared_state import SharedState
+from src.llm.analyzer import build_risk_prompt, calculate_base_risk_score
+from src.llm.parser import IncrementalVerdictParser, parse_llm_response
+from src.llm.prompts import get_risk_analysis_prompt
+from src.llm.velocity import SharedVelocityTracker, VelocityTracker
+from src.notifications.templates import (
+    format_transaction_details,
+    format_risk_analysis,
+    create_email_notification,
+    create_slack_notification
+)
+from src.webhook.fastpath import fast_decode_transaction
+from src.webhook.validators import validate_transaction_data
+from tests.benchmarks.harness import BenchmarkSuite
+import json
+import os
+import tempfile
+import time
+
+TRANSACTION_PAYLOAD = json.dumps({
+    "transaction_id": "tx_bench000001",
+    "timestamp": "2024-03-14T02:15:00+00:00",
+    "amount": 1249.99,
+    "currency": "USD",
+    "customer": {"id": "cust_bench001", "country": "US", "ip_address": "203.0.113.45"},
+    "payment_method": {"type": "credit_card", "last_four": "4242", "country_of_issue": "CA"},
+    "merchant": {"id": "merch_bench001", "name": "Bench Electronics", "category": "electronics"}
+}).encode()
+
+TRANSACTION = Transaction.model_validate_json(TRANSACTION_PAYLOAD)
+
+VELOCITY = VelocitySnapshot(
+    window_minutes=60,
+    customer_count=4,
+    customer_amount=2100.0,
+    card_count=4,
+    card_amount=2100.0,
+    ip_count=6,
+    ip_amount=3050.0
+)
+
+LLM_RESPONSE = json.dumps({
+    "risk_score": 0.72,
+    "risk_factors": [
+        "Cross-border payment (US/CA)",
+        "High transaction amount (1249.99 USD)",
+        "Unusual transaction time (02:00)"
+    ],
+    "reasoning": "Large cross-border electronics purchase at night from a customer with elevated recent activity.",
+    "recommended_action": "block"
+})
+
+ANALYSIS = parse_llm_response(LLM_RESPONSE)
+
+NOTIFICATION = AdminNotification(
+    transaction_id=TRANSACTION.transaction_id,
+    risk_score=ANALYSIS.risk_score,
+    risk_factors=ANALYSIS.risk_factors,
+    transaction_details=TRANSACTION,
+    llm_analysis=ANALYSIS.reasoning
+)
+
+def build_prompt() -> dict:
+    return get_risk_analysis_prompt(TRANSACTION.model_dump_json(), VELOCITY.model_dump_json())
+
+# LLM_RESPONSE as streamed deltas of a few characters each
+LLM_RESPONSE_CHUNKS = [LLM_RESPONSE[i:i + 8] for i in range(0, len(LLM_RESPONSE), 8)]
+
+def parse_streamed_response() -> None:
+    parser = IncrementalVerdictParser()
+    for chunk in LLM_RESPONSE_CHUNKS:
+        parser.feed(chunk)
+    parse_llm_response(parser.text)
+
+async def passthrough_app(scope, receive, send) -> None:
+    pass
+
+# A limit that never runs out, so every call takes the allow path
+RATE_LIMITED_APP = RateLimitMiddleware(passthrough_app, [RateLimit("bench", ["/api/webhook"], 10 ** 9, 60)])
+
+WEBHOOK_SCOPE = {
+    "type": "http",
+    "path": "/api/webhook",
+    "client": ("203.0.113.45", 51000),
+    "headers": [
+        (b"host", b"risk.example.com"),
+        (b"content-type", b"application/json"),
+        (b"authorization", b"Basic bWVyY2hhbnQ6c2VjcmV0")
+    ]
+}
+
+def time_empty_stage() -> None:
+    with stage_timer("benchmark"):
+        pass
+
+async def run_benchmarks(suite: BenchmarkSuite) -> None:
+    """Run the CPU hot path benchmarks."""
+    await suite.measure("decode.model_validate_json", lambda: Transaction.model_validate_json(TRANSACTION_PAYLOAD))
+    await suite.measure("decode.fast_decode_transaction", lambda: fast_decode_transaction(TRANSACTION_PAYLOAD))
+    await suite.measure("validate.validate_transaction_data", lambda: validate_transaction_data(TRANSACTION))
+    await suite.measure("scoring.calculate_base_risk_score", lambda: calculate_base_risk_score(TRANSACTION))
+    await suite.measure(
+        "scoring.calculate_base_risk_score",
+        lambda: calculate_base_risk_score(TRANSACTION, VELOCITY),
+        params={"velocity": True}
+    )
+    await suite.measure("prompt.get_risk_analysis_prompt", build_prompt)
+    await suite.measure("prompt.build_risk_prompt", lambda: build_risk_prompt(TRANSACTION, VELOCITY, "compact"), params={"encoding": "compact"})
+    await suite.measure("parser.parse_llm_response", lambda: parse_llm_response(LLM_RESPONSE))
+    await suite.measure("parser.incremental_verdict", parse_streamed_response)
+    await suite.measure("templates.format_transaction_details", lambda: format_transaction_details(TRANSACTION))
+    await suite.measure("templates.format_risk_analysis", lambda: format_risk_analysis(ANALYSIS))
+    await suite.measure("templates.create_email_notification", lambda: create_email_notification(NOTIFICATION))
+    await suite.measure("templates.create_slack_notification", lambda: create_slack_notification(NOTIFICATION))
+    await suite.measure("metrics.stage_timer", time_empty_stage)
+    await suite.measure("ratelimit.middleware", lambda: RATE_LIMITED_APP(WEBHOOK_SCOPE, None, None))
+    tracker = VelocityTracker(window_minutes=60)
+    await suite.measure("velocity.record", lambda: tracker.record(TRANSACTION))
+    
+    # The same paths with state in a SharedState database, as with several workers
+    if not any(suite.selected(name) for name in ("shared_state.ratelimit.middleware", "shared_state.velocity.record")):
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        shared = SharedState(os.path.join(directory, "shared_state.db"))
+        try:
+            shared_app = RateLimitMiddleware(
+                passthrough_app,
+                [RateLimit("bench", ["/api/webhook"], 10 ** 9, 60, shared=shared)],
+                clock=time.time
+            )
+            await suite.measure("shared_state.ratelimit.middleware", lambda: shared_app(WEBHOOK_SCOPE, None, None))
+            shared_tracker = SharedVelocityTracker(shared, window_minutes=60)
+            await suite.measure("shared_state.velocity.record", lambda: shared_tracker.record(TRANSACTION))
+        finally:
+            shared.close()
@@ -0,0 +1,56 @@
+"""
+End-to-end LLM analysis benchmarks against a replayed cassette.
+
+A cassette is recorded from a synthetic upstream into a temporary file and
+replayed with fixed injected latency, so the numbers cover prompt building,
+the shared client, the resilience layer and response parsing without any
+network access.
+"""
+from src.llm.analyzer import request_llm_analysis
+from src.llm.cassette import Cassette, RecordingTransport, ReplayTransport
+from src.llm.client import start_llm_client, close_llm_client
+from tests.benchmarks.bench_hot_paths import LLM_RESPONSE, TRANSACTION
+from tests.benchmarks.harness import BenchmarkSuite
+import asyncio
+import os
+import tempfile
+import httpx
+
+CONCURRENCY = 50
+
+async def record_cassette(path: str) -> None:
+    """Record the benchmark transaction's LLM call from a synthetic upstream."""
+    def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"choices": [{"message": {"content": LLM_RESPONSE}}]})
+    
+    await start_llm_client(transport=RecordingTransport(Cassette.load(path), httpx.MockTransport(upstream)))
+    try:
+        await request_llm_analysis(TRANSACTION)
+    finally:
+        await close_llm_client()
+
+async def run_benchmarks(suite: BenchmarkSuite) -> None:
+    """Run single and concurrent replayed analyses at 0 and 20 ms upstream latency."""
+    if not suite.selected("llm_replay."):
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.json")
+        await record_cassette(path)
+        cassette = Cassette.load(path)
+        
+        for latency_ms in (0, 20):
+            await start_llm_client(transport=ReplayTransport(cassette, latency_ms=latency_ms))
+            try:
+                await suite.measure(
+                    "llm_replay.request_llm_analysis",
+                    lambda: request_llm_analysis(TRANSACTION),
+                    params={"latency_ms": latency_ms}
+                )
+                # Time per batch of concurrent analyses; throughput is CONCURRENCY * ops_per_sec
+                await suite.measure(
+                    "llm_replay.request_llm_analysis.concurrent",
+                    lambda: asyncio.gather(*(request_llm_analysis(TRANSACTION) for _ in range(CONCURRENCY))),
+                    params={"latency_ms": latency_ms, "concurrency": CONCURRENCY}
+                )
+            finally:
+                await close_llm_client()
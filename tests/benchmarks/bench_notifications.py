@@ -0,0 +1,137 @@
+"""
+Benchmarks for the notification API handlers against the JSON and SQLite
+stores, pre-filled with a given number of notifications.
+
+The handlers are called directly (no HTTP) with the module-level store and
+write-behind queue swapped for the benchmark store.
+"""
+from fastapi import Response
+from fastapi.security import HTTPBasicCredentials
+from src.common.config import Settings
+from src.common.models import AdminNotification, NotificationQuery
+from src.notifications import admin as admin_module
+from src.notifications.queue import WriteBehindQueue
+from src.notifications.repository import NotificationRepository
+from src.notifications.store import NotificationStore, datetime_handler
+from src.notifications.sqlite_store import SQLiteNotificationRepository
+from tests.benchmarks.bench_hot_paths import NOTIFICATION
+from tests.benchmarks.harness import BenchmarkSuite
+from typing import Any, Dict, List
+from datetime import timedelta
+import itertools
+import json
+import os
+import random
+import tempfile
+
+settings = Settings()
+
+SEED_BATCH_SIZE = 5000
+PAGE_SIZE = 100
+
+def seed_records(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Build count notification records with a fixed mix of statuses, scores and times."""
+    rng = random.Random(seed)
+    base = NOTIFICATION.model_dump()
+    records = []
+    for i in range(count):
+        record = dict(base)
+        record["transaction_id"] = f"tx_seed{i:07d}"
+        record["risk_score"] = round(rng.uniform(0.7, 1.0), 2)
+        record["status"] = rng.choices(["pending", "reviewed", "dismissed"], weights=[6, 3, 1])[0]
+        record["timestamp"] = base["timestamp"] - timedelta(seconds=count - i)
+        records.append(record)
+    return records
+
+async def open_store(backend: str, directory: str, records: List[Dict[str, Any]]) -> NotificationRepository:
+    """Create a started store of the given backend holding records."""
+    if backend == "json":
+        path = os.path.join(directory, "notifications.json")
+        with open(path, "w") as f:
+            f.write(json.dumps(records, default=datetime_handler))
+        store = NotificationStore(path)
+    else:
+        store = SQLiteNotificationRepository(os.path.join(directory, "notifications.db"))
+    await store.start()
+    if backend == "sqlite":
+        for start in range(0, len(records), SEED_BATCH_SIZE):
+            await store.add_many(records[start:start + SEED_BATCH_SIZE])
+    return store
+
+async def run_benchmarks(suite: BenchmarkSuite) -> None:
+    """Run send_notification, get_notifications and update_notification_status per backend and size."""
+    credentials = HTTPBasicCredentials(username=settings.ADMIN_USERNAME, password=settings.ADMIN_PASSWORD)
+    pending = NotificationQuery(status="pending")
+    original_store, original_queue = admin_module.notification_store, admin_module.notification_queue
+    
+    for backend in ("json", "sqlite"):
+        for size in suite.sizes:
+            params = {"backend": backend, "size": size}
+            names = [
+                "notifications.send_notification",
+                "notifications.send_notification.write_behind",
+                "notifications.get_notifications.page",
+                "notifications.get_notifications.pending_page",
+                "notifications.update_notification_status"
+            ]
+            if not any(suite.selected(name) for name in names):
+                continue
+            
+            records = seed_records(size)
+            with tempfile.TemporaryDirectory() as directory:
+                store = await open_store(backend, directory, records)
+                queue = WriteBehindQueue(
+                    store,
+                    max_size=settings.NOTIFICATION_QUEUE_MAX_SIZE,
+                    batch_size=settings.NOTIFICATION_FLUSH_BATCH_SIZE,
+                    flush_interval_ms=settings.NOTIFICATION_FLUSH_INTERVAL_MS
+                )
+                admin_module.notification_store, admin_module.notification_queue = store, queue
+                try:
+                    # Queue not started: every notification is written before returning
+                    await suite.measure(
+                        "notifications.send_notification",
+                        lambda: admin_module.send_notification(NOTIFICATION),
+                        params=params,
+                        max_iterations=2000
+                    )
+                    
+                    await queue.start()
+                    await suite.measure(
+                        "notifications.send_notification.write_behind",
+                        lambda: admin_module.send_notification(NOTIFICATION),
+                        params=params,
+                        max_iterations=5000
+                    )
+                    await queue.close()
+                    
+                    await suite.measure(
+                        "notifications.get_notifications.page",
+                        lambda: admin_module.get_notifications(
+                            Response(), credentials, NotificationQuery(), limit=PAGE_SIZE, cursor=None, order="desc"
+                        ),
+                        params=params
+                    )
+                    await suite.measure(
+                        "notifications.get_notifications.pending_page",
+                        lambda: admin_module.get_notifications(
+                            Response(), credentials, pending, limit=PAGE_SIZE, cursor=None, order="asc"
+                        ),
+                        params=params
+                    )
+                    
+                    # Walk the seeded notifications, alternating the new status
+                    targets = itertools.cycle(records[::max(1, size // 1000)])
+                    statuses = itertools.cycle(["reviewed", "dismissed"])
+                    await suite.measure(
+                        "notifications.update_notification_status",
+                        lambda: admin_module.update_notification_status(
+                            next(targets)["transaction_id"], next(statuses), credentials
+                        ),
+                        params=params,
+                        max_iterations=2000
+                    )
+                finally:
+                    await queue.close()
+                    await store.close()
+                    admin_module.notification_store, admin_module.notification_queue = original_store, original_queue
@@ -0,0 +1,60 @@
+"""
+Compare the per-request CPU cost of the regular webhook decoding path
+(json + pydantic + validate_transaction_data) with the fast path.
+
+Usage:
+    python -m tests.benchmarks.bench_webhook_decode [iterations]
+    python -m tests.benchmarks.run --suite webhook_decode
+"""
+from src.common.models import Transaction
+from src.webhook.fastpath import fast_decode_transaction
+from src.webhook.validators import validate_transaction_data
+from tests.benchmarks.harness import BenchmarkSuite
+from datetime import datetime, timezone
+import json
+import sys
+import time
+
+PAYLOAD = json.dumps({
+    "transaction_id": "tx_bench000001",
+    "timestamp": datetime.now(timezone.utc).isoformat(),
+    "amount": 149.99,
+    "currency": "USD",
+    "customer": {"id": "cust_bench001", "country": "US", "ip_address": "203.0.113.45"},
+    "payment_method": {"type": "credit_card", "last_four": "4242", "country_of_issue": "US"},
+    "merchant": {"id": "merch_bench001", "name": "Bench Electronics", "category": "electronics"}
+}).encode()
+
+def regular_path(body: bytes) -> Transaction:
+    transaction = Transaction.model_validate(json.loads(body))
+    validate_transaction_data(transaction)
+    return transaction
+
+def fast_path(body: bytes) -> Transaction:
+    return fast_decode_transaction(body)
+
+def cpu_us_per_call(func, body: bytes, iterations: int) -> float:
+    started = time.process_time()
+    for _ in range(iterations):
+        func(body)
+    return (time.process_time() - started) / iterations * 1e6
+
+async def run_benchmarks(suite: BenchmarkSuite) -> None:
+    """Run the regular and fast webhook decoding paths on the same payload."""
+    await suite.measure("webhook_decode.regular", lambda: regular_path(PAYLOAD))
+    await suite.measure("webhook_decode.fast", lambda: fast_path(PAYLOAD))
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    assert fast_path(PAYLOAD) == regular_path(PAYLOAD)
+    for func in (regular_path, fast_path):
+        cpu_us_per_call(func, PAYLOAD, iterations // 10)
+    regular = cpu_us_per_call(regular_path, PAYLOAD, iterations)
+    fast = cpu_us_per_call(fast_path, PAYLOAD, iterations)
+    print(f"payload: {len(PAYLOAD)} bytes, {iterations} iterations")
+    print(f"regular: {regular:.1f} us/request")
+    print(f"fast:    {fast:.1f} us/request")
+    print(f"saved:   {regular - fast:.1f} us/request ({(1 - fast / regular) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
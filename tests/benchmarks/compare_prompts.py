@@ -0,0 +1,199 @@
+"""
+Compare the full and compact prompt encodings on a synthetic sample.
+
+Without --live only prompt sizes are compared, using the token estimator.
+With --live every transaction is also analyzed once per encoding through
+the configured LLM client, and verdict agreement and latency are reported.
+Set LLM_TRANSPORT_MODE=record for a first live run and replay afterwards
+to repeat the comparison offline.
+
+Usage:
+    python -m tests.benchmarks.compare_prompts --count 200
+    python -m tests.benchmarks.compare_prompts --count 50 --live --output prompts.json
+"""
+from src.common.config import Settings
+from src.common.constants import MERCHANT_CATEGORY_RISK
+from src.common.models import Transaction, VelocitySnapshot
+from src.llm.analyzer import build_risk_prompt, request_llm_analysis
+from src.llm.client import start_llm_client, close_llm_client
+from src.llm.encoding import estimate_prompt_tokens
+from tests.benchmarks.harness import environment
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+ENCODINGS = ("full", "compact")
+
+COUNTRIES = ["US", "CA", "GB", "DE", "FR", "BR", "NG", "IN", "RU", "CN"]
+# The keys of the category risk table, so prompts carry categories scored in production
+CATEGORIES = sorted(MERCHANT_CATEGORY_RISK)
+PAYMENT_TYPES = ["credit_card", "debit_card"]
+
+settings = Settings()
+
+def generate_sample(count: int, seed: int) -> List[Tuple[Transaction, Optional[VelocitySnapshot]]]:
+    """Generate a reproducible mix of transactions, half of them with recent activity."""
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    sample = []
+    for index in range(count):
+        customer_country = rng.choice(COUNTRIES)
+        transaction = Transaction(
+            transaction_id=f"tx_cmp{index:06d}",
+            timestamp=start + timedelta(minutes=rng.randrange(60 * 24 * 28)),
+            amount=round(rng.lognormvariate(5, 1.5), 2),
+            currency="USD",
+            customer={
+                "id": f"cust_cmp{rng.randrange(count):06d}",
+                "country": customer_country,
+                "ip_address": f"203.0.{rng.randrange(256)}.{rng.randrange(256)}"
+            },
+            payment_method={
+                "type": rng.choice(PAYMENT_TYPES),
+                "last_four": f"{rng.randrange(10000):04d}",
+                "country_of_issue": customer_country if rng.random() < 0.7 else rng.choice(COUNTRIES)
+            },
+            merchant={
+                "id": f"merch_cmp{rng.randrange(100):03d}",
+                "name": f"Merchant {rng.randrange(100)}",
+                "category": rng.choice(CATEGORIES)
+            }
+        )
+        velocity = None
+        if rng.random() < 0.5:
+            count_seen = rng.randrange(1, 8)
+            amount_seen = round(count_seen * rng.uniform(20, 600), 2)
+            velocity = VelocitySnapshot(
+                window_minutes=60,
+                customer_count=count_seen,
+                customer_amount=amount_seen,
+                card_count=count_seen,
+                card_amount=amount_seen,
+                ip_count=count_seen + rng.randrange(3),
+                ip_amount=amount_seen
+            )
+        sample.append((transaction, velocity))
+    return sample
+
+def risk_band(score: float) -> str:
+    """Map a score to the band the admin notifications use."""
+    if score >= settings.HIGH_RISK_THRESHOLD:
+        return "high"
+    if score >= settings.REVIEW_THRESHOLD:
+        return "review"
+    return "low"
+
+def compare_sizes(sample: List[Tuple[Transaction, Optional[VelocitySnapshot]]]) -> Dict[str, Any]:
+    """Estimate input tokens and characters per prompt for each encoding."""
+    sizes: Dict[str, Any] = {}
+    for encoding in ENCODINGS:
+        prompts = [build_risk_prompt(t, v, encoding) for t, v in sample]
+        tokens = [estimate_prompt_tokens(prompt) for prompt in prompts]
+        sizes[encoding] = {
+            "mean_tokens": round(statistics.fmean(tokens), 1),
+            "total_tokens": sum(tokens),
+            "mean_chars": round(statistics.fmean(len(p["system"]) + len(p["user"]) for p in prompts), 1)
+        }
+    sizes["token_savings"] = round(1 - sizes["compact"]["total_tokens"] / sizes["full"]["total_tokens"], 4)
+    return sizes
+
+async def analyze_sample(
+    sample: List[Tuple[Transaction, Optional[VelocitySnapshot]]],
+    encoding: str,
+    concurrency: int
+) -> List[Dict[str, Any]]:
+    """Analyze every transaction with one encoding; failed calls are recorded with their error."""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def analyze(transaction: Transaction, velocity: Optional[VelocitySnapshot]) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                analysis = await request_llm_analysis(transaction, velocity, encoding)
+            except Exception as e:
+                return {"error": type(e).__name__, "seconds": time.perf_counter() - started}
+            return {
+                "risk_score": analysis.risk_score,
+                "recommended_action": analysis.recommended_action,
+                "seconds": time.perf_counter() - started
+            }
+    
+    return await asyncio.gather(*(analyze(t, v) for t, v in sample))
+
+def compare_verdicts(full: List[Dict[str, Any]], compact: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize how often both encodings reach the same decision."""
+    pairs = [(a, b) for a, b in zip(full, compact) if "error" not in a and "error" not in b]
+    result: Dict[str, Any] = {
+        "compared": len(pairs),
+        "errors": {
+            "full": sum("error" in a for a in full),
+            "compact": sum("error" in b for b in compact)
+        },
+        "mean_latency_ms": {
+            encoding: round(statistics.fmean(r["seconds"] for r in results) * 1000, 2) if results else None
+            for encoding, results in (("full", full), ("compact", compact))
+        }
+    }
+    if pairs:
+        result["action_agreement"] = round(sum(a["recommended_action"] == b["recommended_action"] for a, b in pairs) / len(pairs), 4)
+        result["band_agreement"] = round(sum(risk_band(a["risk_score"]) == risk_band(b["risk_score"]) for a, b in pairs) / len(pairs), 4)
+        result["mean_abs_score_diff"] = round(statistics.fmean(abs(a["risk_score"] - b["risk_score"]) for a, b in pairs), 4)
+    return result
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the full and compact prompt encodings.")
+    parser.add_argument("--count", type=int, default=200, help="Number of synthetic transactions")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic sample")
+    parser.add_argument("--live", action="store_true", help="Also analyze the sample through the configured LLM client")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM calls per encoding with --live")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    sample = generate_sample(args.count, args.seed)
+    report: Dict[str, Any] = {
+        "environment": environment(),
+        "settings": {"count": args.count, "seed": args.seed, "transport": settings.LLM_TRANSPORT_MODE},
+        "sizes": compare_sizes(sample)
+    }
+    if args.live:
+        await start_llm_client()
+        try:
+            full = await analyze_sample(sample, "full", args.concurrency)
+            compact = await analyze_sample(sample, "compact", args.concurrency)
+        finally:
+            await close_llm_client()
+        report["verdicts"] = compare_verdicts(full, compact)
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    
+    sizes = report["sizes"]
+    for encoding in ENCODINGS:
+        print(f"{encoding:<8} {sizes[encoding]['mean_tokens']:>8.1f} tokens/prompt  {sizes[encoding]['mean_chars']:>8.1f} chars/prompt")
+    print(f"Estimated input token savings: {sizes['token_savings']:.1%}")
+    verdicts = report.get("verdicts")
+    if verdicts:
+        print(f"Compared {verdicts['compared']} verdicts, errors {verdicts['errors']}")
+        if verdicts["compared"]:
+            print(
+                f"  action agreement {verdicts['action_agreement']:.1%}, band agreement {verdicts['band_agreement']:.1%}, "
+                f"mean |score diff| {verdicts['mean_abs_score_diff']:.3f}"
+            )
+        print(f"  mean latency ms {verdicts['mean_latency_ms']}")
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
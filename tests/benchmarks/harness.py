@@ -0,0 +1,190 @@
+"""
+Timing harness for the benchmark suite.
+
+Each benchmark is calibrated to run for at least min_time seconds per
+repeat, with the garbage collector disabled while timing, and reports
+per-operation times in microseconds. Results are plain dicts so a run can
+be written as JSON and compared with a run from another commit.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from datetime import datetime, timezone
+import gc
+import inspect
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+SCHEMA_VERSION = 1
+
+BenchmarkFunc = Callable[[], Union[Any, Awaitable[Any]]]
+
+def result_key(result: Dict[str, Any]) -> str:
+    """Return the identity of a result: its name plus its parameters."""
+    params = result.get("params") or {}
+    if not params:
+        return result["name"]
+    return result["name"] + "[" + ",".join(f"{k}={params[k]}" for k in sorted(params)) + "]"
+
+def environment() -> Dict[str, Any]:
+    """Describe the commit and machine a run was made on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+class BenchmarkSuite:
+    """
+    Collects benchmark results for one run.
+    
+    Args:
+        repeat: Number of timed repeats per benchmark
+        min_time: Minimum seconds per repeat, used to pick the iteration count
+        sizes: Store sizes for the storage benchmarks
+        only: If set, only benchmarks whose name contains this string run
+    """
+    
+    def __init__(self, repeat: int = 5, min_time: float = 0.2, sizes: Optional[List[int]] = None, only: Optional[str] = None):
+        self.repeat = max(1, repeat)
+        self.min_time = min_time
+        self.sizes = sizes or [1000, 10000, 100000]
+        self.only = only
+        self.results: List[Dict[str, Any]] = []
+    
+    def selected(self, name: str) -> bool:
+        """Return True if the benchmark should run."""
+        return not self.only or self.only in name
+    
+    async def _time(self, func: BenchmarkFunc, iterations: int, is_async: bool) -> float:
+        gc.collect()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            if is_async:
+                for _ in range(iterations):
+                    await func()
+            else:
+                for _ in range(iterations):
+                    func()
+            return time.perf_counter() - started
+        finally:
+            if gc_enabled:
+                gc.enable()
+    
+    async def measure(
+        self,
+        name: str,
+        func: BenchmarkFunc,
+        params: Optional[Dict[str, Any]] = None,
+        max_iterations: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Time func and record the result.
+        
+        Args:
+            name: Benchmark name, e.g. "scoring.calculate_base_risk_score"
+            func: Function taking no arguments; may return an awaitable
+            params: Parameters that distinguish variants of the benchmark
+            max_iterations: Upper bound on iterations per repeat, for slow or
+                state-growing operations
+        
+        Returns:
+            The recorded result, or None if the benchmark was not selected
+        """
+        if not self.selected(name):
+            return None
+        # Warm-up call, which also tells whether func returns an awaitable
+        warmup = func()
+        is_async = inspect.isawaitable(warmup)
+        if is_async:
+            await warmup
+        
+        # Calibrate: double the iteration count until one repeat takes min_time
+        iterations = 1
+        while True:
+            elapsed = await self._time(func, iterations, is_async)
+            if elapsed >= self.min_time or (max_iterations and iterations >= max_iterations):
+                break
+            iterations *= 2 if elapsed <= 0 else max(2, min(10, int(self.min_time / elapsed) + 1))
+            if max_iterations:
+                iterations = min(iterations, max_iterations)
+        
+        per_op_us = []
+        for _ in range(self.repeat):
+            elapsed = await self._time(func, iterations, is_async)
+            per_op_us.append(elapsed / iterations * 1e6)
+        
+        median = statistics.median(per_op_us)
+        result = {
+            "name": name,
+            "params": params or {},
+            "iterations": iterations,
+            "repeat": self.repeat,
+            "us_per_op": {
+                "min": round(min(per_op_us), 3),
+                "median": round(median, 3),
+                "mean": round(statistics.fmean(per_op_us), 3),
+                "stdev": round(statistics.stdev(per_op_us), 3) if len(per_op_us) > 1 else 0.0
+            },
+            "ops_per_sec": round(1e6 / median, 1) if median > 0 else None
+        }
+        self.results.append(result)
+        print(f"{result_key(result):<70} {median:>12.2f} us/op  ({iterations} x {self.repeat})", flush=True)
+        return result
+    
+    def report(self) -> Dict[str, Any]:
+        """Return the run as a JSON-serializable document."""
+        return {
+            "schema": SCHEMA_VERSION,
+            "environment": environment(),
+            "settings": {"repeat": self.repeat, "min_time": self.min_time, "sizes": self.sizes},
+            "results": self.results
+        }
+
+def load_report(path: str) -> Dict[str, Any]:
+    """Load a report written by the benchmark runner."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compare the median time of every benchmark present in both reports.
+    
+    Args:
+        baseline: Report from the reference commit
+        current: Report from this run
+        threshold: Relative slowdown that counts as a regression, e.g. 0.2 for 20%
+    
+    Returns:
+        One entry per common benchmark with baseline and current medians,
+        the relative change and whether it is a regression
+    """
+    previous = {result_key(result): result for result in baseline.get("results", [])}
+    comparison = []
+    for result in current.get("results", []):
+        key = result_key(result)
+        if key not in previous:
+            continue
+        before = previous[key]["us_per_op"]["median"]
+        after = result["us_per_op"]["median"]
+        change = (after - before) / before if before > 0 else 0.0
+        comparison.append({
+            "benchmark": key,
+            "baseline_us": before,
+            "current_us": after,
+            "change": round(change, 4),
+            "regression": change > threshold
+        })
+    return comparison
@@ -0,0 +1,72 @@
+"""
+Run the benchmark suite and write machine-readable results.
+
+Usage:
+    python -m tests.benchmarks.run --output bench.json
+    python -m tests.benchmarks.run --compare baseline.json --threshold 0.2
+
+With --compare, every benchmark whose median time grew by more than the
+threshold is listed and the exit status is 1.
+"""
+from tests.benchmarks import bench_hot_paths, bench_llm_replay, bench_notifications, bench_webhook_decode
+from tests.benchmarks.harness import BenchmarkSuite, compare_reports, load_report
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import sys
+
+SUITES = {
+    "hot_paths": bench_hot_paths.run_benchmarks,
+    "llm_replay": bench_llm_replay.run_benchmarks,
+    "notifications": bench_notifications.run_benchmarks,
+    "webhook_decode": bench_webhook_decode.run_benchmarks
+}
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the hot path benchmark suite.")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression")
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append", help="Suites to run (default: all)")
+    parser.add_argument("--only", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Store sizes for the notification benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> BenchmarkSuite:
+    suite = BenchmarkSuite(
+        repeat=args.repeat,
+        min_time=args.min_time,
+        sizes=[int(size) for size in args.sizes.split(",") if size],
+        only=args.only
+    )
+    for name in args.suite or sorted(SUITES):
+        await SUITES[name](suite)
+    return suite
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    suite = asyncio.run(run(args))
+    report = suite.report()
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    if not args.compare:
+        return 0
+    
+    comparison = compare_reports(load_report(args.compare), report, args.threshold)
+    regressions = [entry for entry in comparison if entry["regression"]]
+    print(f"\nCompared {len(comparison)} benchmarks with {args.compare}: {len(regressions)} regressions")
+    for entry in regressions:
+        print(
+            f"  {entry['benchmark']}: {entry['baseline_us']:.2f} -> {entry['current_us']:.2f} us/op "
+            f"({entry['change']:+.0%})"
+        )
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
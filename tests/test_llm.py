@@ -1,9 +1,38 @@
 import pytest
-from src.llm.analyzer import analyze_transaction_risk, calculate_base_risk_score
-from src.llm.parser import parse_llm_response, extract_key_insights
+from src.llm.analyzer import (
+    analyze_transaction_risk,
+    build_risk_prompt,
+    build_batch_risk_prompt,
+    calculate_base_risk_score,
+    calculate_rule_risk,
+    tier_decisions
+)
+from src.llm.parser import (
+    IncrementalVerdictParser,
+    parse_llm_response,
+    parse_batch_llm_response,
+    extract_key_insights
+)
+from src.llm.client import start_llm_client, close_llm_client
+from src.llm.cache import SharedVerdictCache, VerdictCache, transaction_fingerprint
+from src.llm.velocity import SharedVelocityTracker, VelocityTracker
+from src.llm.prompts import get_risk_analysis_prompt
+from src.llm.rules import RuleEngine, compile_rules
+from src.llm.admission import AdmissionController, OverloadedError
+from src.llm.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, RetryBudget
+from src.llm.encoding import compact_transaction, estimate_prompt_tokens, estimate_tokens
+from src.llm.cassette import Cassette, RecordingTransport, ReplayTransport, request_fingerprint
+from src.llm import client as client_module
+from src.llm import analyzer as analyzer_module
+from src.common import metrics
+from src.common.shared_state import SharedState
 from src.common.models import Transaction, RiskAnalysis
-from datetime import datetime, timezone
+from src.webhook.results import AnalysisResultStore
+from datetime import datetime, timezone, timedelta
+import asyncio
+import httpx
 import json
+import time
 
 # Test data
 SAMPLE_TRANSACTION = Transaction(
@@ -28,6 +57,19 @@ SAMPLE_TRANSACTION = Transaction(
     }
 )
 
+@pytest.fixture(autouse=True)
+def clear_analysis_state():
+    """Fixture to keep cached verdicts, velocity history and breaker state from leaking between tests."""
+    analyzer_module.verdict_cache.clear()
+    analyzer_module.velocity_tracker.clear()
+    client_module.llm_resilience.reset()
+    client_module.llm_admission.reset()
+    yield
+    analyzer_module.verdict_cache.clear()
+    analyzer_module.velocity_tracker.clear()
+    client_module.llm_resilience.reset()
+    client_module.llm_admission.reset()
+
 SAMPLE_LLM_RESPONSE = """
 {
     "risk_score": 0.7,
@@ -134,4 +176,845 @@ def test_extract_key_insights():
     assert insights["risk_level"] == "high"
     assert len(insights["primary_factors"]) <= 3
     assert len(insights["summary"]) <= 200
-    assert insights["recommended_action"] == "block"
\ No newline at end of file
+    assert insights["recommended_action"] == "block"
+
+CROSS_BORDER_TRANSACTION = Transaction(
+    **{
+        **SAMPLE_TRANSACTION.model_dump(),
+        "transaction_id": "tx_testcrossborder",
+        "amount": 999.99,
+        "payment_method": {
+            "type": "credit_card",
+            "last_four": "4242",
+            "country_of_issue": "CA"
+        }
+    }
+)
+
+def llm_completion(content: str) -> dict:
+    """Build a Groq chat completion response body."""
+    return {"choices": [{"message": {"content": content}}]}
+
+@pytest.mark.asyncio
+async def test_concurrent_llm_calls_overlap():
+    """Test that concurrent analyses share the client and overlap their LLM waits."""
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(analyze_transaction_risk(CROSS_BORDER_TRANSACTION) for _ in range(5))
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        await close_llm_client()
+    
+    assert all(result.risk_score == 0.7 for result in results)
+    assert elapsed < 0.6
+
+@pytest.mark.asyncio
+async def test_llm_timeout_falls_back_to_base_score(monkeypatch):
+    """Test that a slow LLM call is cut off by the total timeout."""
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    monkeypatch.setattr(client_module.settings, "LLM_TOTAL_TIMEOUT", 0.05)
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert risk_analysis.risk_score == calculate_base_risk_score(CROSS_BORDER_TRANSACTION)
+    assert "LLM analysis unavailable - using base risk score" in risk_analysis.risk_factors
+
+def test_parse_batch_llm_response():
+    """Test splitting a multi-transaction response into per-transaction analyses."""
+    response = json.dumps([
+        {**json.loads(SAMPLE_LLM_RESPONSE), "transaction_id": "tx_a"},
+        {"transaction_id": "tx_b", "risk_score": 2.0, "risk_factors": [], "reasoning": "", "recommended_action": "allow"},
+        {**json.loads(SAMPLE_LLM_RESPONSE), "transaction_id": "tx_unknown"}
+    ])
+    
+    results = parse_batch_llm_response(response, ["tx_a", "tx_b", "tx_c"])
+    
+    assert set(results) == {"tx_a", "tx_b", "tx_c"}
+    assert results["tx_a"].risk_score == 0.7
+    assert results["tx_b"] is None  # malformed
+    assert results["tx_c"] is None  # missing
+
+def test_parse_batch_llm_response_invalid():
+    """Test handling of a batch response that is not an array."""
+    with pytest.raises(ValueError):
+        parse_batch_llm_response('{"risk_score": 0.5}', ["tx_a"])
+    with pytest.raises(ValueError):
+        parse_batch_llm_response("invalid json", ["tx_a"])
+
+@pytest.mark.asyncio
+async def test_micro_batching_packs_transactions(monkeypatch):
+    """Test that concurrent transactions share one completion with per-item fallback."""
+    requests_seen = []
+    
+    async def handler(request):
+        payload = json.loads(request.content)
+        requests_seen.append(payload)
+        verdicts = [
+            {**json.loads(SAMPLE_LLM_RESPONSE), "transaction_id": tx_id}
+            for tx_id in ("tx_batch0", "tx_batch1")
+        ]
+        return httpx.Response(200, json=llm_completion(json.dumps(verdicts)))
+    
+    monkeypatch.setattr(analyzer_module.settings, "LLM_BATCHING_ENABLED", True)
+    transactions = [
+        CROSS_BORDER_TRANSACTION.model_copy(update={"transaction_id": f"tx_batch{i}", "amount": amount})
+        for i, amount in enumerate([600.0, 1500.0, 3000.0])
+    ]
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        results = await asyncio.gather(*(analyze_transaction_risk(t) for t in transactions))
+    finally:
+        await close_llm_client()
+    
+    assert len(requests_seen) == 1
+    assert "tx_batch2" in requests_seen[0]["messages"][1]["content"]
+    assert [r.risk_score for r in results[:2]] == [0.7, 0.7]
+    assert results[2].risk_score == calculate_base_risk_score(transactions[2])
+    assert "LLM analysis unavailable - using base risk score" in results[2].risk_factors
+
+
+def test_transaction_fingerprint_excludes_ids():
+    """Test that structurally identical transactions share a cache key."""
+    other = CROSS_BORDER_TRANSACTION.model_copy(update={"transaction_id": "tx_other", "amount": 950.0})
+    assert transaction_fingerprint(other) == transaction_fingerprint(CROSS_BORDER_TRANSACTION)
+    
+    different_bucket = CROSS_BORDER_TRANSACTION.model_copy(update={"amount": 5000.01})
+    assert transaction_fingerprint(different_bucket) != transaction_fingerprint(CROSS_BORDER_TRANSACTION)
+
+@pytest.mark.asyncio
+async def test_verdict_cache_ttl_and_eviction():
+    """Test TTL expiry and LRU eviction counters."""
+    now = [0.0]
+    cache = VerdictCache(ttl_seconds=10, max_size=2, clock=lambda: now[0])
+    analysis = parse_llm_response(SAMPLE_LLM_RESPONSE)
+    
+    async def compute():
+        return analysis
+    
+    await cache.get_or_compute("a", compute)
+    await cache.get_or_compute("a", compute)
+    await cache.get_or_compute("b", compute)
+    await cache.get_or_compute("c", compute)  # evicts "a"
+    assert cache.get("a") is None
+    
+    now[0] = 11.0
+    assert cache.get("b") is None
+    
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["expirations"] == 1
+
+@pytest.mark.asyncio
+async def test_verdict_cache_coalesces_concurrent_misses():
+    """Test that concurrent misses on one key share a single computation."""
+    cache = VerdictCache(ttl_seconds=10, max_size=10)
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return parse_llm_response(SAMPLE_LLM_RESPONSE)
+    
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+    
+    assert len(calls) == 1
+    assert all(r.risk_score == 0.7 for r in results)
+    assert cache.stats()["coalesced"] == 4
+
+@pytest.mark.asyncio
+async def test_verdict_cache_does_not_cache_failures():
+    """Test that failed computations propagate to all waiters and are not cached."""
+    cache = VerdictCache(ttl_seconds=10, max_size=10)
+    
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("LLM down")
+    
+    results = await asyncio.gather(
+        *(cache.get_or_compute("k", compute) for _ in range(3)),
+        return_exceptions=True
+    )
+    
+    assert all(isinstance(r, ValueError) for r in results)
+    assert cache.get("k") is None
+
+
+def test_calculate_rule_risk_uses_tables():
+    """Test that the rule score adds payment method and merchant category risk."""
+    rule_score, risk_factors = calculate_rule_risk(CROSS_BORDER_TRANSACTION)
+    assert rule_score > calculate_base_risk_score(CROSS_BORDER_TRANSACTION)
+    assert any("Cross-border" in factor for factor in risk_factors)
+    
+    gambling = CROSS_BORDER_TRANSACTION.model_copy(
+        update={"merchant": CROSS_BORDER_TRANSACTION.merchant.model_copy(update={"category": "gambling"})}
+    )
+    gambling_score, gambling_factors = calculate_rule_risk(gambling)
+    assert gambling_score > rule_score
+    assert any("gambling" in factor for factor in gambling_factors)
+
+@pytest.mark.asyncio
+async def test_tiered_scoring_only_sends_ambiguous_band_to_llm():
+    """Test that confidently low and high transactions skip the LLM."""
+    calls = []
+    
+    async def handler(request):
+        calls.append(1)
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    low = CROSS_BORDER_TRANSACTION.model_copy(update={
+        "amount": 20.0,
+        "payment_method": CROSS_BORDER_TRANSACTION.payment_method.model_copy(update={"country_of_issue": "US"})
+    })
+    high = CROSS_BORDER_TRANSACTION.model_copy(update={
+        "customer": CROSS_BORDER_TRANSACTION.customer.model_copy(update={"country": "RU"})
+    })
+    before = dict(tier_decisions)
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        low_analysis = await analyze_transaction_risk(low)
+        high_analysis = await analyze_transaction_risk(high)
+        mid_analysis = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert len(calls) == 1
+    assert low_analysis.recommended_action == "allow"
+    assert low_analysis.risk_score < 0.2
+    assert high_analysis.recommended_action == "block"
+    assert high_analysis.risk_score >= 0.8
+    assert mid_analysis.risk_score == 0.7
+    assert tier_decisions["rule_low"] == before["rule_low"] + 1
+    assert tier_decisions["rule_high"] == before["rule_high"] + 1
+    assert tier_decisions["llm"] == before["llm"] + 1
+
+
+def test_velocity_tracker_sliding_window():
+    """Test per-customer, card and IP counts over the sliding window."""
+    now = [datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc).timestamp()]
+    tracker = VelocityTracker(window_minutes=60, clock=lambda: now[0])
+    
+    for minute in range(3):
+        snapshot = tracker.record(CROSS_BORDER_TRANSACTION.model_copy(update={"amount": 100.0}))
+        now[0] += 60
+    assert snapshot.customer_count == 3
+    assert snapshot.card_amount == 300.0
+    
+    # A different IP shares the customer and card windows only
+    now[0] += 27 * 60
+    other_ip = CROSS_BORDER_TRANSACTION.model_copy(update={
+        "customer": CROSS_BORDER_TRANSACTION.customer.model_copy(update={"ip_address": "10.0.0.1"})
+    })
+    snapshot = tracker.record(other_ip)
+    assert (snapshot.customer_count, snapshot.card_count, snapshot.ip_count) == (4, 4, 1)
+    
+    # Transactions older than the window drop out
+    now[0] += 32 * 60
+    snapshot = tracker.query(CROSS_BORDER_TRANSACTION)
+    assert snapshot.customer_count == 1
+    assert snapshot.ip_count == 0
+
+def test_velocity_tracker_ignores_client_timestamps():
+    """Test that backdated or future timestamps neither escape nor reset the window."""
+    tracker = VelocityTracker(window_minutes=60, clock=lambda: 1_700_000_000.0)
+    backdated = CROSS_BORDER_TRANSACTION.model_copy(update={"timestamp": datetime(2000, 1, 1, tzinfo=timezone.utc)})
+    future = CROSS_BORDER_TRANSACTION.model_copy(update={"timestamp": datetime(2099, 1, 1, tzinfo=timezone.utc)})
+    
+    tracker.record(backdated)
+    tracker.record(backdated)
+    tracker.record(future)
+    assert tracker.record(CROSS_BORDER_TRANSACTION).customer_count == 4
+
+def test_velocity_tracker_evicts_idle_keys():
+    """Test that keys are evicted under the memory cap."""
+    tracker = VelocityTracker(window_minutes=60, max_keys=4)
+    for i in range(4):
+        tracker.record(CROSS_BORDER_TRANSACTION.model_copy(update={
+            "customer": CROSS_BORDER_TRANSACTION.customer.model_copy(update={"id": f"cust_{i}"})
+        }))
+    
+    stats = tracker.stats()
+    assert stats["tracked_keys"] <= 4
+    assert stats["evictions"] > 0
+
+def test_velocity_feeds_base_score_and_prompt():
+    """Test that high velocity raises the base score and appears in the prompt."""
+    tracker = VelocityTracker(window_minutes=60)
+    for _ in range(11):
+        velocity = tracker.record(CROSS_BORDER_TRANSACTION)
+    
+    assert calculate_base_risk_score(CROSS_BORDER_TRANSACTION, velocity) > calculate_base_risk_score(CROSS_BORDER_TRANSACTION)
+    
+    prompt = get_risk_analysis_prompt(CROSS_BORDER_TRANSACTION.model_dump_json(), velocity.model_dump_json())
+    assert '"customer_count":11' in prompt["user"]
+
+async def no_sleep(delay: float) -> None:
+    """Stand-in for asyncio.sleep so retry backoff does not slow the tests."""
+
+def make_resilient_caller(**overrides) -> ResilientCaller:
+    """Build a ResilientCaller with test-friendly defaults."""
+    options = {
+        "breaker": CircuitBreaker(failure_threshold=3, reset_seconds=30),
+        "budget": RetryBudget(ratio=0.2, min_retries=10),
+        "max_attempts": 3,
+        "base_delay_ms": 100,
+        "max_delay_ms": 1000,
+        "sleep": no_sleep
+    }
+    options.update(overrides)
+    return ResilientCaller(**options)
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    """Build the error raise_for_status produces for a status code."""
+    request = httpx.Request("POST", "http://llm/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+@pytest.mark.asyncio
+async def test_resilient_caller_retries_transient_errors():
+    """Test that 429/5xx errors are retried and other errors are not."""
+    caller = make_resilient_caller()
+    outcomes = [status_error(503), status_error(429), "ok"]
+    
+    async def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    assert await caller.call(flaky) == "ok"
+    assert caller.retries == 2
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    
+    calls = []
+    
+    async def bad_request():
+        calls.append(1)
+        raise status_error(400)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await caller.call(bad_request)
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_retry_budget_limits_retries():
+    """Test that retries stop once the retry budget is spent."""
+    caller = make_resilient_caller(
+        breaker=CircuitBreaker(failure_threshold=100, reset_seconds=30),
+        budget=RetryBudget(ratio=0.0, min_retries=2)
+    )
+    calls = []
+    
+    async def failing():
+        calls.append(1)
+        raise status_error(502)
+    
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await caller.call(failing)
+    
+    # 3 first attempts plus the 2 retries the budget allowed
+    assert len(calls) == 5
+    assert caller.stats()["retry_budget_exhausted"] > 0
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_trips_and_recovers():
+    """Test that the breaker opens on consecutive failures and closes after a good probe."""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=lambda: now[0])
+    caller = make_resilient_caller(breaker=breaker, max_attempts=1)
+    calls = []
+    
+    async def failing():
+        calls.append(1)
+        raise httpx.ConnectError("down")
+    
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            await caller.call(failing)
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    with pytest.raises(CircuitOpenError):
+        await caller.call(failing)
+    assert len(calls) == 3
+    
+    async def healthy():
+        return "ok"
+    
+    now[0] = 31.0
+    assert await caller.call(healthy) == "ok"
+    stats = caller.stats()
+    assert stats["state"] == CircuitBreaker.CLOSED
+    assert stats["trips"] == 1 and stats["rejected"] == 1
+
+def test_circuit_breaker_counts_slow_calls():
+    """Test that calls over the latency threshold trip the breaker."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, slow_call_ms=100)
+    breaker.record_success(150)
+    breaker.record_success(250)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.slow_calls == 2
+
+@pytest.mark.asyncio
+async def test_open_breaker_falls_back_without_calling_llm():
+    """Test that analysis falls back to the base score immediately while the breaker is open."""
+    requests = []
+    
+    async def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    breaker = client_module.llm_resilience.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert requests == []
+    assert "LLM analysis unavailable - using base risk score" in risk_analysis.risk_factors
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_primary():
+    """Test that a hedge is sent once the primary exceeds the latency percentile."""
+    caller = make_resilient_caller(hedging_enabled=True, hedge_min_samples=5, hedge_min_delay_ms=10)
+    for _ in range(5):
+        caller.latencies.add(20)
+    delays = [1.0, 0.0]
+    
+    async def request():
+        await asyncio.sleep(delays.pop(0))
+        return "ok"
+    
+    start = time.perf_counter()
+    assert await caller.call(request) == "ok"
+    assert time.perf_counter() - start < 0.5
+    assert caller.hedges == 1 and caller.hedge_wins == 1
+
+def test_compiled_rules_match_builtin_scoring():
+    """Test that the default rules reproduce the built-in base score."""
+    rules = compile_rules({})
+    assert rules.base_score(SAMPLE_TRANSACTION) == calculate_base_risk_score(SAMPLE_TRANSACTION)
+    # Cross-border (0.3) plus the 500-1000 amount tier (0.2)
+    assert rules.base_score(CROSS_BORDER_TRANSACTION) == pytest.approx(0.5)
+    assert rules.amount_weight(1000.0) == 0.2
+    assert rules.amount_weight(1000.01) == 0.3
+    assert rules.amount_weight(500.0) == 0.0
+
+def test_compiled_rules_time_of_day_wraps_midnight():
+    """Test that an unusual-hours window past midnight is scored and reported."""
+    rules = compile_rules({"time_of_day": {"unusual_hours": [22, 5], "weight": 0.25}})
+    assert [hour for hour in range(24) if rules.hour_weights[hour]] == [0, 1, 2, 3, 4, 22, 23]
+    
+    night = SAMPLE_TRANSACTION.model_copy(update={"timestamp": datetime(2025, 5, 7, 23, 30, tzinfo=timezone.utc)})
+    day = SAMPLE_TRANSACTION.model_copy(update={"timestamp": datetime(2025, 5, 7, 12, 0, tzinfo=timezone.utc)})
+    assert rules.base_score(night) == pytest.approx(rules.base_score(day) + 0.25)
+    assert any("Unusual transaction time" in factor for factor in rules.rule_risk(night)[1])
+
+def test_compiled_rules_use_utc_hour():
+    """Test that unusual hours are matched on the UTC hour, whatever the offset."""
+    rules = compile_rules({"time_of_day": {"unusual_hours": [0, 5], "weight": 0.25}})
+    # 22:30 at UTC-3 is 01:30 UTC
+    offset = SAMPLE_TRANSACTION.model_copy(update={
+        "timestamp": datetime(2025, 5, 7, 22, 30, tzinfo=timezone(timedelta(hours=-3)))
+    })
+    naive = SAMPLE_TRANSACTION.model_copy(update={"timestamp": datetime(2025, 5, 7, 22, 30)})
+    assert rules.base_score(offset) == pytest.approx(rules.base_score(naive) + 0.25)
+    assert "Unusual transaction time (01:00 UTC)" in rules.rule_risk(offset)[1]
+
+def test_rule_engine_overrides_apply_over_rule_file(tmp_path):
+    """Test that overrides (the deprecated HIGH_RISK_COUNTRIES) win over the rule file."""
+    path = tmp_path / "risk_rules.json"
+    path.write_text(json.dumps({"high_risk_countries": {"countries": ["FR"], "card_weight": 0.2}}))
+    engine = RuleEngine(str(path), overrides={"high_risk_countries": {"countries": ["BR"]}})
+    assert engine.rules.countries == frozenset({"BR"})
+    assert engine.rules.card_country_weight == 0.2
+
+def test_rule_engine_hot_reloads_rule_file(tmp_path):
+    """Test that rule file changes are swapped in and broken files are ignored."""
+    path = tmp_path / "risk_rules.json"
+    path.write_text(json.dumps({"high_risk_countries": {"countries": ["US"]}}))
+    now = [0.0]
+    engine = RuleEngine(str(path), check_interval=5, clock=lambda: now[0])
+    assert "US" in engine.rules.countries and "RU" not in engine.rules.countries
+    assert engine.rules.customer_country_weight == 0.4
+    
+    path.write_text(json.dumps({"high_risk_countries": {"countries": ["FR"]}, "cross_border": {"weight": 0.1}}))
+    assert "US" in engine.rules.countries  # Not re-checked before the interval
+    now[0] = 6.0
+    assert engine.rules.countries == frozenset({"FR"})
+    assert engine.rules.cross_border_weight == 0.1
+    assert engine.version == 2
+    
+    path.write_text("{not json")
+    now[0] = 12.0
+    assert engine.rules.countries == frozenset({"FR"})
+    assert engine.stats()["reload_errors"] == 1
+    
+    path.write_text(json.dumps({"amount": {"tiers": [{"above": "lots"}]}}))
+    now[0] = 18.0
+    assert engine.rules.countries == frozenset({"FR"})
+    assert engine.stats()["reload_errors"] == 2
+
+@pytest.mark.asyncio
+async def test_record_then_replay_llm_calls(tmp_path):
+    """Test that recorded LLM responses are replayed offline for the same requests."""
+    path = str(tmp_path / "cassette.json")
+    upstream_calls = []
+    
+    async def handler(request):
+        upstream_calls.append(request)
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    await start_llm_client(transport=RecordingTransport(Cassette.load(path), httpx.MockTransport(handler)))
+    try:
+        recorded = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert len(upstream_calls) == 1
+    assert len(Cassette.load(path)) == 1
+    
+    analyzer_module.verdict_cache.clear()
+    analyzer_module.velocity_tracker.clear()
+    replay = ReplayTransport(Cassette.load(path))
+    await start_llm_client(transport=replay)
+    try:
+        replayed = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert replayed == recorded
+    assert replay.stats()["replayed"] == 1
+    assert replay.stats()["misses"] == 0
+    assert len(upstream_calls) == 1
+
+@pytest.mark.asyncio
+async def test_replay_injects_latency_and_faults():
+    """Test replay latency, injected 429s and errors, and unrecorded requests."""
+    body = json.dumps({"model": "m", "messages": []}).encode()
+    cassette = Cassette("unused.json")
+    request = httpx.Request("POST", "http://llm/chat/completions", content=body)
+    cassette.record(request, httpx.Response(200), json.dumps(llm_completion(SAMPLE_LLM_RESPONSE)).encode())
+    
+    async def post(transport, content=body):
+        async with httpx.AsyncClient(transport=transport, base_url="http://llm") as client:
+            return await client.post("/chat/completions", content=content)
+    
+    start = time.perf_counter()
+    response = await post(ReplayTransport(cassette, latency_ms=50))
+    assert time.perf_counter() - start >= 0.05
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == SAMPLE_LLM_RESPONSE
+    
+    response = await post(ReplayTransport(cassette, rate_limit_rate=1.0, retry_after_seconds=2))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert (await post(ReplayTransport(cassette, error_rate=1.0))).status_code == 503
+    assert (await post(ReplayTransport(cassette), content=b'{"model": "other"}')).status_code == 404
+    
+    # Seeded fault injection is reproducible
+    transport_a = ReplayTransport(cassette, error_rate=0.5, seed=7)
+    transport_b = ReplayTransport(cassette, error_rate=0.5, seed=7)
+    statuses_a = [(await post(transport_a)).status_code for _ in range(10)]
+    statuses_b = [(await post(transport_b)).status_code for _ in range(10)]
+    assert statuses_a == statuses_b
+    assert set(statuses_a) == {200, 503}
+
+def test_request_fingerprint_ignores_key_order():
+    """Test that request fingerprints use the canonical JSON body."""
+    assert request_fingerprint("post", "/chat/completions", b'{"a": 1, "b": [1, 2]}') == \
+        request_fingerprint("POST", "/chat/completions", b'{"b":[1,2],"a":1}')
+    assert request_fingerprint("POST", "/chat/completions", b'{"a": 1}') != \
+        request_fingerprint("POST", "/chat/completions", b'{"a": 2}')
+
+def test_transport_mode_selects_replay(monkeypatch, tmp_path):
+    """Test that LLM_TRANSPORT_MODE picks the record or replay transport."""
+    monkeypatch.setattr(client_module.settings, "LLM_CASSETTE_PATH", str(tmp_path / "cassette.json"))
+    monkeypatch.setattr(client_module.settings, "LLM_TRANSPORT_MODE", "replay")
+    monkeypatch.setattr(client_module.settings, "LLM_REPLAY_LATENCY_MS", 25.0)
+    try:
+        transport = client_module.create_llm_transport(httpx.Limits())
+        assert isinstance(transport, ReplayTransport)
+        assert transport.latency == 0.025
+        assert client_module.transport_stats()["mode"] == "replay"
+        
+        monkeypatch.setattr(client_module.settings, "LLM_TRANSPORT_MODE", "record")
+        assert isinstance(client_module.create_llm_transport(httpx.Limits()), RecordingTransport)
+        
+        monkeypatch.setattr(client_module.settings, "LLM_TRANSPORT_MODE", "bogus")
+        with pytest.raises(ValueError):
+            client_module.create_llm_transport(httpx.Limits())
+    finally:
+        monkeypatch.setattr(client_module.settings, "LLM_TRANSPORT_MODE", "live")
+        client_module.create_llm_transport(httpx.Limits())
+
+@pytest.mark.asyncio
+async def test_llm_metrics_track_status_parse_failures_and_fallbacks():
+    """Test that LLM status codes, parse failures and fallbacks are counted."""
+    async def handler(request):
+        return httpx.Response(200, json=llm_completion("not json"))
+    
+    statuses_before = metrics.llm_responses.labels("200").value
+    parse_failures_before = metrics.llm_parse_failures.labels().value
+    fallbacks_before = metrics.analysis_fallbacks.labels().value
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert "LLM analysis unavailable - using base risk score" in risk_analysis.risk_factors
+    assert metrics.llm_responses.labels("200").value == statuses_before + 1
+    assert metrics.llm_parse_failures.labels().value == parse_failures_before + 1
+    assert metrics.analysis_fallbacks.labels().value == fallbacks_before + 1
+    assert metrics.risk_scores.labels("fallback").count >= 1
+
+def test_compact_transaction_keeps_risk_features_only():
+    """Test that the compact encoding drops identifiers and adds derived features."""
+    encoded = compact_transaction(CROSS_BORDER_TRANSACTION)
+    
+    assert encoded["xb"] == 1
+    assert encoded["ab"] == "500-1000"
+    assert encoded["h"] == CROSS_BORDER_TRANSACTION.timestamp.astimezone(timezone.utc).hour
+    assert "id" not in encoded
+    assert CROSS_BORDER_TRANSACTION.customer.ip_address not in json.dumps(encoded)
+    assert compact_transaction(CROSS_BORDER_TRANSACTION, include_id=True)["id"] == "tx_testcrossborder"
+    
+    # 08:00 at UTC+9 is 23:00 UTC the previous day
+    tokyo = CROSS_BORDER_TRANSACTION.model_copy(update={
+        "timestamp": datetime(2025, 5, 8, 8, 0, tzinfo=timezone(timedelta(hours=9)))
+    })
+    assert compact_transaction(tokyo)["h"] == 23
+
+def test_compact_prompt_uses_fewer_tokens():
+    """Test that compact prompts are estimated well below the full ones."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens('{"amount":999.99}') == 10
+    
+    full = estimate_prompt_tokens(build_risk_prompt(CROSS_BORDER_TRANSACTION, encoding="full"))
+    compact = estimate_prompt_tokens(build_risk_prompt(CROSS_BORDER_TRANSACTION, encoding="compact"))
+    assert compact < full * 0.8
+    
+    items = [(CROSS_BORDER_TRANSACTION, None)] * 5
+    assert estimate_prompt_tokens(build_batch_risk_prompt(items, "compact")) < estimate_prompt_tokens(build_batch_risk_prompt(items, "full"))
+    with pytest.raises(ValueError):
+        build_risk_prompt(CROSS_BORDER_TRANSACTION, encoding="yaml")
+
+@pytest.mark.asyncio
+async def test_compact_encoding_is_sent_to_llm(monkeypatch):
+    """Test that the compact encoding setting changes the prompt sent to the LLM."""
+    prompts = []
+    
+    async def handler(request):
+        prompts.append(json.loads(request.content)["messages"][1]["content"])
+        return httpx.Response(200, json=llm_completion(
+            '{"risk_score": 0.6, "risk_factors": ["Cross-border"], "reasoning": "Mismatch", "recommended_action": "review"}'
+        ))
+    
+    monkeypatch.setattr(analyzer_module.settings, "LLM_PROMPT_ENCODING", "compact")
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyzer_module.request_llm_analysis(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert risk_analysis.recommended_action == "review"
+    assert '"xb":1' in prompts[0]
+    assert "tx_testcrossborder" not in prompts[0]
+
+STREAMED_VERDICT = json.dumps({
+    "risk_score": 0.75,
+    "recommended_action": "block",
+    "risk_factors": ["Cross-border payment"],
+    "reasoning": "Card issued in a different country than the customer, for a large amount."
+})
+
+def sse_body(content: str, chunk_size: int = 5, tail: str = "data: [DONE]\n\n") -> bytes:
+    """Build a streamed chat completion that delivers content in small deltas."""
+    events = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": content[i:i + chunk_size]}}]}) + "\n\n"
+        for i in range(0, len(content), chunk_size)
+    ]
+    return ("".join(events) + tail).encode()
+
+def test_incremental_parser_decides_before_reasoning():
+    """Test that the decision is available before the reasoning has streamed."""
+    parser = IncrementalVerdictParser()
+    decided_at = None
+    for position, char in enumerate(STREAMED_VERDICT):
+        parser.feed(char)
+        if decided_at is None and parser.decision() is not None:
+            decided_at = position
+    
+    assert decided_at is not None and decided_at < STREAMED_VERDICT.index("reasoning")
+    assert parser.decision().risk_score == 0.75
+    assert parse_llm_response(parser.text).reasoning.startswith("Card issued")
+    
+    # A number split across chunks is not decoded until it is complete
+    parser = IncrementalVerdictParser()
+    parser.feed('{"risk_score": 0.')
+    parser.feed('4, "recommended_action": "review"')
+    assert parser.decision() is None
+    parser.feed(", ")
+    assert parser.decision().risk_score == 0.4
+
+@pytest.mark.asyncio
+async def test_streamed_analysis_reports_decision_early():
+    """Test that a streamed completion reports its decision before the full verdict."""
+    requests = []
+    
+    async def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=sse_body(STREAMED_VERDICT))
+    
+    decisions = []
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyzer_module.request_llm_analysis_streamed(
+            CROSS_BORDER_TRANSACTION,
+            on_decision=decisions.append
+        )
+    finally:
+        await close_llm_client()
+    
+    assert requests[0]["stream"] is True
+    assert [(d.risk_score, d.recommended_action, d.reasoning) for d in decisions] == [(0.75, "block", "")]
+    assert risk_analysis.reasoning.startswith("Card issued")
+    assert risk_analysis.risk_factors == ["Cross-border payment"]
+
+@pytest.mark.asyncio
+async def test_streamed_analysis_keeps_decision_when_stream_breaks():
+    """Test that a stream failing after the decision still returns that decision."""
+    cut = STREAMED_VERDICT.index('"reasoning"')
+    
+    async def handler(request):
+        return httpx.Response(200, content=sse_body(
+            STREAMED_VERDICT[:cut],
+            tail='data: {"error": {"message": "stream interrupted"}}\n\n'
+        ))
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyzer_module.request_llm_analysis_streamed(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert risk_analysis.risk_score == 0.75
+    assert risk_analysis.recommended_action == "block"
+    assert "reasoning unavailable" in risk_analysis.reasoning
+
+@pytest.mark.asyncio
+async def test_admission_controller_queues_then_sheds():
+    """Test that calls beyond the cap wait in line and are shed when the queue is full or the wait runs out."""
+    admission = AdmissionController(max_in_flight=1, max_queue=1, max_wait_ms=50)
+    order = []
+    
+    await admission.acquire()
+    
+    async def queued():
+        async with admission.slot():
+            order.append("queued")
+    
+    waiter = asyncio.create_task(queued())
+    await asyncio.sleep(0)
+    assert admission.queued == 1
+    
+    # The queue holds one waiter, so the next call is shed at once
+    with pytest.raises(OverloadedError, match="queue is full"):
+        await admission.acquire()
+    
+    # Releasing hands the slot to the waiter
+    admission.release()
+    await waiter
+    assert order == ["queued"]
+    assert admission.in_flight == 0
+    
+    # A waiter whose slot does not free up in time is shed
+    await admission.acquire()
+    with pytest.raises(OverloadedError, match="wait exceeded"):
+        await admission.acquire()
+    admission.release()
+    
+    stats = admission.stats()
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == 0
+    assert stats["admitted"] == 3
+    assert stats["peak_queued"] == 1
+    assert stats["shed_queue_full"] == 1
+    assert stats["shed_timeout"] == 1
+
+@pytest.mark.asyncio
+async def test_overloaded_llm_degrades_or_rejects(monkeypatch):
+    """Test that a shed LLM call answers with the base score, or raises in reject mode."""
+    calls = 0
+    
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(200, json=llm_completion(SAMPLE_LLM_RESPONSE))
+    
+    # No slots free and no room to wait
+    monkeypatch.setattr(client_module, "llm_admission", AdmissionController(1, 0, 0))
+    await client_module.llm_admission.acquire()
+    shed_before, llm_before = tier_decisions["shed"], tier_decisions["llm"]
+    
+    await start_llm_client(transport=httpx.MockTransport(handler))
+    try:
+        risk_analysis = await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+        
+        monkeypatch.setattr(analyzer_module.settings, "LLM_SHED_MODE", "reject")
+        analyzer_module.verdict_cache.clear()
+        with pytest.raises(OverloadedError):
+            await analyze_transaction_risk(CROSS_BORDER_TRANSACTION)
+    finally:
+        await close_llm_client()
+    
+    assert calls == 0
+    assert risk_analysis.degraded
+    assert risk_analysis.risk_factors == ["LLM overloaded - using base risk score"]
+    # Results polled or called back keep the flag
+    result = AnalysisResultStore(max_size=10, ttl_seconds=60).record("tx_testshed", "final", risk_analysis)
+    assert result.degraded and result.model_dump(mode="json")["degraded"] is True
+    assert risk_analysis.risk_score == calculate_base_risk_score(CROSS_BORDER_TRANSACTION)
+    assert tier_decisions["shed"] == shed_before + 1
+    assert tier_decisions["llm"] == llm_before
+    assert client_module.llm_admission.stats()["shed_queue_full"] == 2
+
+def test_shared_velocity_and_verdicts_span_workers(tmp_path):
+    """Test that workers sharing state see each other's transactions and verdicts."""
+    path = str(tmp_path / "shared_state.db")
+    trackers = [SharedVelocityTracker(SharedState(path), window_minutes=60) for _ in range(2)]
+    
+    trackers[0].record(SAMPLE_TRANSACTION)
+    velocity = trackers[1].record(SAMPLE_TRANSACTION.model_copy(update={"transaction_id": "tx_test456"}))
+    assert velocity.customer_count == 2
+    assert velocity.card_amount == round(2 * SAMPLE_TRANSACTION.amount, 2)
+    assert trackers[0].query(SAMPLE_TRANSACTION).ip_count == 2
+    assert trackers[0].stats()["tracked_keys"] == 3
+    
+    caches = [SharedVerdictCache(SharedState(path), ttl_seconds=60, max_size=100) for _ in range(2)]
+    verdict = RiskAnalysis(risk_score=0.6, risk_factors=["Cross-border payment"], reasoning="Shared", recommended_action="review")
+    caches[0].set("US|CA|credit_card", verdict)
+    assert caches[1].get("US|CA|credit_card") == verdict
+    assert caches[1].get("US|GB|credit_card") is None
+    assert caches[1].stats()["shared_hits"] == 1
+
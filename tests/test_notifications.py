@@ -1,18 +1,29 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app
-from src.common.models import AdminNotification, Transaction
-from src.notifications.admin import send_notification, load_notifications, save_notifications
+from src.common.models import AdminNotification, NotificationQuery, Transaction
+from src.notifications.admin import send_notification, send_notifications, notification_store
+from src.notifications import admin as admin_module
+from src.notifications.dispatcher import AlertChannel, AlertDispatcher, SMTPChannel, WebhookChannel, FileChannel
+from src.notifications.queue import WriteBehindQueue
+from src.notifications.repository import NotificationRepository
+from src.notifications.store import NotificationStore, status_log_path
+from src.notifications.sqlite_store import SQLiteNotificationRepository, migrate_json_to_sqlite
 from src.notifications.templates import (
     format_transaction_details,
     format_risk_analysis,
     create_email_notification,
-    create_slack_notification
+    create_slack_notification,
+    create_slack_digest
 )
 from datetime import datetime, timezone
 import os
 import json
 import base64
+import asyncio
+import email
+import httpx
+import sqlite3
 
 # Initialize test client
 client = TestClient(app)
@@ -63,18 +74,24 @@ def auth_headers():
 @pytest.fixture
 def clean_notifications():
     """Fixture to ensure clean notification state."""
-    if os.path.exists("notifications.json"):
-        os.remove("notifications.json")
+    for path in ("notifications.json", "notifications.json.status"):
+        if os.path.exists(path):
+            os.remove(path)
     yield
-    if os.path.exists("notifications.json"):
-        os.remove("notifications.json")
+    for path in ("notifications.json", "notifications.json.status"):
+        if os.path.exists(path):
+            os.remove(path)
+
+async def stored_notifications(repository=notification_store, **filters):
+    """Return the stored notifications matching the filters, oldest first."""
+    return [n for _, n in await repository.query(NotificationQuery(**filters), limit=1000)]
 
 @pytest.mark.asyncio
 async def test_send_notification(clean_notifications):
     """Test sending a notification."""
     await send_notification(SAMPLE_NOTIFICATION)
     
-    notifications = await load_notifications()
+    notifications = await stored_notifications()
     assert len(notifications) == 1
     assert notifications[0]["transaction_id"] == "tx_test123"
 
@@ -154,18 +171,579 @@ def test_notification_templates():
 async def test_notification_storage(clean_notifications):
     """Test notification storage operations."""
     # Test saving notifications
-    notifications = [SAMPLE_NOTIFICATION.model_dump()]
-    await save_notifications(notifications)
+    await notification_store.add_many([SAMPLE_NOTIFICATION.model_dump()])
     
     # Test loading notifications
-    loaded = await load_notifications()
+    loaded = await stored_notifications()
     assert len(loaded) == 1
     assert loaded[0]["transaction_id"] == SAMPLE_NOTIFICATION.transaction_id
     
     # Test updating notifications
-    loaded[0]["status"] = "reviewed"
-    await save_notifications(loaded)
+    assert await notification_store.update_status(SAMPLE_NOTIFICATION.transaction_id, "reviewed")
     
     # Verify update
-    reloaded = await load_notifications()
-    assert reloaded[0]["status"] == "reviewed"
\ No newline at end of file
+    reloaded = await stored_notifications()
+    assert reloaded[0]["status"] == "reviewed"
+@pytest.mark.asyncio
+async def test_send_notifications_single_write(clean_notifications):
+    """Test storing several notifications at once."""
+    second = SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": "tx_test456"})
+    await send_notifications([SAMPLE_NOTIFICATION, second])
+    
+    notifications = await stored_notifications()
+    assert [n["transaction_id"] for n in notifications] == ["tx_test123", "tx_test456"]
+
+def test_get_stats_endpoint(auth_headers):
+    """Test getting runtime counters through the API."""
+    response = client.get("/api/stats", headers=auth_headers)
+    assert response.status_code == 200
+    
+    stats = response.json()
+    assert {"hits", "misses", "evictions"} <= set(stats["verdict_cache"])
+
+def test_get_stats_unauthorized():
+    """Test getting runtime counters without authentication."""
+    response = client.get("/api/stats")
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_notification_store_appends_and_indexes(tmp_path):
+    """Test that the store appends to the JSON file and serves indexed reads from memory."""
+    path = tmp_path / "notifications.json"
+    store = NotificationStore(str(path))
+    
+    await store.add_many([SAMPLE_NOTIFICATION.model_dump()])
+    await store.add_many([
+        SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_store{i}"}).model_dump()
+        for i in range(3)
+    ])
+    
+    # The file stays a valid JSON array
+    on_disk = json.loads(path.read_text())
+    assert [n["transaction_id"] for n in on_disk] == ["tx_test123", "tx_store0", "tx_store1", "tx_store2"]
+    
+    assert await store.update_status("tx_store1", "reviewed")
+    assert not await store.update_status("tx_missing", "reviewed")
+    assert [n["transaction_id"] for n in await stored_notifications(store, status="reviewed")] == ["tx_store1"]
+    assert len(await stored_notifications(store, status="pending")) == 3
+    assert (await store.get("tx_store1"))["status"] == "reviewed"
+    
+    # Status changes are appended to the status log, not rewritten into the file
+    assert json.loads(path.read_text())[2]["status"] == "pending"
+    log = [json.loads(line) for line in open(status_log_path(str(path)))]
+    assert [(c["transaction_id"], c["status"]) for c in log] == [("tx_store1", "reviewed")]
+    
+    # A fresh store replays the log
+    reloaded = NotificationStore(str(path))
+    assert await reloaded.count() == 4
+    assert (await reloaded.get("tx_store1"))["status"] == "reviewed"
+    
+    # Compaction folds the log into the file
+    await store.close()
+    assert json.loads(path.read_text())[2]["status"] == "reviewed"
+    assert not os.path.exists(status_log_path(str(path)))
+
+@pytest.mark.asyncio
+async def test_notification_store_compacts_status_log(tmp_path):
+    """Test that the status log is compacted after compact_every changes."""
+    path = tmp_path / "notifications.json"
+    store = NotificationStore(str(path), compact_every=3)
+    await store.add_many([
+        SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_log{i}"}).model_dump()
+        for i in range(3)
+    ])
+    
+    await store.update_status("tx_log0", "reviewed")
+    await store.update_status("tx_log1", "dismissed")
+    assert len(open(status_log_path(str(path))).readlines()) == 2
+    await store.update_status("tx_log0", "dismissed")
+    assert not os.path.exists(status_log_path(str(path)))
+    assert [n["status"] for n in json.loads(path.read_text())] == ["dismissed", "dismissed", "pending"]
+    
+    # A line cut short by a crash is skipped on replay
+    await store.update_status("tx_log2", "reviewed")
+    with open(status_log_path(str(path)), "a") as f:
+        f.write('{"transaction_id": "tx_log2", "sta')
+    reloaded = NotificationStore(str(path))
+    assert [(await reloaded.get(f"tx_log{i}"))["status"] for i in range(3)] == ["dismissed", "dismissed", "reviewed"]
+
+@pytest.mark.asyncio
+async def test_notification_store_status_update_failure(tmp_path, monkeypatch):
+    """Test that a failed status log write leaves the notification unchanged."""
+    path = tmp_path / "notifications.json"
+    store = NotificationStore(str(path), compact_every=2)
+    await store.add_many([SAMPLE_NOTIFICATION.model_dump()])
+    
+    def failing_log(line):
+        raise OSError("disk full")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_log_status_sync", failing_log)
+        with pytest.raises(OSError):
+            await store.update_status(SAMPLE_NOTIFICATION.transaction_id, "reviewed")
+    notification = await store.get(SAMPLE_NOTIFICATION.transaction_id)
+    assert notification["status"] == "pending" and "updated_at" not in notification
+    assert await store.query(NotificationQuery(status="reviewed"), limit=10) == []
+    
+    # Updates and compaction racing each other do not lose a change
+    await asyncio.gather(
+        store.update_status(SAMPLE_NOTIFICATION.transaction_id, "reviewed"),
+        store.compact(),
+        store.update_status(SAMPLE_NOTIFICATION.transaction_id, "dismissed")
+    )
+    await store.close()
+    assert json.loads(path.read_text())[0]["status"] == "dismissed"
+
+@pytest.mark.asyncio
+async def test_notification_store_reloads_external_changes(tmp_path):
+    """Test that the store reloads when the file is replaced by someone else."""
+    path = tmp_path / "notifications.json"
+    store = NotificationStore(str(path))
+    await store.add_many([SAMPLE_NOTIFICATION.model_dump()])
+    assert await store.count() == 1
+    
+    path.write_text("[]")
+    assert await store.count() == 0
+    
+    os.remove(path)
+    await store.add_many([SAMPLE_NOTIFICATION.model_dump()])
+    assert len(json.loads(path.read_text())) == 1
+
+def test_update_notification_status_not_found(auth_headers, clean_notifications):
+    """Test updating the status of a missing notification."""
+    response = client.put(
+        "/api/notifications/tx_missing/status",
+        params={"status": "reviewed"},
+        headers=auth_headers
+    )
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_sqlite_repository(tmp_path):
+    """Test the SQLite notification repository."""
+    repository = SQLiteNotificationRepository(str(tmp_path / "notifications.db"))
+    await repository.start()
+    try:
+        await repository.add_many([
+            SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_db{i}"}).model_dump()
+            for i in range(3)
+        ])
+        assert await repository.count() == 3
+        
+        assert await repository.update_status("tx_db1", "dismissed")
+        assert not await repository.update_status("tx_missing", "dismissed")
+        
+        dismissed = await stored_notifications(repository, status="dismissed")
+        assert [n["transaction_id"] for n in dismissed] == ["tx_db1"]
+        assert "updated_at" in dismissed[0]
+        assert [n["transaction_id"] for n in await stored_notifications(repository)] == ["tx_db0", "tx_db1", "tx_db2"]
+        
+        # Stored records still validate as AdminNotification
+        notification = AdminNotification(**await repository.get("tx_db2"))
+        assert notification.transaction_details.customer.id == "cust_test"
+    finally:
+        await repository.close()
+    
+    # The journal is in WAL mode
+    conn = sqlite3.connect(str(tmp_path / "notifications.db"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+@pytest.mark.asyncio
+async def test_sqlite_repository_concurrent_writes(tmp_path):
+    """Test that concurrent writers do not lose each other's notifications."""
+    repository = SQLiteNotificationRepository(str(tmp_path / "notifications.db"))
+    try:
+        await asyncio.gather(*(
+            repository.add_many([SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_c{i}"}).model_dump()])
+            for i in range(50)
+        ))
+        assert await repository.count() == 50
+    finally:
+        await repository.close()
+
+def test_migrate_json_to_sqlite(tmp_path):
+    """Test the one-shot migration from the JSON file."""
+    json_path = tmp_path / "notifications.json"
+    db_path = tmp_path / "notifications.db"
+    json_path.write_text(json.dumps([
+        json.loads(SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_m{i}"}).model_dump_json())
+        for i in range(2)
+    ]))
+    # Pending status changes are part of the import
+    with open(status_log_path(str(json_path)), "w") as f:
+        f.write(json.dumps({"transaction_id": "tx_m1", "status": "reviewed", "updated_at": None}) + "\n")
+    
+    assert migrate_json_to_sqlite(str(json_path), str(db_path)) == 2
+    assert migrate_json_to_sqlite(str(json_path), str(db_path)) == 0  # one-shot
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT status FROM notifications WHERE transaction_id = 'tx_m1'").fetchone() == ("reviewed",)
+
+@pytest.mark.asyncio
+async def test_workers_starting_together_import_json_once(tmp_path):
+    """Test that workers opening a new database at the same time import the JSON file once."""
+    json_path = tmp_path / "notifications.json"
+    db_path = str(tmp_path / "notifications.db")
+    json_path.write_text(json.dumps([
+        json.loads(SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_w{i}"}).model_dump_json())
+        for i in range(3)
+    ]))
+    workers = [SQLiteNotificationRepository(db_path, migrate_from=str(json_path)) for _ in range(4)]
+    try:
+        await asyncio.gather(*(worker.start() for worker in workers))
+        assert [await worker.count() for worker in workers] == [3] * 4
+    finally:
+        for worker in workers:
+            await worker.close()
+
+def write_paging_notifications(count: int) -> None:
+    """Write notifications with increasing risk scores straight to the JSON file."""
+    with open("notifications.json", "w") as f:
+        json.dump([
+            json.loads(SAMPLE_NOTIFICATION.model_copy(update={
+                "transaction_id": f"tx_page{i}",
+                "risk_score": round(0.5 + i / 100, 2),
+                "status": "reviewed" if i % 2 else "pending"
+            }).model_dump_json())
+            for i in range(count)
+        ], f)
+
+def test_get_notifications_cursor_pagination(auth_headers, clean_notifications, monkeypatch):
+    """Test keyset pagination of notifications in both orders."""
+    write_paging_notifications(5)
+    
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/notifications", params=params, headers=auth_headers)
+        assert response.status_code == 200
+        seen += [n["transaction_id"] for n in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [f"tx_page{i}" for i in range(5)]
+    
+    response = client.get("/api/notifications", params={"limit": 3, "order": "desc"}, headers=auth_headers)
+    assert [n["transaction_id"] for n in response.json()] == ["tx_page4", "tx_page3", "tx_page2"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/api/notifications", params={"limit": 3, "order": "desc", "cursor": cursor}, headers=auth_headers
+    )
+    assert [n["transaction_id"] for n in response.json()] == ["tx_page1", "tx_page0"]
+    assert "X-Next-Cursor" not in response.headers
+    
+    # Without a limit the default page size applies
+    monkeypatch.setattr(admin_module, "DEFAULT_PAGE_SIZE", 3)
+    response = client.get("/api/notifications", headers=auth_headers)
+    assert len(response.json()) == 3
+    assert "X-Next-Cursor" in response.headers
+
+def test_get_notifications_filters(auth_headers, clean_notifications):
+    """Test status, risk score and customer filters."""
+    write_paging_notifications(6)
+    
+    response = client.get(
+        "/api/notifications",
+        params={"status": "reviewed", "min_risk_score": 0.52, "customer_id": "cust_test"},
+        headers=auth_headers
+    )
+    assert [n["transaction_id"] for n in response.json()] == ["tx_page3", "tx_page5"]
+    
+    response = client.get("/api/notifications", params={"customer_id": "cust_other"}, headers=auth_headers)
+    assert response.json() == []
+
+def test_get_notifications_invalid_cursor(auth_headers, clean_notifications):
+    """Test that malformed or mismatched cursors are rejected."""
+    write_paging_notifications(3)
+    
+    response = client.get("/api/notifications", params={"cursor": "not-a-cursor"}, headers=auth_headers)
+    assert response.status_code == 400
+    
+    cursor = client.get("/api/notifications", params={"limit": 1}, headers=auth_headers).headers["X-Next-Cursor"]
+    response = client.get("/api/notifications", params={"cursor": cursor, "order": "desc"}, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_export_notifications(auth_headers, clean_notifications):
+    """Test streaming notifications as NDJSON."""
+    write_paging_notifications(4)
+    
+    response = client.get("/api/notifications/export", params={"status": "pending"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [n["transaction_id"] for n in lines] == ["tx_page0", "tx_page2"]
+    
+    assert client.get("/api/notifications/export").status_code == 401
+
+@pytest.mark.asyncio
+async def test_sqlite_repository_query(tmp_path):
+    """Test keyset queries against the SQLite repository."""
+    repository = SQLiteNotificationRepository(str(tmp_path / "notifications.db"))
+    try:
+        await repository.add_many([
+            SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_q{i}", "risk_score": 0.5 + i / 10}).model_dump()
+            for i in range(4)
+        ])
+        query = NotificationQuery(min_risk_score=0.6)
+        first = await repository.query(query, limit=2)
+        assert [n["transaction_id"] for _, n in first] == ["tx_q1", "tx_q2"]
+        rest = await repository.query(query, limit=2, after=first[-1][0])
+        assert [n["transaction_id"] for _, n in rest] == ["tx_q3"]
+        newest = await repository.query(NotificationQuery(), limit=1, descending=True)
+        assert newest[0][1]["transaction_id"] == "tx_q3"
+    finally:
+        await repository.close()
+
+def test_repository_requires_every_method():
+    """Test that a backend missing part of the interface fails when created."""
+    class PartialRepository(NotificationRepository):
+        async def add_many(self, records):
+            pass
+    
+    with pytest.raises(TypeError):
+        PartialRepository()
+
+class RecordingRepository:
+    """Repository stub that records each add_many call."""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.writes = []
+    
+    async def add_many(self, records):
+        await asyncio.sleep(self.delay)
+        self.writes.append([r["transaction_id"] for r in records])
+
+@pytest.mark.asyncio
+async def test_write_behind_queue_group_commit():
+    """Test that queued notifications are committed in groups and drained on close."""
+    repository = RecordingRepository()
+    queue = WriteBehindQueue(repository, max_size=100, batch_size=10, flush_interval_ms=20)
+    await queue.start()
+    
+    for i in range(25):
+        await queue.put_many([{"transaction_id": f"tx_q{i}"}])
+    await queue.close()
+    
+    assert [tx for batch in repository.writes for tx in batch] == [f"tx_q{i}" for i in range(25)]
+    assert len(repository.writes) == 3
+    stats = queue.stats()
+    assert stats["written"] == 25 and stats["depth"] == 0 and not stats["running"]
+    
+    # Once closed, writes go straight to the repository
+    await queue.put_many([{"transaction_id": "tx_direct"}])
+    assert repository.writes[-1] == ["tx_direct"]
+
+@pytest.mark.asyncio
+async def test_write_behind_queue_retries_without_duplicates(tmp_path, monkeypatch, caplog):
+    """Test that a failed write leaves nothing behind and a batch that keeps failing is logged."""
+    store = NotificationStore(str(tmp_path / "notifications.json"))
+    append = store._append_sync
+    failures = [1]
+    
+    def flaky_append(entries):
+        if failures[0]:
+            failures[0] -= 1
+            raise OSError("disk full")
+        append(entries)
+    
+    monkeypatch.setattr(store, "_append_sync", flaky_append)
+    queue = WriteBehindQueue(store, max_size=10, batch_size=10, flush_interval_ms=0)
+    await queue.start()
+    await queue.put_many([{"transaction_id": "tx_retry"}])
+    await queue.close()
+    assert await store.count() == 1
+    assert [n["transaction_id"] for n in json.loads((tmp_path / "notifications.json").read_text())] == ["tx_retry"]
+    
+    failures[0] = queue.max_attempts
+    await queue.start()
+    await queue.put_many([{"transaction_id": "tx_lost"}])
+    await queue.close()
+    assert await store.count() == 1
+    assert queue.stats()["failed"] == 1
+    assert "tx_lost" in caplog.text
+
+@pytest.mark.asyncio
+async def test_write_behind_queue_backpressure():
+    """Test that producers wait while the queue is full."""
+    repository = RecordingRepository(delay=0.05)
+    queue = WriteBehindQueue(repository, max_size=2, batch_size=1, flush_interval_ms=0)
+    await queue.start()
+    
+    await queue.put_many([{"transaction_id": "tx_b0"}])
+    await asyncio.sleep(0)
+    await queue.put_many([{"transaction_id": "tx_b1"}, {"transaction_id": "tx_b2"}])
+    blocked = asyncio.create_task(queue.put_many([{"transaction_id": "tx_b3"}]))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    
+    await blocked
+    await queue.close()
+    assert [batch[0] for batch in repository.writes] == ["tx_b0", "tx_b1", "tx_b2", "tx_b3"]
+
+class SMTPStandIn:
+    """Minimal local SMTP server recording accepted messages; refuses the first `refuse` senders."""
+    
+    def __init__(self, refuse: int = 0):
+        self.refuse = refuse
+        self.messages = []
+    
+    async def handle(self, reader, writer):
+        writer.write(b"220 localhost ready\r\n")
+        data = None
+        while line := await reader.readline():
+            if data is not None:
+                if line == b".\r\n":
+                    self.messages.append(email.message_from_bytes(b"".join(data)))
+                    data = None
+                    writer.write(b"250 OK\r\n")
+                else:
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                continue
+            command = line.decode().strip().upper()
+            if command.startswith("MAIL") and self.refuse:
+                self.refuse -= 1
+                writer.write(b"451 Try again later\r\n")
+            elif command.startswith("DATA"):
+                data = []
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command.startswith("QUIT"):
+                writer.write(b"221 Bye\r\n")
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        await writer.drain()
+        writer.close()
+
+def alert(i: int) -> AdminNotification:
+    return SAMPLE_NOTIFICATION.model_copy(update={"transaction_id": f"tx_alert{i}"})
+
+@pytest.mark.asyncio
+async def test_alert_dispatcher_delivers_to_every_channel(tmp_path):
+    """Test that each alert reaches the SMTP, webhook and file channels, retrying failures."""
+    smtp = SMTPStandIn(refuse=1)
+    server = await asyncio.start_server(smtp.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    posted = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        posted.append(json.loads(request.content))
+        return httpx.Response(200)
+    
+    dispatcher = AlertDispatcher(
+        [
+            SMTPChannel("127.0.0.1", port, "alerts@test", ["admin@test"], timeout=5),
+            WebhookChannel("http://alerts.test/hook", timeout=5, transport=httpx.MockTransport(handler)),
+            FileChannel(str(tmp_path / "alerts.jsonl"))
+        ],
+        max_queue_size=10,
+        retry_base_delay_ms=1
+    )
+    await dispatcher.start()
+    assert dispatcher.submit([alert(1), alert(2)]) == 6
+    await dispatcher.close()
+    server.close()
+    await server.wait_closed()
+    
+    assert len(smtp.messages) == 2
+    assert all(m["Subject"].startswith("High Risk Transaction Alert") for m in smtp.messages)
+    assert smtp.messages[0]["To"] == "admin@test"
+    assert sorted(p["blocks"][1]["fields"][0]["text"] for p in posted) == [
+        "*Transaction ID:*\ntx_alert1", "*Transaction ID:*\ntx_alert2"
+    ]
+    lines = [json.loads(line) for line in (tmp_path / "alerts.jsonl").read_text().splitlines()]
+    assert [line["alerts"][0]["transaction_id"] for line in lines] == ["tx_alert1", "tx_alert2"]
+    
+    stats = dispatcher.stats()
+    assert stats["smtp_sent"] == stats["webhook_sent"] == stats["file_sent"] == 2
+    assert stats["smtp_retries"] == 1 and stats["smtp_failed"] == 0
+    assert "451" in stats["smtp_last_error"]
+
+@pytest.mark.asyncio
+async def test_alert_dispatcher_digest_folds_bursts(tmp_path):
+    """Test that digest mode sends one message per channel and interval."""
+    posted = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        posted.append(json.loads(request.content))
+        return httpx.Response(200)
+    
+    dispatcher = AlertDispatcher(
+        [
+            WebhookChannel("http://alerts.test/hook", timeout=5, format="json", transport=httpx.MockTransport(handler)),
+            FileChannel(str(tmp_path / "alerts.jsonl"))
+        ],
+        max_queue_size=100,
+        digest_seconds=0.05
+    )
+    await dispatcher.start()
+    dispatcher.submit([alert(i) for i in range(3)])
+    dispatcher.submit([alert(3), alert(4)])
+    await asyncio.sleep(0.1)
+    assert [len(p["alerts"]) for p in posted] == [5]
+    
+    # close() sends the pending digest without waiting for the interval
+    dispatcher.submit([alert(5)])
+    await asyncio.wait_for(dispatcher.close(), timeout=0.04)
+    assert [len(p["alerts"]) for p in posted] == [5, 1]
+    
+    lines = [json.loads(line) for line in (tmp_path / "alerts.jsonl").read_text().splitlines()]
+    assert lines[0]["subject"].startswith("5 High Risk Transaction Alerts")
+    assert [a["transaction_id"] for a in lines[0]["alerts"]] == [f"tx_alert{i}" for i in range(5)]
+    stats = dispatcher.stats()
+    assert stats["webhook_messages"] == 2 and stats["webhook_sent"] == 6
+    
+    digest = create_slack_digest([alert(i) for i in range(50)])
+    assert digest["blocks"][1]["text"]["text"].endswith("…and 10 more")
+
+def test_alert_channel_requires_send():
+    """Test that a channel without send() fails when created, not on its first alert."""
+    class SilentChannel(AlertChannel):
+        name = "silent"
+    
+    with pytest.raises(TypeError):
+        SilentChannel()
+
+class BlockingChannel(AlertChannel):
+    """Channel whose sends wait until released."""
+    
+    name = "blocking"
+    
+    def __init__(self, concurrency: int):
+        super().__init__(concurrency)
+        self.release = asyncio.Event()
+        self.active = 0
+        self.peak = 0
+        self.sent = []
+    
+    async def send(self, notifications):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await self.release.wait()
+        self.active -= 1
+        self.sent.extend(n.transaction_id for n in notifications)
+
+@pytest.mark.asyncio
+async def test_alert_dispatcher_never_blocks_producers():
+    """Test that a backed-up channel drops alerts instead of blocking and respects its concurrency."""
+    channel = BlockingChannel(concurrency=2)
+    dispatcher = AlertDispatcher([channel], max_queue_size=3)
+    await dispatcher.start()
+    
+    dispatcher.submit([alert(0), alert(1), alert(2)])
+    await asyncio.sleep(0.01)
+    assert channel.active == 2
+    
+    assert dispatcher.submit([alert(i) for i in range(3, 10)]) == 2
+    stats = dispatcher.stats()
+    assert stats["blocking_dropped"] == 5 and stats["blocking_depth"] == 3
+    
+    channel.release.set()
+    await dispatcher.close()
+    assert sorted(channel.sent) == [f"tx_alert{i}" for i in range(5)]
+    assert channel.peak == 2
+    
+    # Not running: nothing is queued
+    assert dispatcher.submit([alert(10)]) == 0
@@ -1,11 +1,27 @@
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from datetime import datetime, timezone
 from main import app
 from src.common.config import Settings
+from src.common.models import Transaction, RiskAnalysis
 from src.webhook.auth import get_password_hash
+from src.common.metrics import Histogram, _CounterChild, _Metric
+from src.common.ratelimit import RateLimit, RateLimitMiddleware, TokenBucketTable
+from src.common.shared_state import SharedState
+from src.llm import analyzer as analyzer_module
+from src.llm.admission import OverloadedError
+from src.webhook import routes as routes_module
+from src.webhook.fastpath import fast_decode_transaction
+from src.webhook.idempotency import IdempotencyStore, SharedIdempotencyStore
+from src.webhook.jobs import AnalysisJobQueue
+from src.webhook.results import AnalysisResultStore, SharedAnalysisResultStore
+import asyncio
 import base64
+import httpx
 import json
+import sqlite3
+import time
 
 # Initialize test client
 client = TestClient(app)
@@ -69,6 +85,13 @@ def auth_headers():
     """Fixture for authentication headers."""
     return get_auth_header(settings.ADMIN_USERNAME, settings.WEBHOOK_SECRET)
 
+@pytest.fixture(autouse=True)
+def clear_webhook_deliveries():
+    """Fixture to keep replayed webhook responses from leaking between tests."""
+    routes_module.webhook_deliveries.clear()
+    yield
+    routes_module.webhook_deliveries.clear()
+
 def test_webhook_normal_transaction(auth_headers):
     """Test normal transaction processing."""
     response = client.post(
@@ -174,4 +197,628 @@ def test_webhook_invalid_amount(auth_headers):
         json=invalid_amount_transaction,
         headers=auth_headers
     )
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+def test_webhook_batch_mixed_items(auth_headers):
+    """Test batch processing reports per-item results and errors."""
+    response = client.post(
+        "/api/webhook/batch",
+        json=[NORMAL_TRANSACTION, INCOMPLETE_TRANSACTION, HIGH_RISK_COUNTRY_TRANSACTION],
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "partial"
+    assert data["processed"] == 2
+    assert data["failed"] == 1
+    assert [r["index"] for r in data["results"]] == [0, 2]
+    assert data["errors"][0]["index"] == 1
+    assert data["errors"][0]["transaction_id"] == "tx_testincomplete"
+    assert float(data["results"][1]["risk_score"]) >= 0.7
+
+def test_webhook_batch_non_string_transaction_id(auth_headers):
+    """Test that items with a non-string transaction_id are reported, not a 500."""
+    response = client.post(
+        "/api/webhook/batch",
+        json=[{**NORMAL_TRANSACTION, "transaction_id": 123}, {**NORMAL_TRANSACTION, "transaction_id": ["a"]}, NORMAL_TRANSACTION],
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed"] == 1 and data["failed"] == 2
+    assert [(e["index"], e["transaction_id"]) for e in data["errors"]] == [(0, None), (1, None)]
+
+def test_webhook_batch_charges_rate_limit_per_transaction(auth_headers, monkeypatch):
+    """Test that batches take one webhook_batch token per transaction and none from webhook."""
+    webhook = RateLimit("webhook", ["/api/webhook"], limit=1, period=60, exclude=["/api/webhook/batch"])
+    batch = RateLimit("webhook_batch", ["/api/webhook/batch"], limit=5, period=60, ip_multiplier=2)
+    monkeypatch.setattr(routes_module, "batch_rate_limit", batch)
+    monkeypatch.setattr(routes_module.settings, "RATE_LIMIT_ENABLED", True)
+    limited_app = FastAPI()
+    limited_app.include_router(routes_module.router, prefix="/api")
+    limited_app.add_middleware(RateLimitMiddleware, limits=[webhook, batch])
+    limited_client = TestClient(limited_app)
+    
+    response = limited_client.post("/api/webhook/batch", json=[NORMAL_TRANSACTION] * 4, headers=auth_headers)
+    assert response.status_code == 200
+    response = limited_client.post("/api/webhook/batch", json=[NORMAL_TRANSACTION] * 2, headers=auth_headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "12"
+    assert batch.stats()["webhook_batch_limited"] == 1
+    
+    assert webhook.stats()["webhook_allowed"] == 0
+    assert limited_client.post("/api/webhook", json=NORMAL_TRANSACTION, headers=auth_headers).status_code == 200
+
+def test_webhook_batch_ndjson(auth_headers):
+    """Test batch processing of newline-delimited JSON."""
+    body = "\n".join(json.dumps(t) for t in [NORMAL_TRANSACTION, CROSS_BORDER_TRANSACTION])
+    response = client.post(
+        "/api/webhook/batch",
+        content=body,
+        headers={**auth_headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "success"
+    assert [r["transaction_id"] for r in data["results"]] == ["tx_testnormal", "tx_testcrossborder"]
+
+def test_webhook_batch_invalid_body(auth_headers):
+    """Test batch rejects bodies that are not a list of transactions."""
+    response = client.post(
+        "/api/webhook/batch",
+        json=NORMAL_TRANSACTION,
+        headers=auth_headers
+    )
+    assert response.status_code == 422
+
+def test_webhook_batch_invalid_auth():
+    """Test batch rejects invalid authentication."""
+    response = client.post(
+        "/api/webhook/batch",
+        json=[NORMAL_TRANSACTION],
+        headers=get_auth_header("wrong", "credentials")
+    )
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_webhook_deadline_returns_provisional_score(monkeypatch):
+    """Test that a slow LLM verdict is answered provisionally and recorded when it finishes."""
+    notifications = []
+    
+    async def slow_analysis(transaction):
+        await asyncio.sleep(0.2)
+        return RiskAnalysis(
+            risk_score=0.9,
+            risk_factors=["Late LLM verdict"],
+            reasoning="High risk",
+            recommended_action="block"
+        )
+    
+    async def record_notification(notification):
+        notifications.append(notification)
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", slow_analysis)
+    monkeypatch.setattr(routes_module, "send_notification", record_notification)
+    monkeypatch.setattr(routes_module.settings, "WEBHOOK_DEADLINE_ENABLED", True)
+    monkeypatch.setattr(routes_module.settings, "WEBHOOK_DEADLINE_MS", 20)
+    transaction = Transaction(**CROSS_BORDER_TRANSACTION)
+    
+    analysis, provisional, pending = await routes_module.analyze_for_response(transaction)
+    assert provisional and pending
+    assert analysis.risk_score < 0.9
+    assert routes_module.analysis_results.get("tx_testcrossborder").status == "provisional"
+    assert notifications == []
+    
+    await routes_module.drain_deferred_analyses(timeout=1)
+    result = routes_module.analysis_results.get("tx_testcrossborder")
+    assert result.status == "final" and result.risk_score == 0.9
+    assert [n.transaction_id for n in notifications] == ["tx_testcrossborder"]
+
+@pytest.mark.asyncio
+async def test_webhook_deadline_returns_fast_verdict(monkeypatch):
+    """Test that verdicts ready before the deadline are returned as final."""
+    async def fast_analysis(transaction):
+        return RiskAnalysis(risk_score=0.2, risk_factors=[], reasoning="Low risk", recommended_action="allow")
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", fast_analysis)
+    monkeypatch.setattr(routes_module.settings, "WEBHOOK_DEADLINE_ENABLED", True)
+    analysis, provisional, pending = await routes_module.analyze_for_response(Transaction(**NORMAL_TRANSACTION))
+    assert not provisional and not pending
+    assert analysis.risk_score == 0.2
+
+@pytest.mark.asyncio
+async def test_streamed_decision_answers_before_reasoning(monkeypatch):
+    """Test that a streamed LLM decision is returned at once and notified with the full reasoning."""
+    release = asyncio.Event()
+    notifications = []
+    
+    async def streaming_analysis(transaction, on_decision=None):
+        on_decision(RiskAnalysis(risk_score=0.9, risk_factors=[], reasoning="", recommended_action="block"))
+        await release.wait()
+        return RiskAnalysis(
+            risk_score=0.9,
+            risk_factors=["Cross-border payment"],
+            reasoning="Full streamed reasoning",
+            recommended_action="block"
+        )
+    
+    async def record_notification(notification):
+        notifications.append(notification)
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", streaming_analysis)
+    monkeypatch.setattr(routes_module, "send_notification", record_notification)
+    monkeypatch.setattr(routes_module.settings, "LLM_STREAMING_ENABLED", True)
+    
+    analysis, provisional, pending = await routes_module.analyze_for_response(Transaction(**CROSS_BORDER_TRANSACTION))
+    assert analysis.risk_score == 0.9 and analysis.recommended_action == "block"
+    assert not provisional and pending
+    assert notifications == []
+    
+    release.set()
+    await routes_module.drain_deferred_analyses(timeout=1)
+    assert [n.llm_analysis for n in notifications] == ["Full streamed reasoning"]
+    assert routes_module.analysis_results.get("tx_testcrossborder").status == "final"
+
+def test_webhook_async_mode_returns_202_and_result(auth_headers, monkeypatch):
+    """Test that async webhooks are queued and their verdict can be fetched later."""
+    async def quick_analysis(transaction):
+        return RiskAnalysis(risk_score=0.4, risk_factors=[], reasoning="Queued analysis", recommended_action="review")
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", quick_analysis)
+    with TestClient(app) as lifespan_client:
+        response = lifespan_client.post(
+            "/api/webhook",
+            params={"mode": "async"},
+            json={**NORMAL_TRANSACTION, "transaction_id": "tx_testasync"},
+            headers=auth_headers
+        )
+        assert response.status_code == 202
+        data = response.json()
+        assert data["status"] == "accepted"
+        assert data["job_id"]
+        
+        deadline = time.monotonic() + 2
+        while True:
+            result = lifespan_client.get(data["result_url"], headers=auth_headers).json()
+            if result["status"] == "final" or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+    
+    assert result["status"] == "final"
+    assert result["job_id"] == data["job_id"]
+    assert result["risk_score"] == 0.4
+
+def test_get_analysis_not_found(auth_headers):
+    """Test fetching the result of an unknown transaction."""
+    response = client.get("/api/analyses/tx_unknown", headers=auth_headers)
+    assert response.status_code == 404
+    assert client.get("/api/analyses/tx_unknown").status_code == 401
+
+def test_webhook_async_rejects_bad_callback_url(auth_headers):
+    """Test that callback URLs must be http(s)."""
+    response = client.post(
+        "/api/webhook",
+        params={"mode": "async", "callback_url": "file:///etc/passwd"},
+        json=NORMAL_TRANSACTION,
+        headers=auth_headers
+    )
+    assert response.status_code == 422
+
+def test_webhook_sync_rejects_callback_url(auth_headers):
+    """Test that a callback_url outside async mode is refused rather than ignored."""
+    response = client.post(
+        "/api/webhook",
+        params={"callback_url": "https://93.184.216.34/result"},
+        json=NORMAL_TRANSACTION,
+        headers=auth_headers
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "callback_url requires mode=async"
+
+@pytest.mark.parametrize("callback_url", [
+    "http://127.0.0.1/result",
+    "http://localhost:8000/result",
+    "http://10.0.0.5/result",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/result"
+])
+def test_webhook_async_rejects_internal_callback_url(auth_headers, callback_url):
+    """Test that without an allowlist callbacks to internal addresses are refused."""
+    response = client.post(
+        "/api/webhook",
+        params={"mode": "async", "callback_url": callback_url},
+        json=NORMAL_TRANSACTION,
+        headers=auth_headers
+    )
+    assert response.status_code == 422
+    assert "public address" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_callback_url_allowlist(monkeypatch):
+    """Test that an allowlist admits only listed hosts, internal ones included."""
+    assert await routes_module.check_callback_url("https://93.184.216.34/result") == (None, "93.184.216.34")
+    
+    monkeypatch.setattr(routes_module.settings, "ANALYSIS_CALLBACK_ALLOWED_HOSTS", ["callbacks.internal"])
+    assert await routes_module.check_callback_url("http://callbacks.internal/result") == (None, None)
+    assert await routes_module.callback_url_error("https://93.184.216.34/result") == "callback_url host is not allowed"
+    assert await routes_module.callback_url_error("ftp://callbacks.internal/result") == "callback_url must be an http(s) URL"
+
+def test_webhook_overloaded_returns_503(auth_headers, monkeypatch):
+    """Test that a shed analysis in reject mode answers 503 with Retry-After."""
+    async def shed_analysis(transaction):
+        raise OverloadedError("LLM admission queue is full")
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", shed_analysis)
+    response = client.post(
+        "/api/webhook",
+        json={**NORMAL_TRANSACTION, "transaction_id": "tx_testoverloaded"},
+        headers=auth_headers
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json()["detail"] == "Risk analysis is at capacity"
+
+def test_webhook_redelivery_replays_original_response(auth_headers, monkeypatch):
+    """Test that a retried delivery gets the original response without another analysis or notification."""
+    analyses = []
+    notifications = []
+    
+    async def counting_analysis(transaction):
+        analyses.append(transaction.transaction_id)
+        return RiskAnalysis(risk_score=0.9, risk_factors=[], reasoning="High", recommended_action="block")
+    
+    async def record_notification(notification):
+        notifications.append(notification.transaction_id)
+    
+    monkeypatch.setattr(routes_module, "analyze_transaction_risk", counting_analysis)
+    monkeypatch.setattr(routes_module, "send_notification", record_notification)
+    body = {**NORMAL_TRANSACTION, "transaction_id": "tx_testretry"}
+    
+    first = client.post("/api/webhook", json=body, headers=auth_headers)
+    retry = client.post("/api/webhook", json=body, headers=auth_headers)
+    unauthenticated = client.post("/api/webhook", json=body, headers=get_auth_header("wrong", "credentials"))
+    
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert unauthenticated.status_code == 401
+    assert analyses == ["tx_testretry"]
+    assert notifications == ["tx_testretry"]
+
+@pytest.mark.asyncio
+async def test_idempotency_store_coalesces_and_expires():
+    """Test that concurrent deliveries share one run, failures are retried and results expire."""
+    now = [0.0]
+    store = IdempotencyStore(max_size=2, ttl_seconds=60, clock=lambda: now[0])
+    runs = []
+    release = asyncio.Event()
+    
+    async def handler():
+        runs.append(len(runs))
+        await release.wait()
+        return {"run": len(runs)}
+    
+    first = asyncio.create_task(store.run("tx_a", handler))
+    duplicate = asyncio.create_task(store.run("tx_a", handler))
+    await asyncio.sleep(0)
+    release.set()
+    assert await first == ({"run": 1}, False)
+    assert await duplicate == ({"run": 1}, True)
+    assert await store.run("tx_a", handler) == ({"run": 1}, True)
+    
+    async def failing():
+        raise ValueError("analysis failed")
+    
+    with pytest.raises(ValueError):
+        await store.run("tx_b", failing)
+    assert await store.run("tx_b", handler) == ({"run": 2}, False)
+    
+    now[0] = 61
+    assert store.get("tx_a") is None
+    assert await store.run("tx_a", handler) == ({"run": 3}, False)
+    assert store.stats() == {
+        "size": 2, "max_size": 2, "processed": 3, "replayed": 1, "coalesced": 1, "evictions": 0
+    }
+
+@pytest.mark.asyncio
+async def test_analysis_job_queue_callbacks_and_backpressure():
+    """Test worker callbacks, failure recording and the queue limit."""
+    callbacks = []
+    
+    def callback_handler(request):
+        callbacks.append(json.loads(request.content))
+        # Sent to the checked address, not to whatever the host resolves to now
+        assert request.url.host == "93.184.216.34"
+        assert request.headers["Host"] == "callbacks.test:8443"
+        assert request.extensions["sni_hostname"] == "callbacks.test"
+        return httpx.Response(204)
+    
+    async def analyze(transaction):
+        if transaction.transaction_id == "tx_fail":
+            raise ValueError("analysis exploded")
+        return RiskAnalysis(risk_score=0.8, risk_factors=[], reasoning="High", recommended_action="block")
+    
+    notified = []
+    
+    async def on_result(transaction, analysis):
+        notified.append(transaction.transaction_id)
+    
+    results = AnalysisResultStore(max_size=100, ttl_seconds=60)
+    async def check_callback(callback_url):
+        return ("refused", None) if "internal" in callback_url else (None, "93.184.216.34")
+    
+    jobs = AnalysisJobQueue(
+        analyze, results, on_result, max_size=2, workers=1, callback_timeout=1,
+        callback_transport=httpx.MockTransport(callback_handler),
+        check_callback=check_callback
+    )
+    await jobs.start()
+    
+    ok = Transaction(**NORMAL_TRANSACTION)
+    fail = Transaction(**{**NORMAL_TRANSACTION, "transaction_id": "tx_fail"})
+    jobs.submit(ok, "https://callbacks.test:8443/result")
+    jobs.submit(fail, "http://callbacks.internal/result")
+    with pytest.raises(asyncio.QueueFull):
+        jobs.submit(ok)
+    await jobs.close()
+    
+    assert results.get("tx_testnormal").status == "final"
+    failed = results.get("tx_fail")
+    assert failed.status == "failed" and "exploded" in failed.error
+    assert notified == ["tx_testnormal"]
+    assert [c["transaction_id"] for c in callbacks] == ["tx_testnormal"]
+    stats = jobs.stats()
+    assert stats["completed"] == 1 and stats["failed"] == 1 and stats["rejected"] == 1
+    assert stats["callbacks_sent"] == 1 and stats["callbacks_refused"] == 1
+
+@pytest.mark.parametrize("timestamp", [
+    "2024-01-01T10:00:00Z",
+    "2024-01-01T10:00:00.123+02:00",
+    "2024-01-01T10:00:00.5-05:30"
+])
+def test_fast_decode_matches_model(timestamp):
+    """Test the fast decoder builds the same transaction as the regular path."""
+    body = json.dumps({**NORMAL_TRANSACTION, "timestamp": timestamp, "amount": 100}).encode()
+    fast = fast_decode_transaction(body)
+    assert fast is not None
+    regular = Transaction.model_validate(json.loads(body))
+    assert fast.model_dump_json() == regular.model_dump_json()
+
+@pytest.mark.parametrize("overrides", [
+    {"amount": -100},
+    {"currency": "usd"},
+    {"timestamp": "2024-01-01T10:00:00"},
+    {"timestamp": "2999-01-01T10:00:00Z"},
+    {"customer": {**NORMAL_TRANSACTION["customer"], "ip_address": "192.168.1.256"}},
+    {"customer": {**NORMAL_TRANSACTION["customer"], "ip_address": "192.168.01.1"}},
+    {"customer": {**NORMAL_TRANSACTION["customer"], "ip_address": "192.168.1.\u0661"}},
+    {"merchant": None}
+])
+def test_fast_decode_defers_uncertain_payloads(overrides):
+    """Test the fast decoder leaves anything it cannot fully validate to the regular path."""
+    assert fast_decode_transaction(json.dumps({**NORMAL_TRANSACTION, **overrides}).encode()) is None
+
+def test_fast_decode_defers_invalid_json():
+    """Test the fast decoder rejects bodies that are not a JSON object."""
+    assert fast_decode_transaction(b"invalid json") is None
+    assert fast_decode_transaction(b"[]") is None
+
+def test_webhook_fast_and_regular_paths_agree(auth_headers, monkeypatch):
+    """Test the fast path returns the same responses as the regular handler."""
+    requests = [
+        (NORMAL_TRANSACTION, auth_headers),
+        (HIGH_RISK_COUNTRY_TRANSACTION, auth_headers),
+        (NORMAL_TRANSACTION, get_auth_header("wrong", "credentials"))
+    ]
+    
+    def post_all():
+        analyzer_module.verdict_cache.clear()
+        analyzer_module.velocity_tracker.clear()
+        routes_module.webhook_deliveries.clear()
+        return [client.post("/api/webhook", json=body, headers=headers) for body, headers in requests]
+    
+    fast = post_all()
+    
+    async def no_fast_path(self, request, transaction):
+        return None
+    
+    monkeypatch.setattr(routes_module.WebhookRoute, "handle_fast", no_fast_path)
+    regular = post_all()
+    
+    for fast_response, regular_response in zip(fast, regular):
+        assert fast_response.status_code == regular_response.status_code
+        assert fast_response.json() == regular_response.json()
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the Prometheus text rendering of a labelled histogram."""
+    histogram = Histogram("test_seconds", "Test.", labelnames=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels("auth").observe(value)
+    
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP risk_test_seconds Test.", "# TYPE risk_test_seconds histogram"]
+    assert 'risk_test_seconds_bucket{stage="auth",le="0.1"} 2' in lines
+    assert 'risk_test_seconds_bucket{stage="auth",le="1"} 3' in lines
+    assert 'risk_test_seconds_bucket{stage="auth",le="+Inf"} 4' in lines
+    assert 'risk_test_seconds_sum{stage="auth"} 3.65' in lines
+    assert 'risk_test_seconds_count{stage="auth"} 4' in lines
+
+def test_metric_requires_child_methods():
+    """Test that a metric type missing its child hooks cannot be created."""
+    class Gauge(_Metric):
+        kind = "gauge"
+        
+        def _new_child(self):
+            return _CounterChild()
+    
+    with pytest.raises(TypeError):
+        Gauge("test_gauge", "Test.")
+
+def test_metrics_endpoint(auth_headers):
+    """Test /metrics exposes webhook stage timings and runtime stats to admins."""
+    client.post("/api/webhook", json=NORMAL_TRANSACTION, headers=auth_headers)
+    # An invalid address sends the body through FastAPI's regular decoding
+    invalid_ip = {**NORMAL_TRANSACTION, "customer": {**NORMAL_TRANSACTION["customer"], "ip_address": "192.168.1.256"}}
+    assert client.post("/api/webhook", json=invalid_ip, headers=auth_headers).status_code == 422
+    
+    response = client.get("/metrics", headers=get_auth_header(settings.ADMIN_USERNAME, settings.ADMIN_PASSWORD))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for stage in ("decode_fast", "decode_regular", "auth", "base_score"):
+        assert f'risk_webhook_stage_duration_seconds_count{{stage="{stage}"}}' in response.text
+    assert "# TYPE risk_stats_verdict_cache_hits gauge" in response.text
+    
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=get_auth_header("wrong", "credentials")).status_code == 401
+
+def test_token_bucket_refills_lazily_and_evicts_idle_keys():
+    """Test that buckets refill on use and refilled or excess buckets are dropped."""
+    table = TokenBucketTable(limit=2, period=60, max_keys=2)
+    assert table.acquire("a", 0.0) == 0.0
+    assert table.acquire("a", 0.0) == 0.0
+    assert table.acquire("a", 0.0) == pytest.approx(30.0)
+    assert table.acquire("a", 30.0) == 0.0
+    
+    # "a" has refilled completely by now, so its bucket is dropped
+    table.acquire("b", 100.0)
+    assert len(table) == 1
+    table.acquire("c", 100.0)
+    table.acquire("d", 100.0)
+    assert len(table) == 2
+
+def test_rate_limit_middleware_returns_429():
+    """Test that limited requests get 429 with Retry-After before reaching the route."""
+    limited_app = FastAPI()
+    
+    @limited_app.post("/api/webhook")
+    async def webhook():
+        return {"status": "success"}
+    
+    @limited_app.get("/")
+    async def root():
+        return {"status": "ok"}
+    
+    limit = RateLimit("webhook", ["/api/webhook"], limit=2, period=60, ip_multiplier=1.5)
+    limited_app.add_middleware(RateLimitMiddleware, limits=[limit])
+    limited_client = TestClient(limited_app)
+    
+    merchant = get_auth_header("merchant", "secret")
+    statuses = [limited_client.post("/api/webhook", headers=merchant).status_code for _ in range(2)]
+    response = limited_client.post("/api/webhook", headers=merchant)
+    assert statuses == [200, 200]
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+    assert response.json() == {"detail": "Rate limit exceeded"}
+    
+    # The refused request spent nothing, so the client IP has one token left
+    assert limited_client.post("/api/webhook", headers=get_auth_header("other", "secret")).status_code == 200
+    assert limited_client.post("/api/webhook", headers=get_auth_header("third", "secret")).status_code == 429
+    assert limited_client.get("/").status_code == 200
+    assert limit.stats()["webhook_limited"] == 2
+    
+    assert any(middleware.cls is RateLimitMiddleware for middleware in app.user_middleware)
+
+def test_shared_rate_limit_counts_requests_of_every_worker(tmp_path):
+    """Test that workers sharing state draw from the same token buckets."""
+    path = str(tmp_path / "shared_state.db")
+    workers = [RateLimit("webhook", ["/api/webhook"], 2, 60, shared=SharedState(path)) for _ in range(2)]
+    now = time.time()
+    
+    assert workers[0].check("203.0.113.9", b"Basic a", now) == 0.0
+    assert workers[1].check("203.0.113.9", b"Basic a", now) == 0.0
+    assert workers[0].check("203.0.113.9", b"Basic a", now) == pytest.approx(30.0, abs=0.01)
+    assert workers[1].check("203.0.113.9", b"Basic b", now + 30) == 0.0
+    assert workers[0].stats()["webhook_credential_buckets"] == 2
+    
+    # A refused credential gives its IP tokens back
+    assert workers[0].check("203.0.113.7", b"Basic a", now + 30, tokens=2) == pytest.approx(30.0, abs=0.01)
+    assert workers[1].check("203.0.113.7", b"Basic c", now + 30, tokens=2) == 0.0
+
+def test_shared_state_fails_open_while_locked(tmp_path):
+    """Test that a locked database costs a short wait, not a stalled request."""
+    path = str(tmp_path / "shared_state.db")
+    shared = SharedState(path, busy_timeout_ms=10)
+    limit = RateLimit("webhook", ["/api/webhook"], 1, 60, shared=shared)
+    shared.set("test", "key", "value", 60)
+    
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.perf_counter()
+        shared.set("test", "other", "value", 60)
+        assert shared.add("test", "key", "", 60)
+        assert shared.get("test", "key")[0] == "value"  # Reads do not wait for the writer
+        assert limit.check("203.0.113.9", b"Basic a", time.time()) == 0.0
+        assert limit.check("203.0.113.9", b"Basic a", time.time()) == 0.0
+        assert time.perf_counter() - start < 1.0
+        assert shared.stats()["busy_errors"] == 6  # Each check tries the IP and the credential bucket
+        # Stats and clear() do not raise while the database is locked
+        limit.clear()
+        assert limit.stats()["webhook_ip_buckets"] >= 0
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert shared.get("test", "other") is None
+    assert limit.check("203.0.113.9", b"Basic a", time.time()) == 0.0
+    assert limit.check("203.0.113.9", b"Basic a", time.time()) > 0
+
+@pytest.mark.asyncio
+async def test_shared_deliveries_and_results_span_workers(tmp_path):
+    """Test that a redelivery to another worker waits for and replays the first worker's response."""
+    path = str(tmp_path / "shared_state.db")
+    workers = [
+        SharedIdempotencyStore(
+            SharedState(path), max_size=100, ttl_seconds=60,
+            encode=routes_module.encode_response, decode=routes_module.decode_response, poll_interval=0.01
+        )
+        for _ in range(2)
+    ]
+    release = asyncio.Event()
+    
+    async def slow_accept():
+        await release.wait()
+        return routes_module.JSONResponse({"status": "accepted", "job_id": "job_1"}, status_code=202)
+    
+    async def unexpected():
+        raise AssertionError("the delivery ran twice")
+    
+    first = asyncio.create_task(workers[0].run("tx_shared", slow_accept))
+    await asyncio.sleep(0)
+    retry = asyncio.create_task(workers[1].run("tx_shared", unexpected))
+    await asyncio.sleep(0.05)
+    release.set()
+    
+    (original, replayed_first), (replayed, replayed_retry) = await asyncio.gather(first, retry)
+    assert not replayed_first and replayed_retry
+    assert replayed.status_code == 202
+    assert json.loads(replayed.body) == {"status": "accepted", "job_id": "job_1"}
+    assert await workers[1].run("tx_shared", unexpected) == (replayed, True)
+    
+    results = [SharedAnalysisResultStore(SharedState(path), max_size=100, ttl_seconds=60) for _ in range(2)]
+    results[0].record("tx_shared", "queued", job_id="job_1")
+    results[1].record("tx_shared", "final", RiskAnalysis(risk_score=0.2, risk_factors=[], reasoning="Low"))
+    result = results[0].get("tx_shared")
+    assert result.status == "final" and result.job_id == "job_1" and result.risk_score == 0.2
+
+@pytest.mark.asyncio
+async def test_shared_delivery_claim_is_renewed_while_handler_runs(tmp_path):
+    """Test that a handler outlasting claim_seconds keeps its claim."""
+    path = str(tmp_path / "shared_state.db")
+    workers = [
+        SharedIdempotencyStore(SharedState(path), max_size=100, ttl_seconds=60, claim_seconds=0.06, poll_interval=0.01)
+        for _ in range(2)
+    ]
+    calls = []
+    
+    async def slow_handler():
+        calls.append(1)
+        await asyncio.sleep(0.25)
+        return {"status": "success"}
+    
+    first = asyncio.create_task(workers[0].run("tx_slow", slow_handler))
+    await asyncio.sleep(0.01)
+    (_, replayed_first), (result, replayed_retry) = await asyncio.gather(first, workers[1].run("tx_slow", slow_handler))
+    assert len(calls) == 1
+    assert not replayed_first and replayed_retry and result == {"status": "success"}
+    assert SharedState(path).get(SharedIdempotencyStore.NAMESPACE, "tx_slow")[0] == '{"status": "success"}'
+